@@ -8,27 +8,38 @@ import discord
 import asyncio
 import datetime
 import pytz
+import time
 import typing
+import json
+import hashlib
 
 from discord.ext import commands, tasks
 from itertools import cycle
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 from .utils import utils
 from .utils import database as db
-from .utils.event import Event
+from .utils.dispatch import Dispatcher, SendQueue, PRIORITY_REMINDER, PRIORITY_EDIT, PRIORITY_POST, PRIORITY_STATUS
+from .utils.event import Event, eventKey
 from .utils.event_scrapper import getEvents
+from .utils.schedule import FireHeap
+from .utils.message_index import MessageIndex
+from .utils.event_store import EventStore
 
 
 #########################
 # Global variables
 #########################
-# Note: The time variables below are in UNIX CRON format:
+# Note: The time variables below are in CRON format:
 #           *    *        *         *       *
 #          min  hour  dayOfMonth  month  weekday
 #       For example: "Every 2nd hour at minute 0 on Monday to Thursday every month"
-#                    -> 0 0-23/2 * * 0-3
+#                    -> 0 0-23/2 * * 0-3  (or: 0 0-23/2 * * mon-thu)
+#       Weekdays are counted as by apscheduler: 0 = Monday ... 6 = Sunday (UNIX cron starts with 0 = Sunday).
+#       Weekday names (mon, tue, ..., sun) mean the same everywhere.
 
 # Local timezone
 LOCAL_TZ = pytz.timezone('Asia/Tokyo')
@@ -36,14 +47,22 @@ LOCAL_TZ = pytz.timezone('Asia/Tokyo')
 # Times when the web-scrapper should run
 SCRAP_TIMES = '0 15 * * *'  # Every day at 15:00
 
+# Minimum interval in seconds between two progress updates of the bot status while scrapping
+SCRAP_PROGRESS_INTERVAL = 10
+
 # Times when new events shall be posted to subscribed channels
+# (default of every channel, channels can set their own schedule with the `schedule` command)
 POST_TIMES = '0 20 * * 5-6'  # Every Saturday & Sunday at 20:00
-POST_BEFORE_WEEKS = 2  # how many weeks prior to the start of the event it is posted
+POST_BEFORE_DAYS = 14  # how many days prior to the start of the event it is posted
 
 # Time when it shall be reminded of events happening today/tomorrow/...
+# (default of every channel, channels can set their own schedule with the `schedule` command)
 REMIND_TIMES = '0 9-10 * * *'  # Every day at 10:00
 REMIND_BEFORE_DAYS = 0  # how many days before the reminder should be done
 
+# Maximum number of seconds the scheduler of posts and reminders sleeps before it checks its schedule again
+SCHEDULE_MAX_SLEEP = 3600
+
 # Define (logo, thumbnail, footer) for all sources that are scrapped
 SCRAP_SOURCES = {
     'Web:TokyoCheapo': {
@@ -61,9 +80,27 @@ SCRAP_SOURCES = {
 # Sleep status messages that will be iterated through
 SLEEP_STATUS = [f"Counting 🐑... {i} {'💤' if i%2 else ''}" for i in range(1, 10)]
 
-# How many past messages are checked per channel for event searching
+# How many past messages are indexed per channel for event and reminder searching
 SEARCH_DEPTH = 100
 
+# How many new events are posted in one message (Discord allows up to 10 embeds per message).
+# Above 1, new events are posted through a webhook the bot manages in each channel (needs the `Manage Webhooks` permission).
+# Channels where the webhook cannot be created get one message per event.
+POST_BATCH_SIZE = 1
+WEBHOOK_NAME = 'Matsubo Events'
+EMBED_TOTAL_LIMIT = 6000  # Maximum number of characters of all embeds in one message
+
+# Outbox of Discord requests: how often (in seconds) due requests are sent (e.g. retries of failed requests),
+# how many requests are taken from the outbox at once, and every how many rounds finished requests are cleaned up
+OUTBOX_POLL_INTERVAL = 60
+OUTBOX_CLAIM_SIZE = 100
+OUTBOX_PRUNE_EVERY = 1440
+
+# How many rendered event embeds are kept in memory, so an event posted to many channels is only rendered once
+RENDER_CACHE_SIZE = 1024
+# How many rendered reminders are kept in memory (one per distinct set of subscribed topics, lead time and day)
+REMINDER_CACHE_SIZE = 64
+
 # TODO Make this variable disappear, and instead make it depend on utils/event_scrapper.py
 # All possible topics to be subscribable
 TOPICS = ['Chubu', 'Chugoku', 'Hokkaido', 'Kansai', 'Kanto', 'Kyushu', 'Okinawa', 'Shikoku', 'Tohoku']
@@ -79,30 +116,71 @@ class EventListener(commands.Cog):
     """
     def __init__(self, bot:commands.Bot):
         self.bot = bot
+
+        # The web-scrapper blocks, so it runs in its own thread to keep the discord event loop responsive
+        self.scrap_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scrap')
+        self.scrap_lock = asyncio.Lock()
+        self.scrap_progress_time = 0
+
+        # Tasks started without waiting for them (e.g. status updates); referenced until they are done, so they are not garbage-collected
+        self.background_tasks = set()
+
+        # Channels whose history has already been searched for messages missing in the ledger (once per session)
+        self.backfilled_events = set()
+        # Recent messages of the bot per channel: the history is read once, then kept current by the message listeners
+        self.message_index = MessageIndex(depth=SEARCH_DEPTH)
+
+        # Upcoming events in memory, indexed by topic and date. Loaded from the database once a day, refreshed after every scrap
+        self.event_store = EventStore()
+        self.event_store_lock = asyncio.Lock()
+
+        # Rendered event embeds: (event key, content hash) -> (embed dict, fingerprint)
+        self.render_cache = utils.LRUCache(RENDER_CACHE_SIZE)
+        # Rendered reminders: (day, lead days, events) -> reminder parts shared by all channels
+        self.reminder_cache = utils.LRUCache(REMINDER_CACHE_SIZE)
+
+        # Works on many channels concurrently; their requests are sent by priority, paced by Discord's rate limits
+        self.dispatcher = Dispatcher()
+        self.send_queue = SendQueue()
+
+        # Webhooks for batched posting: channel_id -> webhook (``None`` if the bot may not manage webhooks there)
+        self.webhooks = {}
+
+        # Requests are written to the outbox first, then sent by one drain at a time
+        self.outbox_lock = asyncio.Lock()
+
         self.scheduler = AsyncIOScheduler()
         self.scheduler.start()
 
         # Start scheduled tasks
         self.scheduler.add_job(self.loop_scrap, CronTrigger.from_crontab(SCRAP_TIMES, timezone=LOCAL_TZ), id='scrap')
-        self.scheduler.add_job(self.loop_post, CronTrigger.from_crontab(POST_TIMES, timezone=LOCAL_TZ), id='post')
-        self.scheduler.add_job(self.loop_remind, CronTrigger.from_crontab(REMIND_TIMES, timezone=LOCAL_TZ), id='remind')
 
-        # Print next run times of scheduled tasks
+        # Posts and reminders follow the schedule of each channel: (channel_id, 'post'|'remind') -> next fire time
+        self.schedule = FireHeap(timezone=LOCAL_TZ)
+        self.schedule_changed = asyncio.Event()
+
+        # Print next run times of scheduled tasks (posts and reminders are printed once the schedules are loaded)
         print('Next run time of scheduled tasks:')
         print(f"  > {self.scheduler.get_job('scrap').func.__name__.upper()}:  {self.scheduler.get_job('scrap').next_run_time}")
-        print(f"  > {self.scheduler.get_job('post').func.__name__.upper()}:   {self.scheduler.get_job('post').next_run_time}")
-        print(f"  > {self.scheduler.get_job('remind').func.__name__.upper()}: {self.scheduler.get_job('remind').next_run_time}")
 
         # Start other loops
         self.countingSheeps.start()
+        self.outboxLoop.start()
+        self.scheduleLoop.start()
 
 
     @tasks.loop(seconds=10)
     async def countingSheeps(self):
         """Counts sheeps. Very handy, because it shows the bot is still running."""
-        await self.bot.change_presence(status=discord.Status.idle, activity=discord.Game(next(self.status_cycle)))
+        await asyncio.wait([self.setStatus(next(self.status_cycle), status=discord.Status.idle)])
     def cog_unload(self):
         self.countingSheeps.cancel()
+        self.outboxLoop.cancel()
+        self.scheduleLoop.cancel()
+        self.scrap_executor.shutdown(wait=False)
+        self.send_queue.close()
+        for task in self.background_tasks:
+            task.cancel()
     @countingSheeps.before_loop
     async def before_countingSheeps(self):
         await self.bot.wait_until_ready()
@@ -113,6 +191,125 @@ class EventListener(commands.Cog):
         #     await self.bot.change_presence(status=discord.Status.idle, activity=discord.Activity(name='Internet', type=discord.ActivityType.listening))
         pass
 
+    @tasks.loop(seconds=OUTBOX_POLL_INTERVAL)
+    async def outboxLoop(self):
+        """Sends requests of the outbox that are due, e.g. retries of failed requests."""
+        try:
+            await self.drainOutbox()
+            if self.outboxLoop.current_loop % OUTBOX_PRUNE_EVERY == 0:
+                await db.asyncOutboxDB.prune()
+        except Exception as e:
+            utils.print_warning(f"Sending requests of the outbox failed: {e!r}")
+    @outboxLoop.before_loop
+    async def before_outboxLoop(self):
+        await self.bot.wait_until_ready()
+        # Requests that were being sent when the bot stopped are sent again
+        async with self.outbox_lock:
+            recovered = await db.asyncOutboxDB.recover()
+        if recovered:
+            print(f"Recovered {recovered} interrupted requests from the outbox")
+
+    @tasks.loop(seconds=0)
+    async def scheduleLoop(self):
+        """Posts to and reminds the channels whose schedule is due, then sleeps until the next channel is due (or a schedule changes).
+
+        Channels that are due at the same time are worked on together. Channels due while others are worked on follow right after.
+        """
+        self.schedule_changed.clear()
+        now = datetime.datetime.now(tz=LOCAL_TZ)
+        due = {'remind': [], 'post': []}  # Reminders are time-sensitive, they go first
+        for channel_id, kind in self.schedule.popDue(now):
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                utils.print_warning(f"-> Channel {channel_id} is not visible to me (deleted?). SKIP")
+                continue
+            due[kind].append(channel)
+        try:
+            if due['remind']:
+                await self.loop_remind(due['remind'])
+            if due['post']:
+                await self.loop_post(due['post'])
+        except Exception as e:
+            utils.print_warning(f"Scheduled posts and reminders failed: {e!r}")
+        if any(due.values()):
+            return  # Check for channels that became due in the meantime right away
+        try:
+            await asyncio.wait_for(self.schedule_changed.wait(), timeout=self.schedule.getDelay(now, SCHEDULE_MAX_SLEEP))
+        except asyncio.TimeoutError:
+            pass
+    @scheduleLoop.before_loop
+    async def before_scheduleLoop(self):
+        await self.bot.wait_until_ready()
+        await self.loadSchedules()
+        print(f"Next run time of LOOP_POST():  {self.getNextRunTime('post')}")
+        print(f"Next run time of LOOP_REMIND():  {self.getNextRunTime('remind')}")
+
+    async def loadSchedules(self, channel_ids:list[int]=None):
+        """Loads the schedules of the given channels (all subscribed channels if ``None``) from the database into the scheduler.
+
+        Channels that are not subscribed (anymore) are removed from the scheduler.
+
+        Parameters
+        ------------
+        channel_ids: Optional[:class:`list`[:class:`int`]]
+            The channels whose schedule has changed, ``None`` if all schedules shall be loaded.
+        """
+        schedules = await db.asyncDiscordDB.getSchedules(channel_ids)
+        for channel_id in (channel_ids if channel_ids is not None else {channel_id for channel_id, _ in self.schedule.jobs}):
+            if channel_id not in schedules:
+                self.schedule.remove((channel_id, 'post'))
+                self.schedule.remove((channel_id, 'remind'))
+        for channel_id, settings in schedules.items():
+            for kind, default in (('post', POST_TIMES), ('remind', REMIND_TIMES)):
+                try:
+                    self.schedule.set((channel_id, kind), settings[f'{kind}_times'] or default)
+                except ValueError as e:
+                    utils.print_warning(f"-> Invalid {kind} times of channel {channel_id}, using the default: {e}")
+                    self.schedule.set((channel_id, kind), default)
+        self.schedule_changed.set()
+
+    def getNextRunTime(self, kind:str, channel_id:int=None) -> datetime.datetime:
+        """Returns when channels (or the given channel) are notified (`kind` 'post') or reminded (`kind` 'remind') next."""
+        return self.schedule.getNextTime(lambda key: key[1] == kind and channel_id in (None, key[0]))
+
+    @commands.Cog.listener()
+    async def on_message(self, message:discord.Message):
+        """Indexes new messages of the bot."""
+        if self.isOwnMessage(message):
+            self.message_index.add(message)
+    @commands.Cog.listener()
+    async def on_message_edit(self, before:discord.Message, after:discord.Message):
+        """Indexes edited messages of the bot."""
+        if self.isOwnMessage(after):
+            self.message_index.add(after)
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload:discord.RawMessageUpdateEvent):
+        """Edits of messages that discord.py does not cache (e.g. read from the history) only come as raw data: the indexed content is outdated."""
+        if payload.cached_message is None:
+            self.message_index.invalidate(payload.channel_id, payload.message_id)
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload:discord.RawMessageDeleteEvent):
+        """Removes deleted messages from the index."""
+        self.message_index.remove(payload.channel_id, payload.message_id)
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload:discord.RawBulkMessageDeleteEvent):
+        """Removes purged messages from the index."""
+        for message_id in payload.message_ids:
+            self.message_index.remove(payload.channel_id, message_id)
+
+    def isOwnMessage(self, message:discord.Message) -> bool:
+        """Returns whether the message has been sent by the bot, either itself or through its webhook in the channel (see :meth:`getWebhook`)."""
+        if message.author == self.bot.user:
+            return True
+        webhook = self.webhooks.get(message.channel.id)
+        return message.webhook_id is not None and webhook is not None and message.webhook_id == webhook.id
+
+    async def getChannelIndex(self, channel: commands.TextChannelConverter):
+        """Returns the index of the bot's messages in the channel. The channel history is read the first time only."""
+        if channel.id not in self.message_index:
+            await self.getWebhook(channel, create=False)  # Messages of the bot's webhook are recognized by its ID
+        return await self.message_index.load(channel, self.isOwnMessage)
+
     @utils.log_call
     async def loop_scrap(self):
         """[Background task] Scraps web at specified times for new events."""
@@ -125,46 +322,187 @@ class EventListener(commands.Cog):
         print(f"Next run time of LOOP_SCRAP():  {self.scheduler.get_job('scrap').next_run_time}")
 
     @utils.log_call
-    async def loop_post(self):
-        """[Background task] Notifies all subscribed channels of new events."""
+    async def loop_post(self, channels:list[commands.TextChannelConverter]=None):
+        """[Background task] Notifies the channels that are due (all subscribed channels if ``None``) of new events."""
         await self.bot.wait_until_ready()
         self.countingSheeps.cancel() #TODO check if already cancelled
         await asyncio.sleep(1) #bugfix: wait before change_presence is called too fast!
-        await self.notify()
+        await self.notify(channels)
         await asyncio.sleep(1) #bugfix: wait before change_presence is called too fast!
         self.countingSheeps.start() #TODO check if already started
-        print(f"Next run time of LOOP_POST():  {self.scheduler.get_job('post').next_run_time}")
+        print(f"Next run time of LOOP_POST():  {self.getNextRunTime('post')}")
     
     @utils.log_call
-    async def loop_remind(self):
-        """[Background task] Reminds subscribed channels of when events are happening (today, tomorrow, ...).
+    async def loop_remind(self, channels:list[commands.TextChannelConverter]=None):
+        """[Background task] Reminds the channels that are due (all subscribed channels if ``None``) of when events are happening (today, tomorrow, ...).
         
-        The global variable `REMIND_BEFORE_DAYS`` defines how many days prior to the start of the event the reminder will be issued.
+        The schedule of each channel defines how many days prior to the start of the event the reminder will be issued (default `REMIND_BEFORE_DAYS`).
         """
         await self.bot.wait_until_ready()
         self.countingSheeps.cancel() #TODO check if already cancelled
         await asyncio.sleep(1) #bugfix: wait before change_presence is called too fast!
-        await self.remind()
+        await self.remind(channels)
         await asyncio.sleep(1) #bugfix: wait before change_presence is called too fast!
         self.countingSheeps.start() #TODO check if already started
-        print(f"Next run time of LOOP_REMIND():  {self.scheduler.get_job('remind').next_run_time}")
+        print(f"Next run time of LOOP_REMIND():  {self.getNextRunTime('remind')}")
     
     async def scrap(self):
-        """Searches the web for new events, and puts them into the database"""
-        await self.bot.change_presence(status=discord.Status.online, activity=discord.Game('Scrapping the web...'))
+        """Searches the web for new events, and puts them into the database.
 
-        # Scrap events
-        print("Scrapping events...")
-        events = getEvents()
-        # print("Found the following events:")
-        # for event in events:
-        #    print(event)
+        Scrapping and inserting run in a worker thread, so the bot stays responsive in the meantime.
+        Only one scrap runs at a time; further calls wait until the running one has finished.
+        """
+        async with self.scrap_lock:
+            self.setStatus('Scrapping the web...')
+            loop = asyncio.get_running_loop()
+
+            def progress(done, total):
+                """Called from the scrapper thread. Hands the progress over to the event loop."""
+                loop.call_soon_threadsafe(self.onScrapProgress, done, total)
+
+            # Scrap events
+            print("Scrapping events...")
+            coverage = {}  # source -> last start date up to which its events are complete
+            events = await loop.run_in_executor(self.scrap_executor, partial(getEvents, progress=progress, coverage=coverage))
+            # print("Found the following events:")
+            # for event in events:
+            #    print(event)
 
-        # Insert events into database
-        db.eventDB.insertEvents(events)
+            # Insert events into database. Only new and changed events are written
+            today = datetime.datetime.now(tz=LOCAL_TZ).date()
+            report = await db.asyncEventDB.insertEvents(events, complete_since=today, complete_until=coverage)
+            print(f"Scrap delta: {len(report['new'])} new, {len(report['changed'])} changed, {len(report['unchanged'])} unchanged, {len(report['vanished'])} vanished events")
+            if report['vanished']:
+                print(f"Events no longer listed by their source: {', '.join(f'{event_id} ({date_start})' for event_id, date_start in report['vanished'])}")
 
-        print("Finished scrapping events!")
-        pass
+            # Refresh the new and changed events in the event store, as the database has them (e.g. with the date they were added)
+            async with self.event_store_lock:
+                if self.event_store.since is not None:
+                    self.event_store.update(await db.asyncEventDB.getEventsByKeys(report['new'] + report['changed']))
+
+            # Changed events have a new content hash anyways; drop the renders of old versions
+            self.render_cache.clear()
+
+            print("Finished scrapping events!")
+
+    def onScrapProgress(self, done:int, total:int):
+        """Shows the progress of the running scrap in the bot status.
+
+        Runs on the event loop. Updates are throttled to one every `SCRAP_PROGRESS_INTERVAL` seconds (and the final one).
+        """
+        now = time.monotonic()
+        if done < total and now - self.scrap_progress_time < SCRAP_PROGRESS_INTERVAL:
+            return
+        self.scrap_progress_time = now
+        self.setStatus(f'Scrapping the web... [{done}/{total}]')
+
+    def runInBackground(self, coro, what:str) -> asyncio.Task:
+        """Runs the coroutine as a task without waiting for it. The task is kept until it is done, and its error (if any) is printed.
+
+        Parameters
+        ------------
+        coro: :class:`Coroutine`
+            The work to be done.
+        what: :class:`str`
+            What the work does, for the error message.
+        """
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        def done(task):
+            self.background_tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                utils.print_warning(f"{what} failed: {task.exception()!r}")
+        task.add_done_callback(done)
+        return task
+
+    def setStatus(self, activity:str, status:discord.Status=discord.Status.online) -> asyncio.Task:
+        """Shows the activity in the bot status.
+
+        Every presence change goes through the send queue with the lowest priority, so status updates keep their order and are paced with all other requests.
+        This method does not wait for the update to be sent; it returns the task sending it.
+
+        Parameters
+        ------------
+        activity: :class:`str`
+            The activity to be shown.
+        status: :class:`discord.Status`
+            The status of the bot (online, idle, ...).
+        """
+        return self.runInBackground(self.send_queue.submit(PRIORITY_STATUS, None, self.bot.change_presence, status=status, activity=discord.Game(activity)),
+                                    f"Showing status '{activity}'")
+
+    async def getLeadGroups(self, channels:list[commands.TextChannelConverter], setting:str, default:int) -> dict[int,dict[int,dict]]:
+        """Groups channels by how many days ahead they are notified or reminded: days -> {channel_id -> settings of the channel}.
+
+        The settings are the subscribed topics ('visibility'), the schedule and the watermark (see :meth:`DBDiscord.getSchedules`).
+
+        Parameters
+        ------------
+        channels: Optional[:class:`list`[:class:`commands.TextChannelConverter`]]
+            The channels, ``None`` for all subscribed channels.
+        setting: :class:`str`
+            The schedule setting of the lead time, 'post_before_days' or 'remind_before_days'.
+        default: :class:`int`
+            The lead time of channels that did not set their own.
+        """
+        schedules = await db.asyncDiscordDB.getSchedules([channel.id for channel in channels] if channels else None)
+        groups = {}
+        for channel_id, settings in schedules.items():
+            days = settings[setting] if settings[setting] is not None else default
+            groups.setdefault(days, {})[channel_id] = settings
+        return groups
+
+    def getChangedEvents(self, events:list[Event], settings:dict, unsent:set[tuple]) -> list[Event]:
+        """Returns the events a channel has to be notified of: events that are new or changed since its last notification,
+        events that were not yet in the date duration of its last notification, and events whose posts or edits have not been sent yet.
+
+        The outbox requests of these events are replaced by the notification, so unsent events must be checked again.
+        Events whose posted message has been deleted are added by :meth:`notify` (see :meth:`ChannelIndex.isDeleted`).
+
+        Parameters
+        ------------
+        events: :class:`list`[:class:`Event`]
+            The events of the date duration of the channel.
+        settings: :class:`dict`
+            The settings of the channel, with its watermark (see :meth:`DBDiscord.getSchedules`).
+        unsent: :class:`set`[:class:`tuple`]
+            The keys (see `eventKey`) of the events that are waiting in the outbox (or failed to be sent).
+        """
+        notified_at, notified_until = settings['notified_at'], settings['notified_until']
+        if notified_at is None or notified_until is None:
+            return events
+        return [event for event in events if event.updated_at is None or event.updated_at > notified_at
+                or not event.date_end or event.date_end > notified_until or eventKey(event) in unsent]
+
+    async def getEventStore(self) -> EventStore:
+        """Returns the store of upcoming events. It is (re)loaded from the database on the first use of every day."""
+        today = datetime.datetime.now(tz=LOCAL_TZ).date()
+        async with self.event_store_lock:
+            if self.event_store.since != today:
+                events = await db.asyncEventDB.getEvents(from_date=today, mode='overlap')
+                self.event_store.load(events, since=today)
+                print(f"Loaded {len(self.event_store)} upcoming events into the event store")
+        return self.event_store
+
+    async def getEventsByChannel(self, channel_visibility:dict[int,list[str]], from_date:datetime.date, until_date:datetime.date=None, mode:str='within') -> dict[int, list[Event]]:
+        """Returns the events of every given channel (channel_id -> subscribed topics) in the date duration: channel_id -> events.
+
+        They are taken from the event store, or from the database in a single query if the store does not cover the date duration.
+        """
+        store = await self.getEventStore()
+        if store.covers(from_date):
+            return store.getEventsByChannel(channel_visibility, from_date, until_date, mode)
+        return await db.asyncEventDB.getEventsByChannel(list(channel_visibility), from_date, until_date, mode)
+
+    async def getEventsByTopics(self, channel_visibility:dict[int,list[str]], from_date:datetime.date, until_date:datetime.date=None, mode:str='within') -> dict[tuple, tuple[list[int], list[Event]]]:
+        """Returns the events of every distinct set of subscribed topics of the given channels (channel_id -> subscribed topics): topics -> (channel_ids, events).
+
+        They are taken from the event store, or from the database in a single query if the store does not cover the date duration.
+        """
+        store = await self.getEventStore()
+        if store.covers(from_date):
+            return store.getEventsByTopics(channel_visibility, from_date, until_date, mode)
+        return await db.asyncEventDB.getEventsByTopics(list(channel_visibility), from_date, until_date, mode)
     
     async def notify(self, channels:list[commands.TextChannelConverter]=None):
         """Notifies given channels of new events.
@@ -176,96 +514,460 @@ class EventListener(commands.Cog):
         channels: Optional[:class:`list`[:class:`commands.TextChannelConverter`]]
             The channels to be notified, ``None`` if all channels shall be notified.
         """
-        await self.bot.change_presence(status=discord.Status.online, activity=discord.Game('Notifying channels...'))
+        self.setStatus('Notifying channels...')
 
-        # Extract subscribed topics per channel from database
         if channels:
-            chvs = [[channel.id, db.discordDB.getChannelVisibility(channel.id)] for channel in channels]
             print(f'### Notifying channels {channels} of new events')
         else:
-            chvs = db.discordDB.getAllChannelVisibility()
             print('### Notifying all channels of new events')
 
-        # Loop over every channel
-        for chv in chvs:
-            channel = self.bot.get_channel(chv[0])
-            topics = chv[1]
-            #print(f"Channel-ID: {channel.id};  Topics: {topics}")
-
-            # Obtain all events in database from today until 1 week of topics this channel has subscribed to
-            events = db.eventDB.getEvents(
-                visibility=topics,
-                from_date=datetime.datetime.now(tz=LOCAL_TZ).date(),
-                until_date=datetime.datetime.now(tz=LOCAL_TZ).date()+datetime.timedelta(weeks=POST_BEFORE_WEEKS)
+        # Obtain all events from today until the lead time of each channel of topics each channel has subscribed to (from the event store).
+        # Only events that are new or changed since the last notification of a channel are checked
+        today = datetime.datetime.now(tz=LOCAL_TZ).date()
+        store = await self.getEventStore()
+        window_events = {}  # channel_id -> all events of the date duration of the channel
+        channel_events = {}  # channel_id -> events to be checked
+        watermarks = {}  # channel_id -> (channel_id, notified_at, notified_until), recorded once the channel is notified
+        groups = await self.getLeadGroups(channels, 'post_before_days', POST_BEFORE_DAYS)
+        unsent = await db.asyncOutboxDB.getEventKeys([channel_id for group in groups.values() for channel_id in group], ['post', 'edit'])
+        for days, group in groups.items():
+            until_date = today+datetime.timedelta(days=days)
+            events_by_channel = await self.getEventsByChannel(
+                {channel_id: settings['visibility'] for channel_id, settings in group.items()},
+                from_date=today,
+                until_date=until_date
             )
+            for channel_id, events in events_by_channel.items():
+                window_events[channel_id] = events
+                channel_events[channel_id] = self.getChangedEvents(events, group[channel_id], unsent.get(channel_id, set()))
+                watermarks[channel_id] = (channel_id, store.updated_at, until_date)
+
+        # Obtain the messages of all events that have already been posted (in a single query)
+        channel_messages = await db.asyncMessageDB.getMessages(list(channel_events))
+
+        visible_channels = []
+        for channel_id in channel_events:
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                utils.print_warning(f"-> Channel {channel_id} is not visible to me (deleted?). SKIP")
+                continue
+            visible_channels.append(channel)
+
+        # Unchanged events are not checked, so posts that have been deleted (e.g. by a moderator) are found with the message index:
+        # their events are checked as well, and posted again
+        await self.dispatcher.gather(self.getChannelIndex(channel) for channel in visible_channels if channel_messages.get(channel.id))
+        for channel in visible_channels:
+            channel_index, posted = self.message_index.get(channel.id), channel_messages.get(channel.id, {})
+            if channel_index is None or not posted:
+                continue
+            deleted = {key for key, entry in posted.items() if channel_index.isDeleted(entry.message_id)}
+            checked = {eventKey(event) for event in channel_events[channel.id]}
+            channel_events[channel.id] += [event for event in window_events[channel.id] if eventKey(event) in deleted and eventKey(event) not in checked]
+            for key in deleted:
+                del posted[key]
+        print(f"{sum(len(events) for events in channel_events.values())} of {sum(len(events) for events in window_events.values())} events are new, changed or deleted since the last notification")
+
+        # Notify every channel (concurrently)
+        results = await self.dispatcher.gather(
+            self.notifyChannel(channel, channel_events[channel.id], channel_messages.get(channel.id, {})) for channel in visible_channels
+        )
+        for channel, result in zip(visible_channels, results):
+            if isinstance(result, Exception):
+                utils.print_warning(f"-> Notifying channel #{channel}:{channel.id} failed: {result!r}")
+                watermarks.pop(channel.id)  # Check all events again next time
+
+        # The posts and edits are in the outbox now, they are sent (and retried) from there
+        await db.asyncDiscordDB.setWatermarks([watermarks[channel.id] for channel in visible_channels if channel.id in watermarks])
+
+        # Send the queued posts and edits
+        await self.drainOutbox()
 
-            ################
-            # Notify channel
-            ################
-            print(f"-> Notifying channel #{channel}:{channel.id} of new events")
-
-            # Find messages of events that have already been posted to discord
-            messages, idx = await self.findEventMessages(channel, events)
-
-            # Loop over every event
-            for i, event in enumerate(events):
-                if i in idx:  # If event has already been posted before, update it with new details (if any)
-                    message = messages[idx.index(i)]
-                    # Only edit if embed has changed
-                    if self.embedsAreEqual(message.embeds[0], self.getEmbed(event)):
-                        continue
-                    # Edit message
-                    await message.edit(embed=self.getEmbed(event))
-                    print(f'Edited event in message: {event.name} [{event.id}] -> Message-ID:{message.id}')
-                    pass
-                else:  # Post NEW event
-                    if event.status.lower() in ['cancelled','canceled']:
-                        continue # Only post if event has not been cancelled in the first place
-                    await channel.send(content=f'***{event.name} [{event.id}]***', embed=self.getEmbed(event))
-                    print(f'Posted event to channel: {event.name} [{event.id}] -> #{channel}:{channel.id}')
-                await asyncio.sleep(2) #bugfix: sleep for some time before new event is posted
-        
         print("### Notified all channels!")
 
+    async def notifyChannel(self, channel: commands.TextChannelConverter, events: list[Event], posted: dict[tuple,db.PostedMessage]=None):
+        """Queues the posts and edits that notify a channel of new events in the outbox.
+
+        New events are posted in order; with `POST_BATCH_SIZE` above 1 batched through a webhook.
+        Updated events are edited with one request per message.
+        Waiting requests of the channel from earlier runs are replaced.
+
+        Parameters
+        ------------
+        channel: :class:`discord.TextChannel`
+            The channel to be notified.
+        events: :class:`list`[:class:`Event`]
+            The events of the topics the channel has subscribed to.
+        posted: Optional[:class:`dict`[:class:`tuple`,:class:`db.PostedMessage`]]
+            The ledger entries of the channel, if already fetched.
+        """
+        print(f"-> Notifying channel #{channel}:{channel.id} of new events")
+
+        # Find messages of events that have already been posted to discord
+        posted = await self.findEventMessages(channel, events, posted)
+
+        # Sort events into outdated posts (grouped by message) and new events
+        outdated = {}  # message_id -> list of (event, embed dict, fingerprint, ledger entry)
+        new = []  # list of (event, embed dict, fingerprint)
+        for event in events:
+            data, fingerprint = self.renderEvent(event)
+            entry = posted.get(eventKey(event))
+            if entry is None:
+                if event.status.lower() not in ['cancelled','canceled']:  # Only post if event has not been cancelled in the first place
+                    new.append((event, data, fingerprint))
+            elif entry.fingerprint != fingerprint:
+                outdated.setdefault(entry.message_id, []).append((event, data, fingerprint, entry))
+            # else: posted embed is still up to date
+
+        # Update already posted events with new details (one edit per message)
+        entries = []
+        for message_id, items in outdated.items():
+            payload = {
+                'message_id': message_id,
+                'webhook_id': items[0][3].webhook_id,
+                'events': [{**self.getOutboxEvent(event, data, fingerprint), 'index': entry.embed_index, 'checked': entry.fingerprint is not None}
+                    for event, data, fingerprint, entry in items]
+            }
+            entries.append(self.getOutboxEntry(channel, 'edit', PRIORITY_EDIT, payload))
+
+        # Post NEW events
+        webhook = await self.getWebhook(channel) if POST_BATCH_SIZE > 1 and new else None
+        for batch in self.packEvents(new, POST_BATCH_SIZE if webhook else 1):
+            payload = {'webhook': webhook is not None, 'events': [self.getOutboxEvent(*item) for item in batch]}
+            entries.append(self.getOutboxEntry(channel, 'post', PRIORITY_POST, payload))
+
+        await db.asyncOutboxDB.enqueue(entries, supersede=(channel.id, ['post', 'edit']))
+
+    def packEvents(self, items: list[tuple], size: int) -> list[list[tuple]]:
+        """Packs events into messages of up to `size` embeds, within Discord's limit of characters per message.
+
+        Parameters
+        ------------
+        items: :class:`list`[:class:`tuple`]
+            The events: tuples (event, embed dict, fingerprint).
+        size: :class:`int`
+            The maximum number of embeds per message.
+        """
+        batches = []
+        batch, length = [], 0
+        for item in items:
+            embed_length = len(self.getEmbed(*item[:2]))
+            if batch and (len(batch) >= size or length + embed_length > EMBED_TOTAL_LIMIT):
+                batches.append(batch)
+                batch, length = [], 0
+            batch.append(item)
+            length += embed_length
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def getOutboxEvent(self, event: Event, data: dict, fingerprint: str) -> dict:
+        """Returns an event as it is stored in the payload of an outbox entry.
+
+        Parameters
+        ------------
+        event: :class:`Event`
+            The event.
+        data: :class:`dict`
+            The embed as returned by :meth:`getEmbedDict`.
+        fingerprint: :class:`str`
+            The fingerprint of the embed.
+        """
+        return {
+            'event_id': event.id,
+            'date_start': event.date_start.isoformat(),
+            'name': event.name,
+            'cancelled': event.status.lower() in ['cancelled','canceled'],
+            'fingerprint': fingerprint,
+            'embed': self.getEmbed(event, data).to_dict(),
+        }
+
+    def getOutboxEntry(self, channel: commands.TextChannelConverter, kind: str, priority: int, payload: dict) -> tuple:
+        """Returns an outbox entry (see :meth:`db.DBOutbox.enqueue`).
+
+        The idempotency key is derived from the payload. Rendered embeds are left out, as they are identified by their fingerprints.
+
+        Parameters
+        ------------
+        channel: :class:`discord.TextChannel`
+            The channel the request is sent to.
+        kind: :class:`str`
+            The kind of request: 'post', 'edit' or 'remind'.
+        priority: :class:`int`
+            The priority of the request in the send queue.
+        payload: :class:`dict`
+            What to send (JSON serializable).
+        """
+        identity = {**payload, 'events': [{key: value for key, value in event.items() if key != 'embed'} for event in payload.get('events', [])]}
+        key = f"{kind}:{channel.id}:{hashlib.sha1(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()}"
+        return (key, channel.id, kind, priority, payload)
+
+    async def drainOutbox(self):
+        """Sends the due requests of the outbox, until none are left.
+
+        Only one drain runs at a time. Requests are taken by priority; requests of different channels are sent concurrently, requests of one channel in order.
+        A request is marked done in the same transaction that records its message in the ledgers,
+        failed requests are retried with backoff (see :meth:`db.DBOutbox.retry`).
+        """
+        async with self.outbox_lock:
+            while True:
+                entries = await db.asyncOutboxDB.claim(OUTBOX_CLAIM_SIZE)
+                if not entries:
+                    return
+                channel_entries = {}
+                for entry in entries:
+                    channel_entries.setdefault(entry['channel_id'], []).append(entry)
+                await self.dispatcher.gather(self.sendOutboxEntries(channel_id, entries) for channel_id, entries in channel_entries.items())
+
+    async def sendOutboxEntries(self, channel_id: int, entries: list[dict]):
+        """Sends outbox entries of a channel in order.
+
+        Parameters
+        ------------
+        channel_id: :class:`int`
+            The ID of the channel.
+        entries: :class:`list`[:class:`dict`]
+            The claimed outbox entries of the channel.
+        """
+        channel = self.bot.get_channel(channel_id)
+        senders = {'post': self.sendOutboxPost, 'edit': self.sendOutboxEdit, 'remind': self.sendOutboxReminder}
+        for entry in entries:
+            if channel is None:
+                await db.asyncOutboxDB.fail(entry['id'], 'Channel is not visible (deleted?)')
+                continue
+            try:
+                await senders[entry['kind']](channel, entry)
+            except (discord.Forbidden, discord.NotFound) as e:  # Would fail again
+                utils.print_warning(f"-> Request {entry['kind']} to channel #{channel}:{channel.id} failed: {e}")
+                await db.asyncOutboxDB.fail(entry['id'], repr(e))
+            except discord.HTTPException as e:
+                utils.print_warning(f"-> Request {entry['kind']} to channel #{channel}:{channel.id} failed: {e}")
+                if e.status >= 500 or e.status == 429:
+                    await db.asyncOutboxDB.retry(entry['id'], repr(e))
+                else:  # Bad request, e.g. message too big
+                    await db.asyncOutboxDB.fail(entry['id'], repr(e))
+            except Exception as e:  # Connection errors, timeouts, ...
+                utils.print_warning(f"-> Request {entry['kind']} to channel #{channel}:{channel.id} failed, retrying later: {e!r}")
+                await db.asyncOutboxDB.retry(entry['id'], repr(e))
+
+    async def sendOutboxPost(self, channel: commands.TextChannelConverter, entry: dict):
+        """Posts new events of an outbox entry, and records them in the message ledger.
+
+        Without a webhook, every event is recorded as soon as its message is sent, and removed from the entry.
+
+        Parameters
+        ------------
+        channel: :class:`discord.TextChannel`
+            The channel to post the events in.
+        entry: :class:`dict`
+            The outbox entry.
+        """
+        events = entry['payload']['events']
+        embeds = [discord.Embed.from_dict(event['embed']) for event in events]
+        webhook = await self.getWebhook(channel) if entry['payload']['webhook'] else None
+        if webhook:  # All events in one message
+            try:
+                message = await self.send_queue.submit(PRIORITY_POST, channel.id, webhook.send,
+                    content='\n'.join(f"***{event['name']} [{event['event_id']}]***" for event in events),
+                    embeds=embeds,
+                    username=self.bot.user.display_name,
+                    avatar_url=str(self.bot.user.avatar_url),
+                    wait=True
+                )
+            except discord.NotFound:
+                self.webhooks.pop(channel.id, None)  # Webhook has been deleted -> create a new one next time
+                raise
+            self.message_index.add(message)  # Indexed right away, so a missed gateway event does not make it look deleted
+            messages = [(channel.id, event['event_id'], event['date_start'], *db.PostedMessage(message.id, event['fingerprint'], index, webhook.id))
+                for index, event in enumerate(events)]
+        else:  # One message per event
+            messages = []
+            for index, (event, embed) in enumerate(zip(events, embeds)):
+                message = await self.send_queue.submit(PRIORITY_POST, channel.id, channel.send, content=f"***{event['name']} [{event['event_id']}]***", embed=embed)
+                self.message_index.add(message)
+                messages = [(channel.id, event['event_id'], event['date_start'], *db.PostedMessage(message.id, event['fingerprint']))]
+                if index < len(events)-1:  # Recorded right away, so a failing send later on does not post this event again
+                    await db.asyncOutboxDB.advance(entry['id'], {**entry['payload'], 'events': events[index+1:]}, messages)
+                    print(f"Posted event to channel: {event['name']} [{event['event_id']}] -> #{channel}:{channel.id}")
+            events = events[-1:]
+        await db.asyncOutboxDB.complete(entry['id'], messages=messages)
+        for event in events:
+            print(f"Posted event to channel: {event['name']} [{event['event_id']}] -> #{channel}:{channel.id}")
+
+    async def sendOutboxEdit(self, channel: commands.TextChannelConverter, entry: dict):
+        """Edits the embeds of updated events in a posted message, and records them in the message ledger.
+
+        If the message does not exist anymore (or can no longer be edited), the events are queued to be posted again.
+
+        Parameters
+        ------------
+        channel: :class:`discord.TextChannel`
+            The channel the events were posted in.
+        entry: :class:`dict`
+            The outbox entry.
+        """
+        payload = entry['payload']
+        message_id, webhook_id, events = payload['message_id'], payload['webhook_id'], payload['events']
+        channel_index = self.message_index.get(channel.id)
+        message = channel_index.getMessage(message_id) if channel_index else None
+        if message is None:
+            try:
+                message = await self.send_queue.submit(PRIORITY_EDIT, channel.id, channel.fetch_message, message_id)
+                self.message_index.add(message)  # Indexed with its current content, so it is not fetched again
+            except discord.NotFound:
+                message = None
+        webhook = await self.getWebhook(channel) if webhook_id is not None else None
+        if message is None or (webhook_id is not None and (webhook is None or webhook.id != webhook_id)):
+            # Message was deleted, or the webhook that posted it (the only one who can edit it) is gone -> post events again
+            await self.repostEvents(channel, events, replaces=message_id)
+            await db.asyncOutboxDB.complete(entry['id'], forget_message=(channel.id, message_id))
+            return
+
+        # Replace the embeds of updated events
+        embeds = list(message.embeds)
+        edited, current, missing = [], [], []
+        for event in events:
+            if event['index'] >= len(embeds):  # Embed has been removed from the message
+                missing.append(event)
+                continue
+            embed = discord.Embed.from_dict(event['embed'])
+            # Messages recorded without fingerprint (history backfill): only edit if embed has changed
+            if not event['checked'] and self.embedsAreEqual(embeds[event['index']], embed):
+                current.append(event)
+                continue
+            embeds[event['index']] = embed
+            edited.append(event)
+        if edited:
+            if webhook is None:
+                await self.send_queue.submit(PRIORITY_EDIT, channel.id, message.edit, embed=embeds[0])
+            else:
+                await self.send_queue.submit(PRIORITY_EDIT, channel.id, webhook.edit_message, message_id, embeds=embeds)
+                self.message_index.invalidate(channel.id, message_id)  # Indexed again once Discord announces the edit
+        # Events whose embed is gone are posted again, and forgotten in the ledger until then
+        await self.repostEvents(channel, missing)
+
+        messages = [(channel.id, event['event_id'], event['date_start'], *db.PostedMessage(message_id, event['fingerprint'], event['index'], webhook_id))
+            for event in edited + current]
+        await db.asyncOutboxDB.complete(entry['id'], messages=messages, forget_events=[(channel.id, event['event_id'], event['date_start']) for event in missing])
+        for event in edited:
+            print(f"Edited event in message: {event['name']} [{event['event_id']}] -> Message-ID:{message_id}")
+
+    async def repostEvents(self, channel: commands.TextChannelConverter, events: list[dict], replaces: int=None):
+        """Queues events of an edit entry to be posted again (cancelled events are left out).
+
+        Parameters
+        ------------
+        channel: :class:`discord.TextChannel`
+            The channel the events were posted in.
+        events: List[:class:`dict`]
+            The events of the edit entry.
+        replaces: :class:`int`
+            The message that held the events, if it is gone.
+        """
+        repost = {'webhook': POST_BATCH_SIZE > 1, 'events': [{key: event[key] for key in ('event_id', 'date_start', 'name', 'cancelled', 'fingerprint', 'embed')}
+            for event in events if not event['cancelled']]}
+        if not repost['events']:
+            return
+        if replaces is not None:
+            repost['replaces'] = replaces
+        await db.asyncOutboxDB.enqueue([self.getOutboxEntry(channel, 'post', PRIORITY_POST, repost)])
+
+    async def sendOutboxReminder(self, channel: commands.TextChannelConverter, entry: dict):
+        """Posts the reminder of an outbox entry, and records it in the reminder ledger.
+
+        An outdated reminder of the same day is deleted once the new one has been posted.
+
+        Parameters
+        ------------
+        channel: :class:`discord.TextChannel`
+            The channel to remind.
+        entry: :class:`dict`
+            The outbox entry.
+        """
+        payload = entry['payload']
+        message = await self.send_queue.submit(PRIORITY_REMINDER, channel.id, channel.send, content=payload['content'])
+        await db.asyncOutboxDB.complete(entry['id'], reminder=(channel.id, payload['date'], message.id))
+        if not payload['message_id']:
+            print(f'Reminded channel: #{channel}:{channel.id}')
+            return
+        print(f'Updated reminder in channel: #{channel}:{channel.id}')
+        try:
+            await self.send_queue.submit(PRIORITY_REMINDER, channel.id, channel.get_partial_message(payload['message_id']).delete)
+        except discord.HTTPException as e:
+            utils.print_warning(f"-> Could not delete outdated reminder in channel #{channel}:{channel.id}: {e}")
+
+    async def getWebhook(self, channel: commands.TextChannelConverter, create: bool=True) -> discord.Webhook:
+        """Returns the webhook of the bot in the channel, and creates it if necessary.
+
+        Returns ``None`` if the bot may not manage webhooks in the channel (or if it has none and `create` is not set).
+
+        Parameters
+        ------------
+        channel: :class:`discord.TextChannel`
+            The channel of the webhook.
+        create: :class:`bool`
+            Whether the webhook is created if the bot has none in the channel yet.
+        """
+        if channel.id in self.webhooks:
+            return self.webhooks[channel.id]
+        webhook = None
+        try:
+            webhooks = await self.send_queue.submit(PRIORITY_POST, channel.id, channel.webhooks)
+            webhook = next((webhook for webhook in webhooks if webhook.name == WEBHOOK_NAME and webhook.user == self.bot.user), None)
+            if webhook is None:
+                if not create:
+                    return None  # Not remembered, so the webhook is still created once it is needed
+                webhook = await self.send_queue.submit(PRIORITY_POST, channel.id, channel.create_webhook, name=WEBHOOK_NAME)
+        except discord.Forbidden:
+            utils.print_warning(f"-> Not allowed to manage webhooks in channel #{channel}:{channel.id}, posting events one by one")
+        self.webhooks[channel.id] = webhook
+        return webhook
+
     async def remind(self, channels:list[commands.TextChannelConverter]=None):
         """Reminds given channels of events that are happening soon.
         
         If no list of channels are given, it defaults to reminding every channel.
 
-        The global variable `REMIND_BEFORE_DAYS`` defines how many days prior to the start of the event the reminder will be issued.
+        The schedule of each channel defines how many days prior to the start of the event the reminder will be issued (default `REMIND_BEFORE_DAYS`).
 
         Parameters
         ------------
         channels: Optional[:class:`list`[:class:`commands.TextChannelConverter`]]
             The channels to be notified, ``None`` if all channels shall be notified.
         """
-        await self.bot.change_presence(status=discord.Status.online, activity=discord.Game('Checking for reminders...'))
+        self.setStatus('Checking for reminders...')
 
-        # Extract subscribed topics per channel from database
         if channels:
-            chvs = [[channel.id, db.discordDB.getChannelVisibility(channel.id)] for channel in channels]
             print(f'### Reminding channels {channels} of current events')
         else:
-            chvs = db.discordDB.getAllChannelVisibility()
             print('### Reminding all channels of current events')
-        
-        # Loop over every channel
-        for chv in chvs:
-            channel = self.bot.get_channel(chv[0])
-            topics = chv[1]
-            #print(f"Channel-ID: {channel.id};  Topics: {topics}")
-
-            # Obtain all currently happening events in database of topics this channel has subscribed to
-            events = db.eventDB.getEvents(
-                visibility=topics,
-                from_date=(datetime.datetime.now(tz=LOCAL_TZ)+datetime.timedelta(days=REMIND_BEFORE_DAYS)).date(),
-                until_date=(datetime.datetime.now(tz=LOCAL_TZ)+datetime.timedelta(days=REMIND_BEFORE_DAYS)).date()
+
+        # Obtain all currently happening events of every distinct set of subscribed topics and lead time (from the event store).
+        # Channels that subscribed to the same topics get the same reminder, apart from the links to the posted events
+        today = datetime.datetime.now(tz=LOCAL_TZ).date()
+        channel_events = {}  # channel_id -> (days, events)
+        for days, group in (await self.getLeadGroups(channels, 'remind_before_days', REMIND_BEFORE_DAYS)).items():
+            topic_events = await self.getEventsByTopics(
+                {channel_id: settings['visibility'] for channel_id, settings in group.items()},
+                from_date=today+datetime.timedelta(days=days),
+                until_date=today+datetime.timedelta(days=days),
+                mode='starting'  # Multi-day events are reminded on the day they start
             )
-            
-            # Remove events that are cancelled anyways -> no need to remind
-            for event in events:
-                if event.status.lower() in ['cancelled','canceled']:
-                    events.remove(event)
+            for topic_channel_ids, events in topic_events.values():
+                # Remove events that are cancelled anyways -> no need to remind
+                events = [event for event in events if event.status.lower() not in ['cancelled','canceled']]
+                for channel_id in topic_channel_ids:
+                    channel_events[channel_id] = (days, events)
+
+        # Obtain posted event messages and today's reminders (in a single query each)
+        channel_messages = await db.asyncMessageDB.getMessages(list(channel_events))
+        channel_reminders = await db.asyncReminderDB.getReminders(list(channel_events), today)
+
+        # Loop over every channel
+        for channel_id, (days, events) in channel_events.items():
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                utils.print_warning(f"-> Channel {channel_id} is not visible to me (deleted?). SKIP")
+                continue
 
             if not events:
                 print(f"-> Channel #{channel}:{channel.id} has no currently happening events")
@@ -279,43 +981,39 @@ class EventListener(commands.Cog):
             #     print(event)
 
             # Find all event embeds for the reminder, so the embed-URLs can be set as links in the reminder message
-            event_messages, idx = await self.findEventMessages(channel, events)
+            posted = await self.findEventMessages(channel, events, channel_messages.get(channel_id, {}))
             events_t:list[tuple[Event,str]] = [] # list of tuples (event, discord-url)
-            for i, event in enumerate(events):
+            for event in events:
                 url = None
-                if i in idx:
-                    url = event_messages[idx.index(i)].jump_url
+                if eventKey(event) in posted:
+                    url = channel.get_partial_message(posted[eventKey(event)].message_id).jump_url
                 events_t.append((event,url))
             
             # Find today's reminder that has already been posted to Discord (if it even exists)
-            message = await self.findReminderMessage(channel, events)
-
-            reminder = self.getReminder(events_t)
-            if message:  # In case event information has changed, delete reminder and create a new one
-                if message.content != reminder:  # If reminders are different, then event information must have changed last minute!
-                    # Delete reminder, then post new one
-                    reminder = reminder.replace('\n','  (UPDATED!) :sparkles:\nEvent information has changed last minute!\n',1)
-                    if message.content != reminder:
-                        try:
-                            await channel.send(content=reminder)
-                            print(f'Updated reminder in channel: {event.name} [{event.id}] -> #{channel}:{channel.id}')
-                            await message.delete()
-                        except discord.errors.HTTPException:
-                            utils.print_warning("Message is too big, couldn't sent it.")
-                    else:  # Reminder must not be changed
-                        print(f'Reminder does not need to be updated in channel: {event.name} [{event.id}] -> #{channel}:{channel.id}')
-                else:  # Reminder must not be changed
-                    print(f'Reminder does not need to be updated in channel: {event.name} [{event.id}] -> #{channel}:{channel.id}')
-            else:  # Send reminder
-                await channel.send(content=reminder)
-                print(f'Reminded channel: {event.name} [{event.id}] -> #{channel}:{channel.id}')
+            message = await self.findReminderMessage(channel, channel_reminders.get(channel_id))
+
+            reminder = self.getReminder(events_t, days)
+            if message and message.content != reminder:  # If reminders are different, then event information must have changed last minute!
+                reminder = reminder.replace('\n','  (UPDATED!) :sparkles:\nEvent information has changed last minute!\n',1)
+            if message and message.content == reminder:  # Reminder must not be changed
+                print(f'Reminder does not need to be updated in channel: {len(events)} events -> #{channel}:{channel.id}')
+                continue
+
+            # Queue reminder. In case event information has changed, the old reminder is deleted once the new one is posted
+            payload = {'content': reminder, 'date': today.isoformat(), 'message_id': message.id if message else None}
+            await db.asyncOutboxDB.enqueue([self.getOutboxEntry(channel, 'remind', PRIORITY_REMINDER, payload)], supersede=(channel.id, ['remind']))
+
+        # Send the queued reminders
+        await self.drainOutbox()
         
         print('### Reminded all channels!')
 
-    async def findEventMessages(self, channel: commands.TextChannelConverter, events: list[Event]) -> tuple[list[discord.Message],list[int]]:
+    async def findEventMessages(self, channel: commands.TextChannelConverter, events: list[Event], posted: dict[tuple,db.PostedMessage]=None) -> dict[tuple,db.PostedMessage]:
         """Finds events that have already been posted to discord.
 
-        Returns the messages and the indices of the events in the provided list.
+        Returns the ledger entries of the posted events, keyed by `eventKey`.
+        Messages are looked up in the message ledger of the database.
+        If the ledger knows no messages of the channel yet, the channel history is searched once and the found messages are recorded in the ledger.
 
         Parameters
         ------------
@@ -323,37 +1021,45 @@ class EventListener(commands.Cog):
             The channel where to search for already posted events.
         events: :class:`list`[:class:`Event`]
             The events to check for if they have already been posted.
+        posted: Optional[:class:`dict`[:class:`tuple`,:class:`db.PostedMessage`]]
+            The ledger entries of the channel, if already fetched. ``None`` fetches them from the database.
         """
-        # Search results will be appended to these lists
-        messages = []
-        idx = []
-
-        # Loop over every message
-        async for message in channel.history(limit=SEARCH_DEPTH):
-            if not len(message.embeds):
-                continue
-            if message.author != self.bot.user:
-                continue
-
-            # Find message that has an Event embedded
-            embed = message.embeds[0]
-            try: # Check if embed has a date-field -> then it must be the Event-embed!
-                datefield = next((field for field in embed.fields if field.value.startswith(':date:')))
-            except StopIteration:
-                # message has not an event-embed
-                continue
+        if posted is None:
+            posted = await db.asyncMessageDB.getChannelMessages(channel.id)
+        if not posted and channel.id not in self.backfilled_events:
+            posted = await self.backfillEventMessages(channel, events)
+            self.backfilled_events.add(channel.id)
+        keys = (eventKey(event) for event in events)
+        return {key: posted[key] for key in keys if key in posted}
 
-            # Find index in list events that matches the discord message event
-            index = next((i for i,event in enumerate(events) if event.id==embed.footer.text.split()[-1] and f':date: ***{event.getDateRange()}***'==datefield.value), None)
-            if index is None:
-                continue
+    async def backfillEventMessages(self, channel: commands.TextChannelConverter, events: list[Event]) -> dict[tuple,db.PostedMessage]:
+        """Searches the recent messages of the channel for already posted events and records them in the message ledger.
 
-            # Append message and index to return-lists
-            messages.append(message)
-            idx.append(index)
-        return messages, idx
+        Returns the ledger entries of the found events, keyed by `eventKey`.
+        The fingerprints of their embeds are unknown, so they are recorded with the first edit check.
 
-    async def findReminderMessage(self, channel: commands.TextChannelConverter, events: list[Event]) -> discord.Message:
+        Parameters
+        ------------
+        channel: :class:`discord.TextChannel`
+            The channel where to search for already posted events.
+        events: :class:`list`[:class:`Event`]
+            The events to check for if they have already been posted.
+        """
+        channel_index = await self.getChannelIndex(channel)
+        posted = {}
+        for event in events:
+            # Events are indexed as they appear in their embed: (event-ID in footer, date-field)
+            found = channel_index.getEvent(event.id, f':date: ***{event.getDateRange()}***')
+            if found is not None:
+                message_id, embed_index, webhook_id = found
+                posted[eventKey(event)] = db.PostedMessage(message_id, None, embed_index, webhook_id)
+
+        if posted:
+            await db.asyncMessageDB.setMessages([(channel.id, *key, *value) for key, value in posted.items()])
+            print(f'Recorded {len(posted)} already posted events of channel #{channel}:{channel.id} in the message ledger')
+        return posted
+
+    async def findReminderMessage(self, channel: commands.TextChannelConverter, message_id: int=None) -> discord.Message:
         """Finds today's reminder message of currently happening events.
 
         Note:
@@ -361,95 +1067,139 @@ class EventListener(commands.Cog):
         It does not check for the latest reminder message.
         If no reminder message has been sent yet today, of course no message is found.
 
+        Reminders are looked up in the reminder ledger of the database.
+        If the ledger knows no reminder of the channel, the recent messages of the channel are searched for it.
+        The message is taken from the message index; it is only fetched if its indexed content is outdated.
+
         Parameters
         ------------
         channel: :class:`discord.TextChannel`
             The channel where to search for the reminder.
-        events: :class:`list`[:class:`Event`]
-            The events to check if they have all been mentioned in the reminder.
+        message_id: Optional[:class:`int`]
+            The ID of today's reminder in the ledger, ``None`` if there is none.
         """
         today = datetime.datetime.now(tz=LOCAL_TZ).date()
-        header = f"***\*\*\*Reminder   [{utils.custom_strftime('%b {S} ({DAY}), %Y', today)}]\*\*\****"
-        async for message in channel.history(limit=SEARCH_DEPTH):
-            if message.content.startswith('***\*\*\*Reminder'):
-                # This must be the lastest reminder message!
-                # Now check if it is from today.
-                if message.content.startswith(header):  # It is a reminder from today! Return the message
-                    return message
-                else:  # The reminder is old. So there exists no reminder from today yet
-                    return None
-        return None  # No reminder message found
-
-    def getReminder(self, events_t:list[tuple[Event,str]]) -> str:
+        channel_index = await self.getChannelIndex(channel)
+        if not message_id:
+            message_id = channel_index.getReminder(self.getReminderHeader(today))
+            if message_id is None:
+                return None  # No reminder message from today
+            await db.asyncReminderDB.setReminder(channel.id, today, message_id)
+        message = channel_index.getMessage(message_id)
+        if message is not None:
+            return message
+        try:
+            message = await self.send_queue.submit(PRIORITY_REMINDER, channel.id, channel.fetch_message, message_id)
+        except discord.NotFound:
+            await db.asyncReminderDB.removeReminder(channel.id, today)
+            return None
+        self.message_index.add(message)  # Indexed with its current content, so it is not fetched again
+        return message
+
+    def getReminderHeader(self, date:datetime.date) -> str:
+        """Returns the first line of the reminder of the given day."""
+        return f"***\*\*\*Reminder   [{utils.custom_strftime('%b {S} ({DAY}), %Y', date)}]\*\*\****"
+
+    def getReminder(self, events_t:list[tuple[Event,str]], days:int=REMIND_BEFORE_DAYS) -> str:
         """Creates reminder message and returns as string.
 
+        The parts that do not depend on the channel are rendered once per day and set of events (see :meth:`getReminderTemplate`),
+        only the URLs to the discord messages are filled in per channel.
+
         Parameters
         ------------
         events: :class:`list`[:class:`tuple`[:class:`Event`,:class:`str`]]
             List of tuples.
             First item of the tuple is the currently happening event,
             second item is the URL to the discord message.
+        days: :class:`int`
+            How many days from today the events are starting.
         """
-        today = datetime.datetime.now(tz=LOCAL_TZ).date()
-        string = f"***\*\*\*Reminder   [{utils.custom_strftime('%b {S} ({DAY}), %Y', today)}]\*\*\****"
-        string += f"\nThere are {len(events_t)} events starting { {0:'today',1:'tomorrow'}.get(REMIND_BEFORE_DAYS, f'in {REMIND_BEFORE_DAYS} days') }!"
-        for event, url in events_t:
+        head, lines = self.getReminderTemplate([event for event, _ in events_t], days)
+        string = head
+        for (_, url), (line, fallback_url) in zip(events_t, lines):
             if not url:
-                url = event.url  # Might still be an empty string, e.g. when emails do not have an url to the event
+                url = fallback_url  # Might still be an empty string, e.g. when emails do not have an url to the event
             if url:
-                # string += f"\n   • [{event.name} [{event.id}]:  {event.getDateRange()}]({url})"
-                string += f"\n   • **{event.name} [{event.id}]:  {event.getDateRange()}**\n     *<{url}>*"
+                string += f"{line}\n     *<{url}>*"
             else:
-                # string += f"\n   • **{event.name} [{event.id}]:  {event.getDateRange()}**"
-                string += f"\n   • **{event.name} [{event.id}]:  {event.getDateRange()}**"
+                string += line
         return string
 
-    def getEmbed(self, event: Event) -> discord.Embed:
-        """Returns discord.Embed object of given event
+    def getReminderTemplate(self, events:list[Event], days:int=REMIND_BEFORE_DAYS) -> tuple[str,list[tuple[str,str]]]:
+        """Returns the parts of a reminder that are the same in every channel.
+
+        Returns the head of the reminder, and for every event its line and the URL of the event.
+        Templates are cached by day and events (including their content), so channels that subscribed to the same topics share them.
+
+        Parameters
+        ------------
+        events: :class:`list`[:class:`Event`]
+            The currently happening events.
+        days: :class:`int`
+            How many days from today the events are starting.
+        """
+        today = datetime.datetime.now(tz=LOCAL_TZ).date()
+        key = (today, days, tuple((eventKey(event), event.getContentHash()) for event in events))
+        template = self.reminder_cache.get(key)
+        if template is None:
+            head = self.getReminderHeader(today)
+            head += f"\nThere are {len(events)} events starting { {0:'today',1:'tomorrow'}.get(days, f'in {days} days') }!"
+            lines = [(f"\n   • **{event.name} [{event.id}]:  {event.getDateRange()}**", event.url) for event in events]
+            template = (head, lines)
+            self.reminder_cache.put(key, template)
+        return template
+
+    def getEmbedDict(self, event: Event) -> dict:
+        """Returns the embed of given event as dictionary (see :meth:`discord.Embed.to_dict`).
+
+        The timestamp is left out, as it is not part of the event information shown to the user.
 
         Parameters
         ------------
         event: :class:`Event`
             The event.
         """
-        embed = discord.Embed(
-            title=event.name,
-            colour=discord.Colour(0xd69d37),
-            url=event.url,
-            description=f"```{event.description}```\nFind out more [here]({event.url}).",
-            timestamp=event.date_added if event.date_added else datetime.datetime.now(tz=pytz.timezone('Asia/Tokyo'))
-        )
+        data = {
+            'type': 'rich',
+            'title': event.name,
+            'color': 0xd69d37,
+            'url': event.url,
+            'description': f"```{event.description}```\nFind out more [here]({event.url}).",
+            'fields': [],
+        }
 
         # Set event image
         if event.img:
-            embed.set_image(url=event.img)
+            data['image'] = {'url': event.img}
 
         # Set author
-        embed.set_author(
-            name=os.getenv("BOT_NAME", 'Matsubo'),
-            url=os.getenv("BOT_URL", 'https://github.com/makokaz/matsubo'),
-            icon_url=os.getenv("BOT_ICON_URL", 'https://discord.com/assets/f9bb9c4af2b9c32a2c5ee0014661546d.png')
-        )
+        data['author'] = {
+            'name': os.getenv("BOT_NAME", 'Matsubo'),
+            'url': os.getenv("BOT_URL", 'https://github.com/makokaz/matsubo'),
+            'icon_url': os.getenv("BOT_ICON_URL", 'https://discord.com/assets/f9bb9c4af2b9c32a2c5ee0014661546d.png')
+        }
 
         # Set footer & thumbnail
         if event.source in SCRAP_SOURCES.keys():
-            embed.set_footer(
-                text=f"{SCRAP_SOURCES[event.source]['footer']} • {event.id}",
-                icon_url=SCRAP_SOURCES[event.source]['icon']
-            )
-            embed.set_thumbnail(url=SCRAP_SOURCES[event.source]['thumbnail'])
+            data['footer'] = {
+                'text': f"{SCRAP_SOURCES[event.source]['footer']} • {event.id}",
+                'icon_url': SCRAP_SOURCES[event.source]['icon']
+            }
+            data['thumbnail'] = {'url': SCRAP_SOURCES[event.source]['thumbnail']}
         else:
-            embed.set_footer(text=[event.source])
+            data['footer'] = {'text': str([event.source])}
 
+        fields = data['fields']
         # Add field: CANCELLED
         if event.status.lower() in ['cancelled', 'canceled']:
-            embed.add_field(name=':x: ***This event has been CANCELLED***', value='\u200B', inline=False)
+            fields.append({'name': ':x: ***This event has been CANCELLED***', 'value': '\u200B', 'inline': False})
         # Add field: Date
-        embed.add_field(name='\u200B', value=f':date: ***{event.getDateRange()}***', inline=True)
+        fields.append({'name': '\u200B', 'value': f':date: ***{event.getDateRange()}***', 'inline': True})
         # Add field: Time
-        embed.add_field(name='\u200B', value=f':clock10: ***{event.getTimeRange()}***', inline=True)
+        fields.append({'name': '\u200B', 'value': f':clock10: ***{event.getTimeRange()}***', 'inline': True})
         # Add field: Cost
-        embed.add_field(name='\u200B', value=f':coin: ***{event.cost}***', inline=True)
+        fields.append({'name': '\u200B', 'value': f':coin: ***{event.cost}***', 'inline': True})
         # Add field: Location
         loc_string = ''
         if event.status.lower() == 'online':
@@ -459,8 +1209,53 @@ class EventListener(commands.Cog):
         loc_string = loc_string.rstrip(', ')
         if loc_string == '':
             loc_string = '---'
-        embed.add_field(name='\u200B', value=f":round_pushpin: ***{loc_string}***", inline=True)
-        
+        fields.append({'name': '\u200B', 'value': f":round_pushpin: ***{loc_string}***", 'inline': True})
+
+        return data
+
+    def getEmbedFingerprint(self, data: dict) -> str:
+        """Returns a fingerprint of the content of an event embed.
+
+        Two events with the same fingerprint are rendered to the same embed, so a posted embed with an unchanged fingerprint does not need to be edited.
+
+        Parameters
+        ------------
+        data: :class:`dict`
+            The embed as returned by :meth:`getEmbedDict`.
+        """
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def renderEvent(self, event: Event) -> tuple[dict,str]:
+        """Returns the embed of given event as dictionary and its fingerprint.
+
+        Renders are cached by event and content hash, so an event posted to many channels is only rendered once per version.
+        The returned dictionary is shared and must not be modified.
+
+        Parameters
+        ------------
+        event: :class:`Event`
+            The event.
+        """
+        key = (eventKey(event), event.getContentHash())
+        rendered = self.render_cache.get(key)
+        if rendered is None:
+            data = self.getEmbedDict(event)
+            rendered = (data, self.getEmbedFingerprint(data))
+            self.render_cache.put(key, rendered)
+        return rendered
+
+    def getEmbed(self, event: Event, data: dict=None) -> discord.Embed:
+        """Returns discord.Embed object of given event
+
+        Parameters
+        ------------
+        event: :class:`Event`
+            The event.
+        data: Optional[:class:`dict`]
+            The embed as returned by :meth:`getEmbedDict`, if already rendered.
+        """
+        embed = discord.Embed.from_dict(data if data is not None else self.renderEvent(event)[0])
+        embed.timestamp = event.date_added if event.date_added else datetime.datetime.now(tz=pytz.timezone('Asia/Tokyo'))
         return embed
 
     def embedsAreEqual(self, embed1:discord.Embed, embed2:discord.Embed) -> bool:
@@ -507,6 +1302,9 @@ class EventListener(commands.Cog):
     @utils.log_call
     async def cmd_scrap(self, ctx):
         """Searches the web for new events, and posts updates to all subscibed channels."""
+        if self.scrap_lock.locked():
+            await ctx.send(f"I'm already scanning the web, please wait a moment :coffee:")
+            return
         self.countingSheeps.cancel()
 
         await ctx.send(f"Scanning the web... this might take a while :coffee:")
@@ -527,8 +1325,9 @@ class EventListener(commands.Cog):
         topics = set(topic.capitalize() if topic.capitalize() in TOPICS else None for topic in topics)
         topics.discard(None)
         if len(topics):
-            topics_all = topics | db.discordDB.getChannelVisibility(channel.id)
-            db.discordDB.updateChannel(channel.id, list(topics_all))
+            topics_all = topics | await db.asyncDiscordDB.getChannelVisibility(channel.id)
+            await db.asyncDiscordDB.updateChannel(channel.id, list(topics_all))
+            await self.loadSchedules([channel.id])
             await ctx.send(f"Subscribed the following new topics for channel <#{channel.id}>: {topics}\nAll subscribed topics of this channel: {topics_all}")
         else:
             await ctx.send(f"Either I don't know that topic, or you already subscribed to that topic!")
@@ -546,23 +1345,77 @@ class EventListener(commands.Cog):
             if not topics:
                 await ctx.send(f"I don't know of that topic... Did you misspell it?")
                 return
-            topics_new = db.discordDB.getChannelVisibility(channel.id) - topics
+            topics_new = await db.asyncDiscordDB.getChannelVisibility(channel.id) - topics
         else:
             topics_new = None
         if topics_new:
-            db.discordDB.updateChannel(channel.id, list(topics_new))
+            await db.asyncDiscordDB.updateChannel(channel.id, list(topics_new))
             await ctx.send(f"Unsubscribed the following topics from channel <#{channel.id}>: {topics}\nAll subscribed topics of this channel: {topics_new}")
         else:
-            db.discordDB.removeChannel(channel.id)
+            await db.asyncDiscordDB.removeChannel(channel.id)
+            await self.loadSchedules([channel.id])
             await ctx.send(f"Unsubscribed channel <#{channel.id}> from all topics")
 
+    @commands.command(name='schedule')
+    @commands.has_permissions(administrator=True)
+    @utils.log_call
+    async def cmd_schedule(self, ctx, channel:typing.Optional[commands.TextChannelConverter]=None, kind:str=None, *settings):
+        """Shows or sets when new events are posted to / reminded in the channel, and how many days ahead.
+
+        `schedule [channel]` shows the schedule,
+        `schedule [channel] post|remind <min> <hour> <day> <month> <weekday> [days ahead]` sets the times (CRON format),
+        `schedule [channel] post|remind default` resets them to the default.
+        Weekdays count from 0 = Monday to 6 = Sunday (not 0 = Sunday as in UNIX cron); better use their names, e.g. `0 20 * * sat,sun`.
+        """
+        if not channel:
+            channel = ctx.channel
+        if kind is None:
+            schedules = await db.asyncDiscordDB.getSchedules([channel.id])
+            if channel.id not in schedules:
+                await ctx.send(f"<#{channel.id}> has currently no subscribtions")
+                return
+            settings = schedules[channel.id]
+            string = '\n'.join([
+                f"`-` Posts: `{settings['post_times'] or POST_TIMES}`, {settings['post_before_days'] if settings['post_before_days'] is not None else POST_BEFORE_DAYS} days ahead (next: {self.getNextRunTime('post', channel.id)})",
+                f"`-` Reminders: `{settings['remind_times'] or REMIND_TIMES}`, {settings['remind_before_days'] if settings['remind_before_days'] is not None else REMIND_BEFORE_DAYS} days ahead (next: {self.getNextRunTime('remind', channel.id)})",
+            ])
+            await ctx.send(f"Schedule of <#{channel.id}>:\n{string}")
+            return
+
+        kind = kind.lower()
+        if kind not in ('post', 'remind'):
+            await ctx.send(f"I can only schedule `post` or `remind`... Did you misspell it?")
+            return
+        if list(settings) == ['default']:
+            times, days = None, None
+        elif len(settings) in (5, 6):
+            times = ' '.join(settings[:5])
+            try:
+                self.schedule.getTrigger(times)
+                days = int(settings[5]) if len(settings) == 6 else None
+            except ValueError as e:
+                await ctx.send(f"I don't understand that schedule :thinking:\n{e}")
+                return
+            if days is not None and not 0 <= days <= 365:
+                await ctx.send(f"Please give between 0 and 365 days ahead")
+                return
+        else:
+            await ctx.send(f"Please give the times in CRON format, e.g. `0 9 * * *` for every day at 9:00, or `0 20 * * sat,sun` for weekends at 20:00")
+            return
+
+        if not await db.asyncDiscordDB.setSchedule(channel.id, **{f'{kind}_times': times, f'{kind}_before_days': days}):
+            await ctx.send(f"<#{channel.id}> has currently no subscribtions, please subscribe first")
+            return
+        await self.loadSchedules([channel.id])
+        await ctx.send(f"Set the {kind} schedule of <#{channel.id}> :thumbsup:\nNext run: {self.getNextRunTime(kind, channel.id)}")
+
     @commands.command(name='getsubscribedtopics')
     @utils.log_call
     async def cmd_getSubscribedTopics(self, ctx, channel:commands.TextChannelConverter=None):
         """Returns topics this channel is subscribed to."""
         if not channel:
             channel = ctx.channel
-        topics_all = db.discordDB.getChannelVisibility(channel.id)
+        topics_all = await db.asyncDiscordDB.getChannelVisibility(channel.id)
         if topics_all:
             await ctx.send(f"All subscribed topics of <#{channel.id}>: {topics_all}")
         else:
@@ -586,14 +1439,38 @@ class EventListener(commands.Cog):
     @utils.log_call
     async def cmd_recreateTable(self, ctx, *tables):
         """Recreates given tables."""
-        tables = set({'discord':db.discordDB, 'event':db.eventDB}.get(table, None) for table in tables)
+        tables = set({'discord':db.discordDB, 'event':db.eventDB, 'messages':db.messageDB, 'reminders':db.reminderDB, 'outbox':db.outboxDB}.get(table, None) for table in tables)
         tables.discard(None)
         if not tables:
             await ctx.send(f"... either I don't know this table, or I don't know any table by that name :thinking:\nPlease specify it more.")
             return
         db.createTables(*tables, recreate=True)
+        if db.eventDB in tables:
+            self.event_store.clear()
+        if db.messageDB in tables and db.discordDB not in tables:
+            await db.asyncDiscordDB.resetWatermarks()  # Posted events are no longer known -> check all events again
         await ctx.send(f"Recreated the following tables :thumbsup:\n{[str(table) for table in tables]}")
 
+    @commands.command(name='dbstats')
+    @commands.has_permissions(administrator=True)
+    @utils.log_call
+    async def cmd_dbStats(self, ctx):
+        """Returns usage statistics of the database connection pool."""
+        stats = db.eventDB.connector.pool.getStats()
+        string = '\n'.join(f"`-` {key}: {round(value, 4) if isinstance(value, float) else value}" for key, value in stats.items())
+        await ctx.send(f"Database connection pool:\n{string}")
+
+    @commands.command(name='queuestats')
+    @commands.has_permissions(administrator=True)
+    @utils.log_call
+    async def cmd_queueStats(self, ctx):
+        """Returns usage statistics of the outgoing message queue."""
+        stats = self.send_queue.getStats()
+        string = '\n'.join(f"`-` {key}: {round(value, 4) if isinstance(value, float) else value}" for key, value in stats.items())
+        outbox = await db.asyncOutboxDB.getStats()
+        string += '\n'.join(['\nOutbox:'] + [f"`-` {status}: {count}" for status, count in outbox.items()])
+        await ctx.send(f"Outgoing message queue:\n{string}")
+
 
 def setup(bot):
     bot.add_cog(EventListener(bot))
@@ -0,0 +1,161 @@
+"""Card extractor
+
+Extracts the event cards of Tokyo Cheapo and Japan Cheapo pages.
+Only the event cards of a page are parsed, and all fields of a card are collected in a single walk over its tags.
+
+Run as a script to benchmark it against the previous extraction on saved pages (or urls):
+    python -m cogs.utils.card_extractor PAGE.html [PAGE.html ...]
+"""
+
+import re
+from bs4 import BeautifulSoup as soup, SoupStrainer
+from bs4.builder import builder_registry
+
+# Use the faster lxml parser if it is installed
+PARSER = 'lxml' if builder_registry.lookup('lxml') else 'html.parser'
+
+# Fields every event card has. A card without them means the markup of the site has changed
+REQUIRED_FIELDS = ('post_id', 'date', 'name', 'url')
+
+# Class attribute of an event card. Like the previous extraction, only articles with exactly this class are cards
+CARD_CLASS = 'article card card--event'
+
+# Only event cards are parsed, the rest of the page is skipped.
+# Note: The class is matched with a regex, since depending on the bs4 version the strainer sees the split or the unsplit class attribute.
+CARD_STRAINER = SoupStrainer('article', class_=re.compile(f'^{re.escape(CARD_CLASS)}$'))
+
+
+def extractCards(page_html, parser: str = PARSER) -> list[dict]:
+    """Returns the raw fields of all event cards in a page, in the order they appear.
+
+    Parameters
+    ----------
+    page_html: :class:`bytes` or :class:`str`
+        The html-code of the page.
+    parser: :class:`str`
+        The parser backend used by BeautifulSoup.
+    """
+    page = soup(page_html, parser, parse_only=CARD_STRAINER)
+    return [extractCard(card) for card in page.find_all('article', class_=CARD_CLASS)]
+
+def extractCard(card) -> dict:
+    """Returns the raw fields of an event card.
+
+    Walks over all tags of the card once. For fields that appear only once, the first match wins.
+    The keys are:
+    - post_id, date, name, url, description, img: :class:`str` (`img` may be `None`)
+    - time, location, cost, status: :class:`list`[:class:`str`]
+
+    Raises :class:`ValueError` if one of `REQUIRED_FIELDS` is missing, like the previous extraction did.
+    """
+    fields = {'post_id': None, 'date': None, 'name': None, 'url': None, 'description': None, 'img': None,
+              'time': [], 'location': [], 'cost': [], 'status': []}
+    image_found = False
+    for tag in card.find_all(True):
+        classes = tag.get('class') or ()
+        if fields['post_id'] is None and tag.has_attr('data-post-id'):
+            fields['post_id'] = tag['data-post-id'].strip()
+        if tag.name == 'div':
+            title = tag.get('title')
+            if title == 'Start/end time':
+                fields['time'].append(tag.parent.span.text.strip())
+            elif title == 'Entry':
+                fields['cost'].append(tag.parent.text.strip())
+            if fields['date'] is None and 'card--event__date-box' in classes:
+                fields['date'] = tag.div.text.strip().replace("\n", " ")
+            if 'event-status' in classes:
+                fields['status'].append(tag.text.strip().lower())
+        elif tag.name == 'h3':
+            if fields['name'] is None and 'card__title' in classes:
+                fields['name'] = tag.text.strip()
+                fields['url'] = tag.a['href']
+        elif tag.name == 'p':
+            if fields['description'] is None and 'card__excerpt' in classes:
+                fields['description'] = tag.text.strip()
+        elif tag.name == 'a':
+            if not image_found and 'card__image' in classes:
+                image_found = True
+                if tag.img is not None:
+                    fields['img'] = tag.img['data-src']
+            if 'location' in classes:
+                fields['location'].append(tag.text)
+    missing = [key for key in REQUIRED_FIELDS if fields[key] is None]
+    if missing:
+        raise ValueError(f"Event card without {', '.join(missing)}: {str(card)[:200]}")
+    if fields['description'] is None:
+        fields['description'] = ''
+    return fields
+
+
+def extractCardsLegacy(page_html) -> list[dict]:
+    """Reference implementation: The extraction used before, with one `findAll` per field. Only used for benchmarking."""
+    page = soup(page_html, "html.parser")
+    cards = []
+    for event_ in page.findAll("article",{"class":"article card card--event"}):
+        img = event_.findAll("a",  class_="card__image")[0].img
+        cards.append({
+            'post_id': event_.findAll(attrs={"data-post-id" : True})[0]['data-post-id'].strip(),
+            'date': event_.findAll("div", class_="card--event__date-box")[0].div.text.strip().replace("\n"," "),
+            'name': event_.findAll("h3", class_="card__title")[0].text.strip(),
+            'url': event_.findAll("h3", class_="card__title")[0].a['href'],
+            'description': event_.findAll("p", class_="card__excerpt")[0].text.strip(),
+            'img': img['data-src'] if img is not None else None,
+            'time': [t.parent.span.text.strip() for t in event_.findAll("div", title="Start/end time")],
+            'location': [loc.text for loc in event_.findAll("a", class_="location")],
+            'cost': [cost.parent.text.strip() for cost in event_.findAll("div", title="Entry")],
+            'status': [stat.text.strip().lower() for stat in event_.findAll("div", class_="event-status")],
+        })
+    return cards
+
+
+# Articles that look like event cards, but are not cards to the previous extraction (class is not exactly `CARD_CLASS`)
+NEAR_MISS_PAGE = '''<html><body>
+<article class="article card card--event"><div data-post-id="1"></div><div class="card--event__date-box"><div>Oct 18</div></div>
+<h3 class="card__title"><a href="https://example.com/1">Card</a></h3><p class="card__excerpt">Text</p><a class="card__image"></a></article>
+<article class="article card card--event card--featured"><div data-post-id="2"></div></article>
+<article class="card card--event"><div data-post-id="3"></div></article>
+<article class="card--event article card"><div data-post-id="4"></div></article>
+</body></html>'''
+
+def checkCardMatching() -> bool:
+    """Returns whether the new extraction finds the same cards as the previous one on `NEAR_MISS_PAGE` (and prints the result)"""
+    reference = [card['post_id'] for card in extractCardsLegacy(NEAR_MISS_PAGE)]
+    for parser in sorted({'html.parser', PARSER}):
+        found = [card['post_id'] for card in extractCards(NEAR_MISS_PAGE, parser)]
+        if found != reference:
+            print(f"  > strainer ({parser}) !! matches cards {found}, legacy extraction matches {reference}")
+            return False
+    print(f"  > Card matching: same cards as legacy extraction ({', '.join(reference)})")
+    return True
+
+def benchmark(pages: list[bytes], repeat: int = 5):
+    """Prints the time needed by the previous and the new extraction for the given pages"""
+    import timeit
+    checkCardMatching()
+    candidates = [('legacy (html.parser, findAll)', extractCardsLegacy)]
+    candidates += [(f"strainer ({parser})", lambda page, parser=parser: extractCards(page, parser)) for parser in sorted({'html.parser', PARSER})]
+    reference = [extractCardsLegacy(page) for page in pages]
+    print(f"Benchmark: {len(pages)} pages, {sum(len(cards) for cards in reference)} event cards, best of {repeat} runs")
+    for name, extract in candidates:
+        if [extract(page) for page in pages] != reference:
+            print(f"  > {name:32s} !! extracted cards differ from legacy extraction")
+        seconds = min(timeit.repeat(lambda: [extract(page) for page in pages], number=1, repeat=repeat))
+        print(f"  > {name:32s} {seconds*1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    import sys
+    from urllib.request import urlopen
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    pages = []
+    for arg in args:
+        if arg.startswith(('http://', 'https://')):
+            with urlopen(arg) as uClient:
+                pages.append(uClient.read())
+        else:
+            with open(arg, 'rb') as f:
+                pages.append(f.read())
+    benchmark(pages)
@@ -5,10 +5,18 @@ Simple interface to save and load event data of a postgres database.
 
 import os
 import sys
+import time
+import asyncio
+import threading
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import datetime
 
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 from .event import Event
 from . import utils
 
@@ -24,6 +32,177 @@ else:  # Default
     DB_NAME = os.getenv("DB_NAME")
 print(f"DATABASE-INFO: HOST={DB_HOST},PORT={DB_PORT},USER={DB_USER},PW={'*'*len(DB_PW)},NAME={DB_NAME}")
 
+# Connection pool: Minimum number of connections kept open, and maximum number of connections open at the same time
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 5))
+# How long to wait (in seconds) for a free connection when all connections are in use
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Connections idle for longer than this (in seconds) are checked with `SELECT 1` before they are handed out
+DB_POOL_HEALTHCHECK_AFTER = float(os.getenv("DB_POOL_HEALTHCHECK_AFTER", 60))
+# Connections above `DB_POOL_MIN` idle for longer than this (in seconds) are closed
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))
+# Time zone of every database session: dates and times of events are read and written in Japan time
+DB_TIMEZONE = 'Asia/Tokyo'
+
+
+class DBPool():
+    """
+    Thread-safe pool of database connections.
+
+    `minconn` connections are opened when the pool is created, further ones on demand, at most `maxconn` at the same time.
+    If all of them are in use, `getconn()` waits up to `timeout` seconds for a connection to be returned.
+    Idle connections are health-checked before reuse, and closed when idle for too long (but `minconn` are always kept).
+    """
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 healthcheck_after=DB_POOL_HEALTHCHECK_AFTER, max_idle=DB_POOL_MAX_IDLE, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = max(maxconn, 1)
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self.max_idle = max_idle
+        self.connect_kwargs = connect_kwargs
+        self.cond = threading.Condition()
+        self.idle = []  # list of (connection, time when it was returned)
+        self.checked_out = {}  # id(connection) -> time when it was checked out
+        self.size = 0  # number of open connections (idle + checked out)
+        self.stats = {
+            'checkouts': 0,
+            'waits': 0,  # checkouts that had to wait for a free connection
+            'timeouts': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'checkout_time': 0.0,
+            'max_checkout_time': 0.0,
+            'opened': 0,
+            'closed': 0,
+            'failed_healthchecks': 0,
+        }
+        # Open the minimum connections up front, so the first queries do not wait for a connection to be established
+        for _ in range(min(self.minconn, self.maxconn)):
+            self.idle.append((psycopg2.connect(**self.connect_kwargs), time.monotonic()))
+            self.size += 1
+            self.stats['opened'] += 1
+    def __str__(self):
+        return f"DBPool({self.connect_kwargs.get('host')}:{self.connect_kwargs.get('port')}/{self.connect_kwargs.get('database')})"
+    def getconn(self):
+        """Returns a connection of the pool. Raises :class:`psycopg2.pool.PoolError` if none became free in time."""
+        start = time.monotonic()
+        waited = False
+        with self.cond:
+            self.prune()
+            while True:
+                if self.idle:
+                    conn, returned = self.idle.pop()
+                    break
+                if self.size < self.maxconn:
+                    conn, returned = None, None
+                    self.size += 1
+                    break
+                remaining = start + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise psycopg2.pool.PoolError(f"{self}: no free connection within {self.timeout}s")
+                waited = True
+                self.cond.wait(remaining)
+        try:
+            if conn is not None and not self.isHealthy(conn, returned):
+                self.stats['failed_healthchecks'] += 1
+                self.close(conn)
+                conn = None
+            if conn is None:
+                conn = psycopg2.connect(**self.connect_kwargs)
+                self.stats['opened'] += 1
+        except Exception:
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+            raise
+        now = time.monotonic()
+        with self.cond:
+            self.checked_out[id(conn)] = now
+            self.stats['checkouts'] += 1
+            self.stats['waits'] += waited
+            self.stats['wait_time'] += now - start
+            self.stats['max_wait_time'] = max(self.stats['max_wait_time'], now - start)
+        return conn
+    def putconn(self, conn, close=False):
+        """Returns connection to the pool. Broken connections (or if `close` is set) are closed instead."""
+        now = time.monotonic()
+        with self.cond:
+            checkout_time = now - self.checked_out.pop(id(conn), now)
+            self.stats['checkout_time'] += checkout_time
+            self.stats['max_checkout_time'] = max(self.stats['max_checkout_time'], checkout_time)
+            if close or conn.closed:
+                self.size -= 1
+                self.close(conn)
+            else:
+                self.idle.append((conn, now))
+            self.cond.notify()
+    def isHealthy(self, conn, returned) -> bool:
+        """Checks if idle connection can still be used"""
+        if conn.closed:
+            return False
+        if time.monotonic() - returned < self.healthcheck_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    def close(self, conn):
+        """Closes connection without returning it to the pool"""
+        self.stats['closed'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+    def prune(self):
+        """Closes connections (above `minconn`) that have been idle for too long. Must be called with `self.cond` held."""
+        now = time.monotonic()
+        while len(self.idle) > self.minconn and now - self.idle[0][1] > self.max_idle:
+            conn, _ = self.idle.pop(0)
+            self.size -= 1
+            self.close(conn)
+    def closeAll(self):
+        """Closes all idle connections. Connections in use are closed when they are returned."""
+        with self.cond:
+            for conn, _ in self.idle:
+                self.size -= 1
+                self.close(conn)
+            self.idle = []
+    def getStats(self) -> dict:
+        """Returns usage statistics of the pool (times in seconds)"""
+        with self.cond:
+            stats = dict(self.stats)
+            stats['size'] = self.size
+            stats['idle'] = len(self.idle)
+            stats['in_use'] = len(self.checked_out)
+        stats['avg_wait_time'] = stats['wait_time'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        returned = stats['checkouts'] - stats['in_use']
+        stats['avg_checkout_time'] = stats['checkout_time'] / returned if returned > 0 else 0.0
+        return stats
+
+# One pool per database, shared by all connectors
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+def getPool(host=DB_HOST,port=DB_PORT,user=DB_USER,password=DB_PW,database=DB_NAME) -> DBPool:
+    """Returns the connection pool of the given database. Creates it if it does not exist yet."""
+    key = (host, port, user, password, database)
+    with POOLS_LOCK:
+        if key not in POOLS:
+            # The time zone is set once per session, instead of with every query
+            POOLS[key] = DBPool(host=host,port=port,user=user,password=password,database=database,options=f'-c timezone={DB_TIMEZONE}')
+        return POOLS[key]
+
+def closePools():
+    """Closes all idle connections of all pools."""
+    with POOLS_LOCK:
+        for pool in POOLS.values():
+            pool.closeAll()
+
 
 class DBConnector():
     """
@@ -32,6 +211,10 @@ class DBConnector():
 
     with DBConnector() as conn:
         # do something
+
+    Connections are borrowed from the pool of the database (see `getPool`) and returned on exit.
+    The transaction is committed on success and rolled back on an exception.
+    Connections are tracked per thread, so the same connector can be used by several threads at once.
     """
     def __init__(self,host=DB_HOST,port=DB_PORT,user=DB_USER,password=DB_PW,database=DB_NAME):
         self.host = host
@@ -39,14 +222,80 @@ class DBConnector():
         self.user = user
         self.password = password
         self.database = database
+        self.local = threading.local()
+    @property
+    def pool(self) -> DBPool:
+        return getPool(host=self.host,port=self.port,user=self.user,password=self.password,database=self.database)
     def __enter__(self):
-        self.conn = psycopg2.connect(host=self.host,port=self.port,user=self.user,password=self.password,database=self.database)
-        self.cur = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        return self.cur
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        conn = self.pool.getconn()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        self.local.stack.append((conn, cur))
+        return cur
     def __exit__(self, type, value, traceback):
-        self.conn.commit()
-        self.cur.close()
-        self.conn.close()
+        conn, cur = self.local.stack.pop()
+        broken = False
+        try:
+            if type is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        except psycopg2.Error:
+            broken = True
+            if type is None:
+                raise
+        finally:
+            if not conn.closed:
+                cur.close()
+            self.pool.putconn(conn, close=broken)
+
+# Number of events sent to the database per statement by `DBEvent.insertEvents`
+INSERT_BATCH_SIZE = 500
+
+# Columns of the events table that are set from an :class:`Event` (`date_added` is set by the database)
+EVENT_COLUMNS = ('id', 'name', 'description', 'url', 'img', 'date_start', 'date_end', 'date_fuzzy', 'time_start', 'time_end',
+                 'location', 'cost', 'status', 'other', 'visibility', 'source')
+
+# Columns that are stored as NULL if the event leaves them empty
+NULLABLE_EVENT_COLUMNS = ('date_end', 'date_fuzzy', 'time_start', 'time_end', 'other')
+
+# Date range of an event in SQL (inclusive). Events without end date last one day; ends before the start are ignored.
+# Format it with a prefix for the column names, e.g. `EVENT_DATERANGE.format('e.')`.
+EVENT_DATERANGE = "daterange({0}date_start, GREATEST({0}date_start, COALESCE({0}date_end, {0}date_start)), '[]')"
+
+# Modes of `DBEvent.getEvents`, how events are matched against a date duration
+EVENT_QUERY_MODES = ('within', 'starting', 'overlap')
+
+def dateConditions(from_date:datetime.datetime.date=None, until_date:datetime.datetime.date=None, mode:str='within', prefix:str='') -> tuple[list[str], tuple]:
+    """Returns SQL conditions (and their data) that match events with a date duration (see :meth:`DBEvent.getEvents` for `mode`).
+
+    `prefix` is put in front of the column names, e.g. the table alias 'e.'.
+    """
+    if mode not in EVENT_QUERY_MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {EVENT_QUERY_MODES}")
+    conditions = []
+    data = ()
+    if mode == 'overlap':
+        if from_date or until_date:
+            conditions.append(f"{EVENT_DATERANGE.format(prefix)} && daterange(%s, %s, '[]')")
+            data += (from_date, until_date)
+        return conditions, data
+    if from_date:
+        conditions.append(f"{prefix}date_start >= %s")
+        data += (from_date,)
+    if until_date:
+        conditions.append(f"{prefix}date_start <= %s" if mode == 'starting' else f"{prefix}date_end <= %s")
+        data += (until_date,)
+    return conditions, data
+
+def eventToRow(event:Event) -> tuple:
+    """Returns the values of `EVENT_COLUMNS` of an event, ready to be passed as query parameters"""
+    return tuple((getattr(event, column) or None) if column in NULLABLE_EVENT_COLUMNS else getattr(event, column) for column in EVENT_COLUMNS)
+
+def eventFromRow(row) -> Event:
+    """Returns event of a row of the events table. The event is frozen, as it may be shared by several channels."""
+    return Event.fromRow(row, frozen=True)
 
 class DBEvent():
     """
@@ -78,71 +327,202 @@ class DBEvent():
                     visibility VARCHAR,
                     source VARCHAR,
                     date_added TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT current_timestamp,
+                    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT current_timestamp,
+                    content_hash VARCHAR,
                     CONSTRAINT PK_event PRIMARY KEY (id, date_start)
                 );""") #BUG: current_timestamp will use timezone of PC, but it should use Japan timezone!
+        self.createIndexes()
+    def createIndexes(self):
+        """Creates indexes if not present.
+
+        - (visibility, date_start, date_end): for events of given topics that start (or lie) within a date duration
+        - GiST on the date range of the event: for events that overlap a date duration
+        """
+        with self.connector as cur:
+            cur.execute(f"""CREATE INDEX IF NOT EXISTS {self.TABLE}_visibility_date_idx ON {self.TABLE} (visibility, date_start, date_end);
+                CREATE INDEX IF NOT EXISTS {self.TABLE}_daterange_idx ON {self.TABLE} USING GIST ({EVENT_DATERANGE.format('')});""")
+    def migrateTable(self):
+        """Updates an existing table to the current schema."""
+        with self.connector as cur:
+            # Existing events count as last changed when they were added, and get their content hash with the next scrap
+            cur.execute(f"""ALTER TABLE {self.TABLE} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE;
+                UPDATE {self.TABLE} SET updated_at = date_added WHERE updated_at IS NULL;
+                ALTER TABLE {self.TABLE} ALTER COLUMN updated_at SET DEFAULT current_timestamp, ALTER COLUMN updated_at SET NOT NULL;
+                ALTER TABLE {self.TABLE} ADD COLUMN IF NOT EXISTS content_hash VARCHAR;""")
+        self.createIndexes()
     def printTable(self):
         """Print all records in database"""
         with self.connector as cur:
             cur.execute(f"SELECT * FROM events;")
             print(cur.fetchall())
-    def getEvents(self, visibility:list[str]=None, from_date:datetime.datetime.date=None, until_date:datetime.datetime.date=None) -> list[Event]:
-        """Return events of given visibility, in the given date duration"""
+    def getEvents(self, visibility:list[str]=None, from_date:datetime.datetime.date=None, until_date:datetime.datetime.date=None, mode:str='within') -> list[Event]:
+        """Return events of given visibility, in the given date duration
+
+        `mode` defines which events count as being in the date duration:
+        - 'within': events that start and end in it
+        - 'starting': events that start in it (no matter when they end)
+        - 'overlap': events that take place on at least one day of it
+        """
         with self.connector as cur:
             # Construct query and data based on arguments given
-            query = f"set time zone 'Asia/Tokyo'; SELECT * FROM {self.TABLE} WHERE "
-            data = ()
+            conditions, data = dateConditions(from_date, until_date, mode)
             if visibility:
-                query += f"(visibility = ANY(%s)) AND "
-                data += (visibility,)
-            if from_date:
-                query += f"date_start >= %s AND "
-                data += (from_date,)
-            if until_date:
-                query += f"date_end <= %s AND "
-                data += (until_date,)
-            query = query.rstrip(' AND ').rstrip(' WHERE ')
+                conditions.insert(0, "(visibility = ANY(%s))")
+                data = (visibility,) + data
+            query = f"SELECT * FROM {self.TABLE}"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
             query += f";"
             # Execute query
             cur.execute(query, data)
             # Construct Event objects and return them as a list
-            events = []
+            return [eventFromRow(ret) for ret in cur]
+    def getEventsByKeys(self, keys:list[tuple]) -> list[Event]:
+        """Return the events of the given keys (id, date_start), e.g. the events a scrap has changed"""
+        if not keys:
+            return []
+        with self.connector as cur:
+            cur.execute(f"""SELECT e.* FROM {self.TABLE} e JOIN unnest(%s::varchar[], %s::date[]) AS k(id, date_start) USING (id, date_start);""",
+                        ([key[0] for key in keys], [key[1] for key in keys]))
+            return [eventFromRow(ret) for ret in cur]
+    def getEventsByChannel(self, channel_ids:list[int]=None, from_date:datetime.datetime.date=None, until_date:datetime.datetime.date=None, mode:str='within') -> dict[int, list[Event]]:
+        """Return events of every subscribed channel (or only of the given channels), in the given date duration
+
+        The events are matched with the visibility of each channel in a single query (see :meth:`getEvents` for `mode`).
+        Returns a dictionary channel_id -> events. Subscribed channels without events get an empty list.
+        An event subscribed by several channels is the same :class:`Event` object in all lists.
+        """
+        with self.connector as cur:
+            conditions, data = dateConditions(from_date, until_date, mode, prefix='e.')
+            query = f"""SELECT d.channel_id, e.* FROM {DBDiscord.TABLE} d
+                        LEFT JOIN {self.TABLE} e ON {' AND '.join(['e.visibility = ANY(d.visibility)'] + conditions)}"""
+            if channel_ids is not None:
+                query += " WHERE d.channel_id = ANY(%s)"
+                data += (list(channel_ids),)
+            query += " ORDER BY d.channel_id, e.date_start, e.id;"
+            cur.execute(query, data)
+            channel_events = {}
+            events = {}  # (id, date_start) -> Event, so events shared by channels are only created once
             for ret in cur:
-                event = Event(id=ret[0], name=ret[1], description=ret[2], url=ret[3], img=ret[4], date_start=ret[5], date_end=ret[6],
-                                date_fuzzy=ret[7], time_start=ret[8], time_end=ret[9], location=ret[10], cost=ret[11], status=ret[12],
-                                other=ret[13], visibility=ret[14], source=ret[15], date_added=ret[16])
-                events.append(event)
-            return events
-    def insertEvents(self, events):
-        """Inserts events into database"""
-        with self.connector as cur:
-            query = f"""set time zone 'Asia/Tokyo'; INSERT INTO events (id, name, description, url, img, date_start, date_end, date_fuzzy, time_start, time_end, location, cost, status, other, visibility, source) VALUES """
-            for event in events:
-                id = event.id
-                name = event.name
-                description = event.description.replace("'","''")
-                url = event.url
-                img = event.img
-                date_start = event.date_start if event.date_start else 'NULL'
-                date_end = event.date_end if event.date_end else 'NULL'
-                date_fuzzy = event.date_fuzzy if event.date_fuzzy else 'NULL'
-                time_start = event.time_start if event.time_start else 'NULL'
-                time_end = event.time_end if event.time_end else 'NULL'
-                location = event.location
-                cost = event.cost
-                status = event.status
-                other = event.other if event.other else 'NULL'
-                visibility = event.visibility
-                source = event.source
-                query += f"('{id}', '{name}', '{description}', '{url}', '{img}', '{date_start}', '{date_end}', '{date_fuzzy}', '{time_start}', '{time_end}', '{location}', '{cost}', '{status}', '{other}', '{visibility}', '{source}'),"
-            query = query.strip(',') + ' ON CONFLICT ON CONSTRAINT PK_event DO UPDATE SET name=EXCLUDED.name, description=EXCLUDED.description, url=EXCLUDED.url, img=EXCLUDED.img, date_end=EXCLUDED.date_end, date_fuzzy=EXCLUDED.date_fuzzy, time_start=EXCLUDED.time_start, time_end=EXCLUDED.time_end, location=EXCLUDED.location, cost=EXCLUDED.cost, status=EXCLUDED.status, other=EXCLUDED.other, visibility=EXCLUDED.visibility, source=EXCLUDED.source;'
-            query = query.replace("'NULL'", "NULL")
-            cur.execute(query)
+                channel_events.setdefault(ret['channel_id'], [])
+                if ret['id'] is None:  # Channel without events
+                    continue
+                key = (ret['id'], ret['date_start'])
+                if key not in events:
+                    events[key] = eventFromRow(ret)
+                channel_events[ret['channel_id']].append(events[key])
+            return channel_events
+    def getEventsByTopics(self, channel_ids:list[int]=None, from_date:datetime.datetime.date=None, until_date:datetime.datetime.date=None, mode:str='within') -> dict[tuple, tuple[list[int], list[Event]]]:
+        """Return events of every distinct set of subscribed topics (or only of the sets of the given channels), in the given date duration
+
+        Channels that subscribed to the same topics get the same events, so the events of each set are only fetched once (see :meth:`getEvents` for `mode`).
+        Returns a dictionary topics -> (channel_ids, events), the topics being a sorted tuple.
+        """
+        with self.connector as cur:
+            conditions, data = dateConditions(from_date, until_date, mode, prefix='e.')
+            where = ""
+            if channel_ids is not None:
+                where = "WHERE channel_id = ANY(%s)"
+                data = (list(channel_ids),) + data
+            query = f"""WITH t AS (
+                            SELECT ARRAY(SELECT DISTINCT unnest(visibility) ORDER BY 1) AS topics, array_agg(channel_id ORDER BY channel_id) AS channel_ids
+                            FROM {DBDiscord.TABLE} {where} GROUP BY 1
+                        )
+                        SELECT t.topics, t.channel_ids, e.* FROM t
+                        LEFT JOIN {self.TABLE} e ON {' AND '.join(['e.visibility = ANY(t.topics)'] + conditions)}
+                        ORDER BY t.topics, e.date_start, e.id;"""
+            cur.execute(query, data)
+            topic_events = {}
+            events = {}  # (id, date_start) -> Event, so events shared by topic sets are only created once
+            for ret in cur:
+                _, group = topic_events.setdefault(tuple(ret['topics']), (ret['channel_ids'], []))
+                if ret['id'] is None:  # Topics without events
+                    continue
+                key = (ret['id'], ret['date_start'])
+                if key not in events:
+                    events[key] = eventFromRow(ret)
+                group.append(events[key])
+            return topic_events
+    def getContentHashes(self, keys:list[tuple]) -> dict[tuple, str]:
+        """Returns the stored content hashes of the given keys (id, date_start) that exist: (id, date_start) -> content hash (``None`` if not hashed yet)"""
+        if not keys:
+            return {}
+        with self.connector as cur:
+            cur.execute(f"""SELECT e.id, e.date_start, e.content_hash FROM {self.TABLE} e
+                        JOIN unnest(%s::varchar[], %s::date[]) AS k(id, date_start) USING (id, date_start);""",
+                        ([key[0] for key in keys], [key[1] for key in keys]))
+            return {(ret[0], ret[1]): ret[2] for ret in cur}
+    def getUpcomingKeys(self, sources:dict[str,datetime.datetime.date], from_date:datetime.datetime.date) -> set[tuple]:
+        """Returns the keys (id, date_start) of the events that have not ended before `from_date`, of the given sources: source -> the last start date it covers"""
+        if not sources:
+            return set()
+        with self.connector as cur:
+            conditions, data = dateConditions(from_date, None, 'overlap', prefix='e.')
+            cur.execute(f"""SELECT e.id, e.date_start FROM {self.TABLE} e JOIN unnest(%s::varchar[], %s::date[]) AS s(source, until_date) USING (source)
+                        WHERE e.date_start <= s.until_date AND {' AND '.join(conditions)};""",
+                        (list(sources), list(sources.values())) + data)
+            return {(ret[0], ret[1]) for ret in cur}
+    def insertEvents(self, events, batch_size:int=INSERT_BATCH_SIZE, complete_since:datetime.datetime.date=None, complete_until:dict[str,datetime.datetime.date]=None) -> dict:
+        """Inserts events into database. Events that already exist are updated.
+
+        Every event is stored with the hash of its information (:meth:`Event.getContentHash`).
+        The stored hashes are read first, and only new events and events with a different hash are written,
+        `batch_size` events per statement (one round-trip per batch). Unchanged rows are not touched at all.
+        `updated_at` of an event is only advanced if its information has actually changed.
 
+        If `complete_since` and `complete_until` (source -> last start date, see :func:`event_scrapper.getEvents`) are given,
+        the events are a complete scrap of these sources in that date range: stored events of these sources in that range,
+        that have not ended before `complete_since` but are missing from the scrap, are reported as `vanished` (they are kept).
+
+        Returns the delta of the scrap: the keys (id, date_start) of the events that are `new`, `changed`, `unchanged` and `vanished`.
+        """
+        # A statement must not touch the same row twice -> deduplicate by primary key (the last event wins)
+        events = {(event.id, event.date_start): event for event in events}
+        stored = self.getContentHashes(list(events))
+        report = {'new': [], 'changed': [], 'unchanged': [], 'vanished': []}
+        keys, rows = [], []  # Events to be written
+        for key, event in events.items():
+            if key in stored and stored[key] == event.getContentHash():
+                report['unchanged'].append(key)
+            else:
+                keys.append(key)
+                rows.append(eventToRow(event) + (event.getContentHash(),))
+        if complete_since is not None and complete_until:
+            report['vanished'] = sorted(self.getUpcomingKeys(complete_until, complete_since) - events.keys())
+
+        columns = ', '.join(EVENT_COLUMNS + ('content_hash',))
+        updated_columns = [column for column in EVENT_COLUMNS if column not in ('id', 'date_start')]
+        content_changed = f"""({', '.join(f'{self.TABLE}.{column}' for column in updated_columns)}) IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in updated_columns)})"""
+        # Rows stored before hashing (hash NULL) get their hash, but keep `updated_at` if their information is the same
+        query = f"""INSERT INTO {self.TABLE} ({columns}) VALUES %s
+                    ON CONFLICT ON CONSTRAINT PK_event DO UPDATE SET {', '.join(f'{column}=EXCLUDED.{column}' for column in updated_columns + ['content_hash'])},
+                        updated_at=CASE WHEN {content_changed} THEN current_timestamp ELSE {self.TABLE}.updated_at END
+                    WHERE {self.TABLE}.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+                    RETURNING (xmax = 0) AS inserted, id, date_start, updated_at = current_timestamp AS changed;"""
+        with self.connector as cur:
+            results = psycopg2.extras.execute_values(cur, query, rows, page_size=batch_size, fetch=True) if rows else []
+        written = set()
+        for ret in results:
+            written.add((ret[1], ret[2]))
+            report['new' if ret[0] else 'changed' if ret[3] else 'unchanged'].append((ret[1], ret[2]))
+        # Rows another writer had already brought up to date in the meantime
+        report['unchanged'].extend(key for key in keys if key not in written)
+        return report
+
+
+# Schedule settings of a channel: when new events are posted and how many days ahead, when reminders are sent and how many days ahead.
+# ``NULL`` uses the default of the bot
+SCHEDULE_COLUMNS = ('post_times', 'post_before_days', 'remind_times', 'remind_before_days')
+
+# Watermark of the last notification of a channel: until which `updated_at` of the events, and until which day events were checked.
+# ``NULL`` checks all events with the next notification
+WATERMARK_COLUMNS = ('notified_at', 'notified_until')
 
 class DBDiscord():
     """
     Class helper for saving Discord-related data, for example:
     - Where should events be posted
+    - When should events be posted and reminded (schedule of the channel)
     - ...
     """
     TABLE = "discord"
@@ -156,8 +536,24 @@ class DBDiscord():
             cur.execute(f"""CREATE TABLE {self.TABLE} (
                     channel_id BIGINT NOT NULL,
                     visibility VARCHAR[],
+                    post_times VARCHAR,
+                    post_before_days SMALLINT,
+                    remind_times VARCHAR,
+                    remind_before_days SMALLINT,
+                    notified_at TIMESTAMP WITH TIME ZONE,
+                    notified_until DATE,
                     CONSTRAINT PK_discord PRIMARY KEY (channel_id)
                 );""")
+    def migrateTable(self):
+        """Updates an existing table to the current schema."""
+        with self.connector as cur:
+            cur.execute(f"""ALTER TABLE {self.TABLE}
+                    ADD COLUMN IF NOT EXISTS post_times VARCHAR,
+                    ADD COLUMN IF NOT EXISTS post_before_days SMALLINT,
+                    ADD COLUMN IF NOT EXISTS remind_times VARCHAR,
+                    ADD COLUMN IF NOT EXISTS remind_before_days SMALLINT,
+                    ADD COLUMN IF NOT EXISTS notified_at TIMESTAMP WITH TIME ZONE,
+                    ADD COLUMN IF NOT EXISTS notified_until DATE;""")
     def executeQuery(self, query : str, retval : bool = False):
         """Executes any query. Returns output if retval flag is set to true."""
         with self.connector as cur:
@@ -172,10 +568,13 @@ class DBDiscord():
             cur.execute(f"SELECT * FROM {self.TABLE};")
             print(cur.fetchall())
     def updateChannel(self, channel_id : int, visibility : list[str]):
-        """Updates channel info in database. If it does not exist, it will be newly created"""
+        """Updates channel info in database. If it does not exist, it will be newly created.
+
+        The watermark is reset, so events of newly subscribed topics are checked with the next notification.
+        """
         with self.connector as cur:
             query = f"""INSERT INTO {self.TABLE} (channel_id, visibility) VALUES (%s, %s)
-                        ON CONFLICT ON CONSTRAINT PK_discord DO UPDATE SET visibility=EXCLUDED.visibility;"""
+                        ON CONFLICT ON CONSTRAINT PK_discord DO UPDATE SET visibility=EXCLUDED.visibility, notified_at=NULL, notified_until=NULL;"""
             data = (channel_id, visibility)
             cur.execute(query,data)
     def getChannelVisibility(self, channel_id : int) -> set[str]:
@@ -195,6 +594,467 @@ class DBDiscord():
         with self.connector as cur:
             cur.execute(f"SELECT channel_id, visibility FROM {self.TABLE};")
             return cur.fetchall()
+    def getSchedules(self, channel_ids : list[int] = None) -> dict[int, dict]:
+        """Returns the subscribed topics ('visibility'), schedule settings and watermark of the given channels (all channels if ``None``): channel_id -> {column -> value}"""
+        columns = ('visibility',) + SCHEDULE_COLUMNS + WATERMARK_COLUMNS
+        with self.connector as cur:
+            query = f"SELECT channel_id, {', '.join(columns)} FROM {self.TABLE}"
+            if channel_ids is None:
+                cur.execute(query + ";")
+            else:
+                cur.execute(query + " WHERE channel_id = ANY(%s);", (list(channel_ids),))
+            return {ret[0]: dict(zip(columns, ret[1:])) for ret in cur}
+    def setSchedule(self, channel_id : int, **settings) -> bool:
+        """Sets schedule settings of a subscribed channel, e.g. ``remind_times='0 9 * * *'``. ``None`` resets a setting to the default.
+
+        Returns ``False`` if the channel is not subscribed.
+        """
+        unknown = set(settings) - set(SCHEDULE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown schedule settings: {unknown}")
+        if not settings:
+            return True
+        with self.connector as cur:
+            cur.execute(f"""UPDATE {self.TABLE} SET {', '.join(f'{column} = %s' for column in settings)}
+                        WHERE channel_id = %s;""", (*settings.values(), channel_id))
+            return cur.rowcount > 0
+    def setWatermarks(self, watermarks : list[tuple]):
+        """Records until where channels have been notified, given as tuples (channel_id, notified_at, notified_until)"""
+        if not watermarks:
+            return
+        with self.connector as cur:
+            psycopg2.extras.execute_values(cur, f"""UPDATE {self.TABLE} d SET notified_at = w.notified_at, notified_until = w.notified_until
+                        FROM (VALUES %s) AS w(channel_id, notified_at, notified_until) WHERE d.channel_id = w.channel_id;""",
+                        watermarks, template="(%s::bigint, %s::timestamptz, %s::date)")
+    def resetWatermarks(self, channel_ids : list[int] = None):
+        """Resets the watermarks of the given channels (all channels if ``None``), so all their events are checked with the next notification"""
+        with self.connector as cur:
+            if channel_ids is None:
+                cur.execute(f"UPDATE {self.TABLE} SET notified_at = NULL, notified_until = NULL;")
+            else:
+                cur.execute(f"UPDATE {self.TABLE} SET notified_at = NULL, notified_until = NULL WHERE channel_id = ANY(%s);", (list(channel_ids),))
+
+# Ledger entry of a posted event: the message, the fingerprint of the posted embed,
+# the position of the embed in the message, and the webhook that posted the message (``None`` if posted by the bot itself)
+PostedMessage = namedtuple('PostedMessage', ['message_id', 'fingerprint', 'embed_index', 'webhook_id'], defaults=(None, 0, None))
+
+class DBMessage():
+    """
+    Class helper for the ledger of event messages posted to Discord:
+    (channel, event) -> :class:`PostedMessage`.
+    Lets the bot find already posted events without searching the channel history,
+    and tell from the fingerprint alone whether a posted embed is still up to date.
+    A message can hold the embeds of several events (batched posting).
+    """
+    TABLE = "messages"
+    def __init__(self,host=DB_HOST,port=DB_PORT,user=DB_USER,password=DB_PW,database=DB_NAME):
+        self.connector = DBConnector(host=host,port=port,user=user,password=password,database=database)
+    def __str__(self):
+        return self.TABLE
+    def createTable(self):
+        """Creates table if not present."""
+        with self.connector as cur:
+            cur.execute(f"""CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                    channel_id BIGINT NOT NULL,
+                    event_id VARCHAR NOT NULL,
+                    date_start DATE NOT NULL,
+                    message_id BIGINT NOT NULL,
+                    fingerprint VARCHAR,
+                    embed_index SMALLINT NOT NULL DEFAULT 0,
+                    webhook_id BIGINT,
+                    date_posted TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT current_timestamp,
+                    CONSTRAINT PK_messages PRIMARY KEY (channel_id, event_id, date_start)
+                );""")
+    def migrateTable(self):
+        """Updates an existing table to the current schema."""
+        self.createTable()
+        with self.connector as cur:
+            cur.execute(f"""ALTER TABLE {self.TABLE}
+                    ADD COLUMN IF NOT EXISTS fingerprint VARCHAR,
+                    ADD COLUMN IF NOT EXISTS embed_index SMALLINT NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS webhook_id BIGINT;""")
+    def printTable(self):
+        """Print all records in database"""
+        with self.connector as cur:
+            cur.execute(f"SELECT * FROM {self.TABLE};")
+            print(cur.fetchall())
+    def getMessages(self, channel_ids : list[int]) -> dict[int, dict[tuple, PostedMessage]]:
+        """Returns posted messages of the given channels: channel_id -> {(event_id, date_start) -> PostedMessage}"""
+        with self.connector as cur:
+            cur.execute(f"""SELECT channel_id, event_id, date_start, message_id, fingerprint, embed_index, webhook_id
+                        FROM {self.TABLE} WHERE channel_id = ANY(%s);""", (list(channel_ids),))
+            messages = {channel_id: {} for channel_id in channel_ids}
+            for ret in cur:
+                messages[ret['channel_id']][(ret['event_id'], ret['date_start'])] = PostedMessage(
+                    ret['message_id'], ret['fingerprint'], ret['embed_index'], ret['webhook_id'])
+            return messages
+    def getChannelMessages(self, channel_id : int) -> dict[tuple, PostedMessage]:
+        """Returns posted messages of a channel: {(event_id, date_start) -> PostedMessage}"""
+        return self.getMessages([channel_id])[channel_id]
+    def setMessages(self, messages : list[tuple]):
+        """Records posted messages, given as tuples (channel_id, event_id, date_start, message_id, fingerprint, embed_index, webhook_id)"""
+        if not messages:
+            return
+        with self.connector as cur:
+            upsertMessages(cur, messages)
+    def removeMessage(self, channel_id : int, event_id : str, date_start : datetime.date):
+        """Forgets the posted message of an event"""
+        with self.connector as cur:
+            cur.execute(f"DELETE FROM {self.TABLE} WHERE channel_id = %s AND event_id = %s AND date_start = %s;", (channel_id, event_id, date_start))
+    def removePostedMessage(self, channel_id : int, message_id : int):
+        """Forgets a posted message, with all events it holds"""
+        with self.connector as cur:
+            cur.execute(f"DELETE FROM {self.TABLE} WHERE channel_id = %s AND message_id = %s;", (channel_id, message_id))
+
+
+class DBReminder():
+    """
+    Class helper for the ledger of reminder messages posted to Discord:
+    (channel, day) -> message.
+    """
+    TABLE = "reminders"
+    def __init__(self,host=DB_HOST,port=DB_PORT,user=DB_USER,password=DB_PW,database=DB_NAME):
+        self.connector = DBConnector(host=host,port=port,user=user,password=password,database=database)
+    def __str__(self):
+        return self.TABLE
+    def createTable(self):
+        """Creates table if not present."""
+        with self.connector as cur:
+            cur.execute(f"""CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                    channel_id BIGINT NOT NULL,
+                    date DATE NOT NULL,
+                    message_id BIGINT NOT NULL,
+                    CONSTRAINT PK_reminders PRIMARY KEY (channel_id, date)
+                );""")
+    def migrateTable(self):
+        """Updates an existing table to the current schema."""
+        self.createTable()
+    def printTable(self):
+        """Print all records in database"""
+        with self.connector as cur:
+            cur.execute(f"SELECT * FROM {self.TABLE};")
+            print(cur.fetchall())
+    def getReminders(self, channel_ids : list[int], date : datetime.date) -> dict[int, int]:
+        """Returns the reminder messages of the given channels on a day: channel_id -> message_id"""
+        with self.connector as cur:
+            cur.execute(f"SELECT channel_id, message_id FROM {self.TABLE} WHERE channel_id = ANY(%s) AND date = %s;", (list(channel_ids), date))
+            return {ret['channel_id']: ret['message_id'] for ret in cur}
+    def setReminder(self, channel_id : int, date : datetime.date, message_id : int):
+        """Records the reminder message of a channel on a day"""
+        with self.connector as cur:
+            upsertReminder(cur, channel_id, date, message_id)
+    def removeReminder(self, channel_id : int, date : datetime.date):
+        """Forgets the reminder message of a channel on a day"""
+        with self.connector as cur:
+            cur.execute(f"DELETE FROM {self.TABLE} WHERE channel_id = %s AND date = %s;", (channel_id, date))
+
+def upsertMessages(cur, messages : list[tuple]):
+    """Records posted messages in the ledger with the given cursor (see :meth:`DBMessage.setMessages`)"""
+    psycopg2.extras.execute_values(cur, f"""INSERT INTO {DBMessage.TABLE} (channel_id, event_id, date_start, message_id, fingerprint, embed_index, webhook_id) VALUES %s
+                ON CONFLICT ON CONSTRAINT PK_messages DO UPDATE SET message_id=EXCLUDED.message_id, fingerprint=EXCLUDED.fingerprint,
+                embed_index=EXCLUDED.embed_index, webhook_id=EXCLUDED.webhook_id,
+                date_posted=CASE WHEN {DBMessage.TABLE}.message_id = EXCLUDED.message_id THEN {DBMessage.TABLE}.date_posted ELSE current_timestamp END;""", messages)
+
+def upsertReminder(cur, channel_id : int, date : datetime.date, message_id : int):
+    """Records a reminder message in the ledger with the given cursor (see :meth:`DBReminder.setReminder`)"""
+    cur.execute(f"""INSERT INTO {DBReminder.TABLE} (channel_id, date, message_id) VALUES (%s, %s, %s)
+                ON CONFLICT ON CONSTRAINT PK_reminders DO UPDATE SET message_id=EXCLUDED.message_id;""", (channel_id, date, message_id))
+
+
+# Outbox: how often a failing entry is sent at most, and the delay (in seconds) before its first retry. The delay doubles with every attempt
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 30
+# Finished outbox entries are deleted after this many days
+OUTBOX_KEEP_DAYS = 7
+# Status of outbox entries
+OUTBOX_STATUS = ('pending', 'sending', 'done', 'failed', 'superseded')
+
+class DBOutbox():
+    """
+    Class helper for the outbox of Discord requests (posts, edits, reminders).
+    Requests are written to the outbox before they are sent, and marked done in the same transaction that records their result in the ledgers.
+    So a restart resumes with the requests that have not been sent yet.
+
+    Every entry has an idempotency key: queueing a request that is already waiting or being sent does nothing.
+    """
+    TABLE = "outbox"
+    def __init__(self,host=DB_HOST,port=DB_PORT,user=DB_USER,password=DB_PW,database=DB_NAME):
+        self.connector = DBConnector(host=host,port=port,user=user,password=password,database=database)
+    def __str__(self):
+        return self.TABLE
+    def createTable(self):
+        """Creates table if not present."""
+        with self.connector as cur:
+            cur.execute(f"""CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                    id BIGSERIAL PRIMARY KEY,
+                    idempotency_key VARCHAR NOT NULL UNIQUE,
+                    channel_id BIGINT NOT NULL,
+                    kind VARCHAR NOT NULL,
+                    priority SMALLINT NOT NULL DEFAULT 0,
+                    payload JSONB NOT NULL,
+                    status VARCHAR NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT current_timestamp,
+                    last_error TEXT,
+                    date_added TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT current_timestamp,
+                    date_done TIMESTAMP WITH TIME ZONE
+                );""")
+            cur.execute(f"CREATE INDEX IF NOT EXISTS IX_{self.TABLE}_pending ON {self.TABLE} (priority, id) WHERE status = 'pending';")
+    def migrateTable(self):
+        """Updates an existing table to the current schema."""
+        self.createTable()
+    def printTable(self):
+        """Print all records in database"""
+        with self.connector as cur:
+            cur.execute(f"SELECT * FROM {self.TABLE};")
+            print(cur.fetchall())
+    def enqueue(self, entries : list[tuple], supersede : tuple=None):
+        """Queues requests, given as tuples (idempotency_key, channel_id, kind, priority, payload).
+
+        Entries with a key that is already waiting or being sent are skipped; finished entries with that key are queued again.
+        `supersede` is a tuple (channel_id, kinds): waiting entries of these kinds in the channel that are not queued again are dropped,
+        as the given entries replace them.
+        """
+        with self.connector as cur:
+            if supersede:
+                channel_id, kinds = supersede
+                cur.execute(f"""UPDATE {self.TABLE} SET status='superseded', date_done=current_timestamp
+                            WHERE status='pending' AND channel_id=%s AND kind = ANY(%s) AND NOT idempotency_key = ANY(%s);""",
+                            (channel_id, list(kinds), [entry[0] for entry in entries]))
+            if not entries:
+                return
+            rows = [(key, channel_id, kind, priority, psycopg2.extras.Json(payload)) for key, channel_id, kind, priority, payload in entries]
+            psycopg2.extras.execute_values(cur, f"""INSERT INTO {self.TABLE} (idempotency_key, channel_id, kind, priority, payload) VALUES %s
+                        ON CONFLICT (idempotency_key) DO UPDATE SET payload=EXCLUDED.payload, priority=EXCLUDED.priority, status='pending', attempts=0,
+                        next_attempt_at=current_timestamp, last_error=NULL, date_added=current_timestamp, date_done=NULL
+                        WHERE {self.TABLE}.status IN ('done', 'failed', 'superseded');""", rows)
+    def getEventKeys(self, channel_ids : list[int], kinds : list[str], statuses : list[str]=('pending', 'failed')) -> dict[int, set[tuple]]:
+        """Returns the events of the entries of the given kinds and statuses: channel_id -> {(event_id, date_start)}"""
+        with self.connector as cur:
+            cur.execute(f"""SELECT DISTINCT o.channel_id, e->>'event_id' AS event_id, (e->>'date_start')::date AS date_start
+                        FROM {self.TABLE} o, jsonb_array_elements(o.payload->'events') AS e
+                        WHERE o.channel_id = ANY(%s) AND o.kind = ANY(%s) AND o.status = ANY(%s);""",
+                        (list(channel_ids), list(kinds), list(statuses)))
+            keys = {}
+            for ret in cur:
+                keys.setdefault(ret['channel_id'], set()).add((ret['event_id'], ret['date_start']))
+            return keys
+    def claim(self, limit : int) -> list[dict]:
+        """Marks up to `limit` due entries as being sent and returns them, by priority and in the order they were queued."""
+        with self.connector as cur:
+            cur.execute(f"""UPDATE {self.TABLE} SET status='sending', attempts=attempts+1 WHERE id IN (
+                            SELECT id FROM {self.TABLE} WHERE status='pending' AND next_attempt_at <= current_timestamp
+                            ORDER BY priority, id LIMIT %s FOR UPDATE SKIP LOCKED)
+                        RETURNING id, idempotency_key, channel_id, kind, priority, payload, attempts;""", (limit,))
+            return sorted(cur.fetchall(), key=lambda entry: (entry['priority'], entry['id']))
+    def complete(self, entry_id : int, messages : list[tuple]=None, reminder : tuple=None, forget_message : tuple=None, forget_events : list[tuple]=None):
+        """Marks an entry as done, and records its result in the same transaction.
+
+        `messages` are recorded in the message ledger (see :meth:`DBMessage.setMessages`),
+        `reminder` is a tuple (channel_id, date, message_id) recorded in the reminder ledger,
+        `forget_message` is a tuple (channel_id, message_id) removed from the message ledger,
+        `forget_events` are tuples (channel_id, event_id, date_start) removed from the message ledger.
+        """
+        with self.connector as cur:
+            if forget_message:
+                cur.execute(f"DELETE FROM {DBMessage.TABLE} WHERE channel_id = %s AND message_id = %s;", forget_message)
+            if forget_events:
+                psycopg2.extras.execute_values(cur, f"DELETE FROM {DBMessage.TABLE} m USING (VALUES %s) AS f(channel_id, event_id, date_start) WHERE (m.channel_id, m.event_id, m.date_start) = (f.channel_id, f.event_id, f.date_start);",
+                                               forget_events, template="(%s::bigint, %s::varchar, %s::date)")
+            if messages:
+                upsertMessages(cur, messages)
+            if reminder:
+                upsertReminder(cur, *reminder)
+            cur.execute(f"UPDATE {self.TABLE} SET status='done', date_done=current_timestamp, last_error=NULL WHERE id = %s;", (entry_id,))
+    def advance(self, entry_id : int, payload : dict, messages : list[tuple]):
+        """Records part of an entry that has been sent, and replaces its payload by what is left to be sent, in the same transaction.
+
+        `messages` are recorded in the message ledger (see :meth:`DBMessage.setMessages`).
+        """
+        with self.connector as cur:
+            upsertMessages(cur, messages)
+            cur.execute(f"UPDATE {self.TABLE} SET payload=%s WHERE id = %s;", (psycopg2.extras.Json(payload), entry_id))
+    def retry(self, entry_id : int, error : str):
+        """Schedules a failed entry to be sent again later (with exponential backoff), or gives up after `OUTBOX_MAX_ATTEMPTS` attempts."""
+        with self.connector as cur:
+            cur.execute(f"""UPDATE {self.TABLE} SET
+                            status=CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                            next_attempt_at=current_timestamp + make_interval(secs => %s * power(2, attempts - 1)),
+                            date_done=CASE WHEN attempts >= %s THEN current_timestamp END,
+                            last_error=%s
+                        WHERE id = %s;""", (OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY, OUTBOX_MAX_ATTEMPTS, error, entry_id))
+    def fail(self, entry_id : int, error : str):
+        """Gives up an entry that cannot be sent."""
+        with self.connector as cur:
+            cur.execute(f"UPDATE {self.TABLE} SET status='failed', date_done=current_timestamp, last_error=%s WHERE id = %s;", (error, entry_id))
+    def recover(self) -> int:
+        """Queues entries again that were being sent when the bot stopped. Returns their number.
+
+        Must only be called while no entries are being sent.
+        """
+        with self.connector as cur:
+            cur.execute(f"UPDATE {self.TABLE} SET status='pending', next_attempt_at=current_timestamp WHERE status='sending';")
+            return cur.rowcount
+    def prune(self, days : int=OUTBOX_KEEP_DAYS) -> int:
+        """Deletes entries that have been finished for more than `days` days. Returns their number."""
+        with self.connector as cur:
+            cur.execute(f"DELETE FROM {self.TABLE} WHERE status IN ('done', 'failed', 'superseded') AND date_done < current_timestamp - make_interval(days => %s);", (days,))
+            return cur.rowcount
+    def getStats(self) -> dict:
+        """Returns the number of entries by status."""
+        with self.connector as cur:
+            cur.execute(f"SELECT status, count(*) AS count FROM {self.TABLE} GROUP BY status;")
+            stats = {status: 0 for status in OUTBOX_STATUS}
+            stats.update({ret['status']: ret['count'] for ret in cur})
+            return stats
+
+
+# Worker threads that run the queries of the asyncio database layer (one per pooled connection)
+DB_EXECUTOR = None
+DB_EXECUTOR_LOCK = threading.Lock()
+
+def getExecutor() -> ThreadPoolExecutor:
+    """Returns the executor that runs the queries of the asyncio database layer. Creates it if it does not exist yet."""
+    global DB_EXECUTOR
+    with DB_EXECUTOR_LOCK:
+        if DB_EXECUTOR is None:
+            DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix='db')
+        return DB_EXECUTOR
+
+class AsyncDB():
+    """
+    Base class for the asyncio versions of the database helpers.
+    Every query runs in a worker thread with a pooled connection, so awaiting it never blocks the event loop,
+    and several queries (e.g. one per channel) can run at the same time:
+
+    events = await asyncEventDB.getEvents(visibility=['Kanto'])
+    """
+    def __init__(self, db):
+        self.db = db
+    def __str__(self):
+        return str(self.db)
+    async def run(self, func, *args, **kwargs):
+        """Runs blocking `func(*args, **kwargs)` in a worker thread and returns its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(getExecutor(), partial(func, *args, **kwargs))
+
+class AsyncDBEvent(AsyncDB):
+    """
+    Asyncio version of :class:`DBEvent`.
+    """
+    async def getEvents(self, visibility:list[str]=None, from_date:datetime.datetime.date=None, until_date:datetime.datetime.date=None, mode:str='within') -> list[Event]:
+        """Return events of given visibility, in the given date duration (see :meth:`DBEvent.getEvents` for `mode`)"""
+        return await self.run(self.db.getEvents, visibility=visibility, from_date=from_date, until_date=until_date, mode=mode)
+    async def getEventsByKeys(self, keys:list[tuple]) -> list[Event]:
+        """Return the events of the given keys (id, date_start), e.g. the events a scrap has changed"""
+        return await self.run(self.db.getEventsByKeys, keys)
+    async def getEventsByChannel(self, channel_ids:list[int]=None, from_date:datetime.datetime.date=None, until_date:datetime.datetime.date=None, mode:str='within') -> dict[int, list[Event]]:
+        """Return events of every subscribed channel (or only of the given channels), in the given date duration"""
+        return await self.run(self.db.getEventsByChannel, channel_ids=channel_ids, from_date=from_date, until_date=until_date, mode=mode)
+    async def getEventsByTopics(self, channel_ids:list[int]=None, from_date:datetime.datetime.date=None, until_date:datetime.datetime.date=None, mode:str='within') -> dict[tuple, tuple[list[int], list[Event]]]:
+        """Return events of every distinct set of subscribed topics (or only of the sets of the given channels), in the given date duration"""
+        return await self.run(self.db.getEventsByTopics, channel_ids=channel_ids, from_date=from_date, until_date=until_date, mode=mode)
+    async def insertEvents(self, events, complete_since:datetime.datetime.date=None, complete_until:dict[str,datetime.datetime.date]=None) -> dict:
+        """Inserts new and changed events into database. Returns the keys of the events that are `new`, `changed`, `unchanged` and `vanished`"""
+        return await self.run(self.db.insertEvents, events, complete_since=complete_since, complete_until=complete_until)
+
+class AsyncDBDiscord(AsyncDB):
+    """
+    Asyncio version of :class:`DBDiscord`.
+    """
+    async def updateChannel(self, channel_id : int, visibility : list[str]):
+        """Updates channel info in database. If it does not exist, it will be newly created"""
+        return await self.run(self.db.updateChannel, channel_id, visibility)
+    async def getChannelVisibility(self, channel_id : int) -> set[str]:
+        """Returns the visibility of events to this channel"""
+        return await self.run(self.db.getChannelVisibility, channel_id)
+    async def removeChannel(self, channel_id : int):
+        """Removes channel from table"""
+        return await self.run(self.db.removeChannel, channel_id)
+    async def getAllChannelVisibility(self):
+        """Returns all channels with their visibility"""
+        return await self.run(self.db.getAllChannelVisibility)
+    async def getSchedules(self, channel_ids : list[int] = None) -> dict[int, dict]:
+        """Returns the subscribed topics ('visibility'), schedule settings and watermark of the given channels (all channels if ``None``): channel_id -> {column -> value}"""
+        return await self.run(self.db.getSchedules, channel_ids)
+    async def setSchedule(self, channel_id : int, **settings) -> bool:
+        """Sets schedule settings of a subscribed channel. ``None`` resets a setting to the default. Returns ``False`` if the channel is not subscribed."""
+        return await self.run(self.db.setSchedule, channel_id, **settings)
+    async def setWatermarks(self, watermarks : list[tuple]):
+        """Records until where channels have been notified, given as tuples (channel_id, notified_at, notified_until)"""
+        return await self.run(self.db.setWatermarks, watermarks)
+    async def resetWatermarks(self, channel_ids : list[int] = None):
+        """Resets the watermarks of the given channels (all channels if ``None``), so all their events are checked with the next notification"""
+        return await self.run(self.db.resetWatermarks, channel_ids)
+
+class AsyncDBMessage(AsyncDB):
+    """
+    Asyncio version of :class:`DBMessage`.
+    """
+    async def getMessages(self, channel_ids : list[int]) -> dict[int, dict[tuple, PostedMessage]]:
+        """Returns posted messages of the given channels: channel_id -> {(event_id, date_start) -> PostedMessage}"""
+        return await self.run(self.db.getMessages, channel_ids)
+    async def getChannelMessages(self, channel_id : int) -> dict[tuple, PostedMessage]:
+        """Returns posted messages of a channel: {(event_id, date_start) -> PostedMessage}"""
+        return await self.run(self.db.getChannelMessages, channel_id)
+    async def setMessages(self, messages : list[tuple]):
+        """Records posted messages, given as tuples (channel_id, event_id, date_start, message_id, fingerprint, embed_index, webhook_id)"""
+        return await self.run(self.db.setMessages, messages)
+    async def removeMessage(self, channel_id : int, event_id : str, date_start : datetime.date):
+        """Forgets the posted message of an event"""
+        return await self.run(self.db.removeMessage, channel_id, event_id, date_start)
+    async def removePostedMessage(self, channel_id : int, message_id : int):
+        """Forgets a posted message, with all events it holds"""
+        return await self.run(self.db.removePostedMessage, channel_id, message_id)
+
+class AsyncDBOutbox(AsyncDB):
+    """
+    Asyncio version of :class:`DBOutbox`.
+    """
+    async def enqueue(self, entries : list[tuple], supersede : tuple=None):
+        """Queues requests, given as tuples (idempotency_key, channel_id, kind, priority, payload)"""
+        return await self.run(self.db.enqueue, entries, supersede)
+    async def getEventKeys(self, channel_ids : list[int], kinds : list[str], statuses : list[str]=('pending', 'failed')) -> dict[int, set[tuple]]:
+        """Returns the events of the entries of the given kinds and statuses: channel_id -> {(event_id, date_start)}"""
+        return await self.run(self.db.getEventKeys, channel_ids, kinds, statuses)
+    async def claim(self, limit : int) -> list[dict]:
+        """Marks up to `limit` due entries as being sent and returns them"""
+        return await self.run(self.db.claim, limit)
+    async def complete(self, entry_id : int, messages : list[tuple]=None, reminder : tuple=None, forget_message : tuple=None, forget_events : list[tuple]=None):
+        """Marks an entry as done, and records its result in the same transaction"""
+        return await self.run(self.db.complete, entry_id, messages, reminder, forget_message, forget_events)
+    async def advance(self, entry_id : int, payload : dict, messages : list[tuple]):
+        """Records part of an entry that has been sent, and replaces its payload by what is left"""
+        return await self.run(self.db.advance, entry_id, payload, messages)
+    async def retry(self, entry_id : int, error : str):
+        """Schedules a failed entry to be sent again later"""
+        return await self.run(self.db.retry, entry_id, error)
+    async def fail(self, entry_id : int, error : str):
+        """Gives up an entry that cannot be sent"""
+        return await self.run(self.db.fail, entry_id, error)
+    async def recover(self) -> int:
+        """Queues entries again that were being sent when the bot stopped"""
+        return await self.run(self.db.recover)
+    async def prune(self, days : int=OUTBOX_KEEP_DAYS) -> int:
+        """Deletes entries that have been finished for more than `days` days"""
+        return await self.run(self.db.prune, days)
+    async def getStats(self) -> dict:
+        """Returns the number of entries by status"""
+        return await self.run(self.db.getStats)
+
+class AsyncDBReminder(AsyncDB):
+    """
+    Asyncio version of :class:`DBReminder`.
+    """
+    async def getReminders(self, channel_ids : list[int], date : datetime.date) -> dict[int, int]:
+        """Returns the reminder messages of the given channels on a day: channel_id -> message_id"""
+        return await self.run(self.db.getReminders, channel_ids, date)
+    async def setReminder(self, channel_id : int, date : datetime.date, message_id : int):
+        """Records the reminder message of a channel on a day"""
+        return await self.run(self.db.setReminder, channel_id, date, message_id)
+    async def removeReminder(self, channel_id : int, date : datetime.date):
+        """Forgets the reminder message of a channel on a day"""
+        return await self.run(self.db.removeReminder, channel_id, date)
 
 def dropTables(*tables):
     """Attempts to drops given tables."""
@@ -221,17 +1081,37 @@ def createTables(*tables, recreate=False):
         table.createTable()
         print(f"[INFO] created table {table.TABLE}.")
 
+def migrateTables(*tables):
+    """Updates given (existing) tables to the current schema, e.g. adds missing indexes. Data is kept."""
+    for table in tables:
+        if not table:
+            return
+        table.migrateTable()
+        print(f"[INFO] migrated table {table.TABLE}.")
+
+def migrateDatabase():
+    """Updates database (all tables) to the current schema. Data is kept."""
+    migrateTables(eventDB, discordDB, messageDB, reminderDB, outboxDB)
+
 def createDatabase(recreate=False):
     """Creates database (all tables).
 
     If flag `recreate` is set to `True`, it will delete all tables beforehand (only if they exist).
     """
-    createTables(eventDB, discordDB, recreate=recreate)
+    createTables(eventDB, discordDB, messageDB, reminderDB, outboxDB, recreate=recreate)
 
 
 # Open database connections
 eventDB = DBEvent(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PW, database=DB_NAME)
 discordDB = DBDiscord(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PW, database=DB_NAME)
+messageDB = DBMessage(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PW, database=DB_NAME)
+reminderDB = DBReminder(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PW, database=DB_NAME)
+outboxDB = DBOutbox(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PW, database=DB_NAME)
+asyncEventDB = AsyncDBEvent(eventDB)
+asyncDiscordDB = AsyncDBDiscord(discordDB)
+asyncMessageDB = AsyncDBMessage(messageDB)
+asyncReminderDB = AsyncDBReminder(reminderDB)
+asyncOutboxDB = AsyncDBOutbox(outboxDB)
 
 
 if __name__ == '__main__':
@@ -239,6 +1119,8 @@ if __name__ == '__main__':
     for arg in args:
         if arg == 'create':
             createDatabase(recreate=True)
+        elif arg == 'migrate':
+            migrateDatabase()
         else:
             print(f"argument '{arg}' unknown. SKIP")
 
@@ -247,6 +1129,7 @@ if __name__ == '__main__':
         eventDB.printTable()
     except Exception:
         pass
+    closePools()
     # print("Special query:")
     #print(discordDB.executeQuery(f"SELECT * FROM {discordDB.TABLE};"))
     # discordDB.executeQuery(f"INSERT INTO {discordDB.TABLE} (channel_id, visibility) VALUES ('ch7', ARRAY['kanto','kansai']);")
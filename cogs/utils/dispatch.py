@@ -0,0 +1,220 @@
+"""Dispatcher of outgoing Discord requests
+
+Discord rate limits requests per route (e.g. messages of one channel) and globally (50 requests per second per bot).
+discord.py already waits for the per-route buckets announced in the `X-RateLimit-*` response headers and for global 429s.
+This module runs work of many channels concurrently, and sends the requests through one central queue:
+time-sensitive requests (reminders) are sent before bulk requests (new event posts), and the requests are paced below the global limit so that 429s are avoided in the first place.
+
+queue = SendQueue()
+dispatcher = Dispatcher()
+await dispatcher.gather(notifyChannel(channel) for channel in channels)
+# Inside notifyChannel:
+message = await queue.submit(PRIORITY_POST, channel.id, channel.send, content='Hello')
+"""
+
+import os
+import time
+import asyncio
+
+from collections import OrderedDict, deque
+
+
+# Maximum number of requests per second sent to Discord in total (Discord allows 50/s)
+DISPATCH_RATE = float(os.getenv('DISPATCH_RATE', 40))
+
+# Maximum number of channels that are worked on at the same time
+DISPATCH_CONCURRENCY = int(os.getenv('DISPATCH_CONCURRENCY', 8))
+
+# Maximum number of requests that are sent at the same time
+SEND_QUEUE_WORKERS = int(os.getenv('SEND_QUEUE_WORKERS', 8))
+
+# Maximum number of waiting requests. Submitting more waits until there is room again (backpressure)
+SEND_QUEUE_MAXSIZE = int(os.getenv('SEND_QUEUE_MAXSIZE', 1000))
+
+# Priority classes of requests. Lower values are sent first
+PRIORITY_REMINDER = 0
+PRIORITY_EDIT = 1
+PRIORITY_POST = 2
+PRIORITY_STATUS = 3
+PRIORITY_NAMES = {PRIORITY_REMINDER: 'reminder', PRIORITY_EDIT: 'edit', PRIORITY_POST: 'post', PRIORITY_STATUS: 'status'}
+
+
+class TokenBucket():
+    """
+    Token bucket of the event loop: lets `rate` requests per second pass, with bursts of up to `capacity` requests.
+    """
+    def __init__(self, rate:float, capacity:float=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+    def refill(self):
+        """Adds the tokens that were generated since the last refill."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+    async def acquire(self):
+        """Waits until a token is available and takes it."""
+        while True:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SendJob():
+    """
+    A request waiting in the :class:`SendQueue`.
+    """
+    def __init__(self, priority:int, channel_id:int, func, args:tuple, kwargs:dict):
+        self.priority = priority
+        self.channel_id = channel_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class SendQueue():
+    """
+    Central queue of outgoing Discord requests.
+
+    Requests are sent by priority class. Within a class, channels take turns (round-robin),
+    and each channel has at most one request in flight, so messages of a channel keep their order.
+    Workers are started with the first request.
+    """
+    def __init__(self, workers:int=SEND_QUEUE_WORKERS, rate:float=DISPATCH_RATE, maxsize:int=SEND_QUEUE_MAXSIZE):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.bucket = TokenBucket(rate)
+        self.lanes = {priority: OrderedDict() for priority in sorted(PRIORITY_NAMES)}  # priority -> channel -> waiting jobs
+        self.busy = set()  # channels with a request in flight
+        self.size = 0
+        self.condition = None
+        self.tasks = []
+
+        # Metrics
+        self.max_size = 0
+        self.blocked = 0
+        self.stats = {priority: {'submitted': 0, 'sent': 0, 'failed': 0, 'wait_total': 0.0, 'wait_max': 0.0} for priority in PRIORITY_NAMES}
+    def __len__(self):
+        return self.size
+    def start(self):
+        """Starts the workers (if not running yet). Must be called from the event loop."""
+        if self.tasks:
+            return
+        self.condition = asyncio.Condition()
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+    def close(self):
+        """Stops the workers and cancels all waiting requests."""
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        for lanes in self.lanes.values():
+            for jobs in lanes.values():
+                for job in jobs:
+                    job.future.cancel()
+            lanes.clear()
+        self.busy.clear()
+        self.size = 0
+    async def submit(self, priority:int, channel_id:int, func, *args, **kwargs):
+        """Queues the request `func(*args, **kwargs)` to `channel_id` and returns its result once it has been sent.
+
+        Waits while the queue is full.
+        """
+        self.start()
+        async with self.condition:
+            if self.size >= self.maxsize:
+                self.blocked += 1
+                await self.condition.wait_for(lambda: self.size < self.maxsize)
+            job = SendJob(priority, channel_id, func, args, kwargs)
+            self.lanes[priority].setdefault(channel_id, deque()).append(job)
+            self.size += 1
+            self.max_size = max(self.max_size, self.size)
+            self.stats[priority]['submitted'] += 1
+            self.condition.notify_all()
+        return await job.future
+    def next(self) -> SendJob:
+        """Takes the next job to send, or ``None`` if no job can be sent right now."""
+        for lanes in self.lanes.values():
+            for channel_id in lanes:
+                if channel_id in self.busy:
+                    continue
+                # Move the channel to the end of its class, so the other channels take their turn first
+                jobs = lanes.pop(channel_id)
+                job = jobs.popleft()
+                if jobs:
+                    lanes[channel_id] = jobs
+                return job
+        return None
+    async def work(self):
+        """Worker: sends the queued requests one after another."""
+        while True:
+            async with self.condition:
+                job = self.next()
+                while job is None:
+                    await self.condition.wait()
+                    job = self.next()
+                self.busy.add(job.channel_id)
+                self.size -= 1
+                self.condition.notify_all()
+
+            stats = self.stats[job.priority]
+            try:
+                if not job.future.cancelled():  # The submitter might have given up already
+                    wait = time.monotonic() - job.enqueued
+                    stats['wait_total'] += wait
+                    stats['wait_max'] = max(stats['wait_max'], wait)
+                    await self.bucket.acquire()
+                    result = await job.func(*job.args, **job.kwargs)
+                    stats['sent'] += 1
+                    if not job.future.done():
+                        job.future.set_result(result)
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                stats['failed'] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self.busy.discard(job.channel_id)
+            async with self.condition:
+                self.condition.notify_all()
+    def getStats(self) -> dict:
+        """Returns usage statistics of the queue."""
+        stats = {
+            'waiting': self.size,
+            'waiting_max': self.max_size,
+            'in_flight': len(self.busy),
+            'blocked_submits': self.blocked,
+        }
+        for priority, name in PRIORITY_NAMES.items():
+            values = self.stats[priority]
+            done = values['sent'] + values['failed']
+            stats[f'{name}_waiting'] = sum(len(jobs) for jobs in self.lanes[priority].values())
+            stats[f'{name}_sent'] = values['sent']
+            stats[f'{name}_failed'] = values['failed']
+            stats[f'{name}_wait_avg'] = values['wait_total'] / done if done else 0.0
+            stats[f'{name}_wait_max'] = values['wait_max']
+        return stats
+
+
+class Dispatcher():
+    """
+    Runs work of many channels concurrently.
+    """
+    def __init__(self, concurrency:int=DISPATCH_CONCURRENCY):
+        self.concurrency = concurrency
+    async def gather(self, coros) -> list:
+        """Runs the coroutines concurrently, at most `concurrency` at a time.
+
+        Returns their results in order. Exceptions are returned instead of raised, so a failing channel does not stop the others.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async def run(coro):
+            async with semaphore:
+                return await coro
+        return await asyncio.gather(*(run(coro) for coro in coros), return_exceptions=True)
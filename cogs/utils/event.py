@@ -3,12 +3,31 @@
 Simple event class to define what attributes an event has, and other helpful functions like euqlity-checking.
 """
 
-import calendar
+import hashlib
+
+from collections.abc import Mapping
 
 from . import utils
 
 
+# Attributes of an event, in the order of the constructor arguments
+FIELDS = ('id', 'name', 'description', 'url', 'img', 'date_start', 'date_end', 'date_fuzzy', 'time_start', 'time_end',
+          'location', 'cost', 'status', 'other', 'visibility', 'source', 'date_added', 'updated_at')
+
+# Attributes that make up the information of an event (`date_added` and `updated_at` are only set by the database)
+CONTENT_FIELDS = FIELDS[:-2]
+
+
 class Event(object):
+    """
+    An event. Attributes are stored in slots, so an event takes no per-instance ``__dict__``.
+
+    Derived values (content hash, formatted date and time ranges) are computed once and cached until an attribute changes.
+    A frozen event (``frozen=True`` or :meth:`freeze`) cannot be changed anymore, so it can be shared safely, e.g. between channels;
+    use :meth:`replace` to get a changed copy.
+    """
+    __slots__ = FIELDS + ('_frozen', '_content_hash', '_date_range', '_time_range')
+
     def __init__(self,
             id='', # Unique ID for every event
             name='', # Event name
@@ -26,24 +45,44 @@ class Event(object):
             other='', # Additional information tag
             visibility='', # Prefecture, University, ... used for visibility to channels
             source='', # Source where event was scrapped
-            date_added=None): # ONLY SET BY DATABASE: Date of when event was added to database
-        self.id = id
-        self.name = name
-        self.description = description
-        self.url = url
-        self.img = img
-        self.date_start = date_start
-        self.date_end = date_end
-        self.date_fuzzy = date_fuzzy
-        self.time_start = time_start
-        self.time_end = time_end
-        self.location = location
-        self.cost = cost
-        self.status = status
-        self.other = other
-        self.visibility = visibility
-        self.source = source
-        self.date_added = date_added
+            date_added=None, # ONLY SET BY DATABASE: Date of when event was added to database
+            updated_at=None, # ONLY SET BY DATABASE: Date of when event information was last changed in database
+            frozen=False): # Whether the event can no longer be changed
+        setter = object.__setattr__  # Skips the checks of __setattr__, nothing is cached yet
+        setter(self, 'id', id)
+        setter(self, 'name', name)
+        setter(self, 'description', description)
+        setter(self, 'url', url)
+        setter(self, 'img', img)
+        setter(self, 'date_start', date_start)
+        setter(self, 'date_end', date_end)
+        setter(self, 'date_fuzzy', date_fuzzy)
+        setter(self, 'time_start', time_start)
+        setter(self, 'time_end', time_end)
+        setter(self, 'location', location)
+        setter(self, 'cost', cost)
+        setter(self, 'status', status)
+        setter(self, 'other', other)
+        setter(self, 'visibility', visibility)
+        setter(self, 'source', source)
+        setter(self, 'date_added', date_added)
+        setter(self, 'updated_at', updated_at)
+        setter(self, '_frozen', frozen)
+        setter(self, '_content_hash', None)
+        setter(self, '_date_range', None)
+        setter(self, '_time_range', None)
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError(f"Event [{self.id}] is frozen, use `replace()` to get a changed copy")
+        object.__setattr__(self, name, value)
+        # Derived values are computed again on their next use
+        object.__setattr__(self, '_content_hash', None)
+        object.__setattr__(self, '_date_range', None)
+        object.__setattr__(self, '_time_range', None)
+
+    def __reduce__(self):
+        return (self.__class__, self.toRow() + (self._frozen,))
 
     def __eq__(self, other):
         if isinstance(other, Event):
@@ -64,64 +103,165 @@ class Event(object):
         other: {self.other}
         description: {self.description}"""
         return text
-    
+
+    @classmethod
+    def fromRow(cls, row, frozen:bool=False) -> 'Event':
+        """Returns event of a row: a mapping of `FIELDS` (e.g. a database row, `date_added` and `updated_at` may be missing, other columns are ignored), or a sequence in the order of `FIELDS`"""
+        if isinstance(row, Mapping) or hasattr(row, 'keys'):  # psycopg2's DictRow is a list with keys
+            return cls(*(row[field] for field in CONTENT_FIELDS), row.get('date_added'), row.get('updated_at'), frozen)
+        return cls(*row, frozen=frozen)
+
+    def toRow(self) -> tuple:
+        """Returns the values of all `FIELDS` as tuple"""
+        return (self.id, self.name, self.description, self.url, self.img, self.date_start, self.date_end, self.date_fuzzy,
+                self.time_start, self.time_end, self.location, self.cost, self.status, self.other, self.visibility, self.source, self.date_added, self.updated_at)
+
+    def asdict(self) -> dict:
+        """Returns all `FIELDS` as dictionary. :meth:`fromRow` turns it back into an event."""
+        return dict(zip(FIELDS, self.toRow()))
+
+    def replace(self, **changes) -> 'Event':
+        """Returns a copy of the event (frozen like this one) with the given attributes changed"""
+        values = self.asdict()
+        values.update(changes)
+        return self.__class__(**values, frozen=self._frozen)
+
+    def freeze(self) -> 'Event':
+        """Makes the event unchangeable and returns it"""
+        object.__setattr__(self, '_frozen', True)
+        return self
+
+    @property
+    def frozen(self) -> bool:
+        """Whether the event can no longer be changed"""
+        return self._frozen
+
+    def getContentHash(self) -> str:
+        """Returns a hash of the event information. Changes whenever the scrapped information of the event changes."""
+        if self._content_hash is None:
+            content = self.toRow()[:len(CONTENT_FIELDS)]
+            object.__setattr__(self, '_content_hash', hashlib.sha1('\x1f'.join(map(str, content)).encode('utf-8')).hexdigest())
+        return self._content_hash
+
     def getDateRange(self) -> str:
         """Returns date-range of when event occurs"""
-        if self.date_fuzzy:
-            return self.date_fuzzy
-        date_start = str(utils.custom_strftime('%b {S} ({DAY}), %Y', self.date_start))
-        date_end = str(utils.custom_strftime('%b {S} ({DAY}), %Y', self.date_end)) if self.date_start != self.date_end else ''
-        return f"{date_start} - {date_end}".strip(' - ')
+        if self._date_range is None:
+            if self.date_fuzzy:
+                date_range = self.date_fuzzy
+            else:
+                date_start = str(utils.custom_strftime('%b {S} ({DAY}), %Y', self.date_start))
+                date_end = str(utils.custom_strftime('%b {S} ({DAY}), %Y', self.date_end)) if self.date_start != self.date_end else ''
+                date_range = f"{date_start} - {date_end}".strip(' - ')
+            object.__setattr__(self, '_date_range', date_range)
+        return self._date_range
 
     def getTimeRange(self) -> str:
         """Returns time-range of when event occurs"""
-        if not self.time_start:
-            return '---'
-        time_start = self.time_start.strftime('%H:%M')
-        time_end = self.time_end.strftime('%H:%M') if self.time_end else ''
-        return f"{time_start} - {time_end}".strip(' - ')
+        if self._time_range is None:
+            if not self.time_start:
+                time_range = '---'
+            else:
+                time_start = self.time_start.strftime('%H:%M')
+                time_end = self.time_end.strftime('%H:%M') if self.time_end else ''
+                time_range = f"{time_start} - {time_end}".strip(' - ')
+            object.__setattr__(self, '_time_range', time_range)
+        return self._time_range
     
 
-def mergeDuplicateEvents(events, check_duplicate_func=None, merge_func=None, verbose=False):
+# Merging functions
+def sameIDDate(eventA:Event, eventB:Event):
+    """Checks if two events are duplicate by their ID and start_date"""
+    if not (eventA and eventB):
+        utils.print_warning("One of the two events was `None`!")
+        return False
+    return eventA.id == eventB.id and eventA.date_start == eventB.date_start
+def mergeDate(eventA:Event, eventB:Event):
+    """Merges two events by appending only their date"""
+    if not (eventA and eventB):
+        utils.print_warning("One of the two events was `None`!")
+        if eventA:
+            return eventA
+        return eventB
+    eventA.date += ' & ' + eventB.date
+    return eventA
+def dontmerge(eventA:Event, eventB:Event):
+    """Simply discards eventB. Does not merge metadata."""
+    return eventA
+def eventKey(event:Event):
+    """Returns the identity of an event: (ID, start_date). Two events with the same key are duplicates."""
+    return event.id, event.date_start
+
+
+class EventDeduplicator():
+    """
+    Merges duplicate events in linear time.
+    Two events are duplicates if `key_func` returns the same (hashable) key for both.
+    Events can be streamed in; the first occurrence of an event keeps its position:
+
+    dedup = EventDeduplicator()
+    dedup.extend(events)
+    dedup.add(event)
+    events = dedup.events
+    """
+    def __init__(self, key_func=None, merge_func=None, verbose=False):
+        self.key_func = key_func if key_func else eventKey
+        self.merge_func = merge_func if merge_func else dontmerge
+        self.verbose = verbose
+        self.index = {}  # key -> position in self.events
+        self.events = []
+    def __len__(self):
+        return len(self.events)
+    def __iter__(self):
+        return iter(self.events)
+    def add(self, event:Event) -> Event:
+        """Adds event. If a duplicate has been added before, both are merged. Returns the (merged) event."""
+        if event is None:
+            utils.print_warning("Event was `None`!")
+            return None
+        key = self.key_func(event)
+        i = self.index.get(key)
+        if i is None:
+            self.index[key] = len(self.events)
+            self.events.append(event)
+            return event
+        eventA = self.merge_func(self.events[i], event)
+        self.events[i] = eventA
+        if self.verbose:
+            print("Merged events:\n\teventA: {}\n\teventB: {}".format(eventA.url,event.url))
+        return eventA
+    def extend(self, events:list[Event]):
+        """Adds all given events"""
+        for event in events:
+            self.add(event)
+
+
+def mergeDuplicateEvents(events, check_duplicate_func=None, merge_func=None, verbose=False, key_func=None):
     """
     Merges duplicate events in given list.
     Duplicate events happen when e.g. the same event is hold next week again.
     
     Optional arguments:
-        * check_duplicate_func: Pointer to function that checks if two events are identical. [Default: Check by event-ID]
+        * check_duplicate_func: Pointer to function that checks if two events are identical. [Default: Check by event-ID and start-date]
+          Prefer `key_func`: Comparing every pair of events takes quadratic time.
+        * key_func: Pointer to function that returns a hashable key per event; events with equal keys are identical. [Default: `eventKey`]
         * merge_func: Pointer to function that merges the events. [Default: Only merge event-dates]
         * verbose: Flag, defines if merged events shall be printed
     """
-    # Merging functions
-    def sameIDDate(eventA:Event, eventB:Event):
-        """Checks if two events are duplicate by their ID and start_date"""
-        if not (eventA and eventB):
-            utils.print_warning("One of the two events was `None`!")
-            return False
-        return eventA.id == eventB.id and eventA.date_start == eventB.date_start
-    def mergeDate(eventA:Event, eventB:Event):
-        """Merges two events by appending only their date"""
-        if not (eventA and eventB):
-            utils.print_warning("One of the two events was `None`!")
-            if eventA:
-                return eventA
-            return eventB
-        eventA.date += ' & ' + eventB.date
-        return eventA
-    def dontmerge(eventA:Event, eventB:Event):
-        """Simply discards eventB. Does not merge metadata."""
-        return eventA
-
     # Process mergefunc
     if type(merge_func) is str:
         merge_func = {'mergeDate':mergeDate,'dontmerge':dontmerge}.get(merge_func, dontmerge)
 
     # Fallback: If no check/merging functions given, use the default (merge if same ID; merge by date)
-    if check_duplicate_func is None:
-        check_duplicate_func = sameIDDate
     if merge_func is None:
         merge_func = dontmerge
 
+    # Fast path: Merge by key in linear time
+    if check_duplicate_func is None or key_func is not None:
+        dedup = EventDeduplicator(key_func=key_func, merge_func=merge_func, verbose=verbose)
+        dedup.extend(events)
+        events[:] = dedup.events
+        return events
+
     # Loop over entire event array
     i = 0
     while i < len(events):
@@ -140,3 +280,45 @@ def mergeDuplicateEvents(events, check_duplicate_func=None, merge_func=None, ver
             j += 1
         i += 1
     return events
+
+
+if __name__ == '__main__':
+    # Benchmark of the event representation: python -m cogs.utils.event [number of events]
+    import sys
+    import types
+    import datetime
+    import timeit
+    import tracemalloc
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    day = datetime.date(2026, 10, 18)
+    def fields(i:int) -> dict:
+        return {'id': f'TC{i}', 'name': f'Event {i}', 'description': 'Description', 'url': 'https://example.com', 'img': '',
+                'date_start': day, 'date_end': day + datetime.timedelta(days=i % 3), 'date_fuzzy': '',
+                'time_start': datetime.time(10), 'time_end': datetime.time(18), 'location': 'Tokyo', 'cost': 'Free',
+                'status': '', 'other': '', 'visibility': 'Kanto', 'source': 'Web:TokyoCheapo', 'date_added': None, 'updated_at': None}
+    values = [fields(i) for i in range(count)]
+
+    def measure(factory) -> float:
+        """Returns the bytes allocated per object"""
+        tracemalloc.start()
+        objects = [factory(**value) for value in values]
+        size, _ = tracemalloc.get_traced_memory()  # While the objects are alive
+        tracemalloc.stop()
+        return size / len(objects)
+    print(f"Memory per event ({count} events):")
+    print(f"  > with __dict__: {measure(types.SimpleNamespace):7.1f} bytes")
+    print(f"  > Event:         {measure(Event):7.1f} bytes")
+
+    events = [Event(**value) for value in values]
+    def render(events):
+        for event in events:
+            event.getDateRange()
+            event.getTimeRange()
+            event.getContentHash()
+    uncached = timeit.timeit(lambda: render([Event(**value) for value in values]), number=1) - timeit.timeit(lambda: [Event(**value) for value in values], number=1)
+    render(events)
+    cached = timeit.timeit(lambda: render(events), number=1)
+    print("Date range, time range and content hash per event:")
+    print(f"  > first use: {uncached / count * 1e6:7.2f} µs")
+    print(f"  > cached:    {cached / count * 1e6:7.2f} µs")
@@ -3,37 +3,177 @@
 Scraps events from pre-defined websites.
 """
 
+import re
 import sys
-from bs4 import BeautifulSoup as soup
-from urllib.request import urlopen
+import time
+import threading
+import contextlib
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime, pytz
 from dateutil.parser import parse as parse_date
+from functools import lru_cache
 import calendar
 from .event import Event, mergeDuplicateEvents
+from .http_cache import httpCache
+from .card_extractor import extractCards
 from . import database
+from . import utils
 
 
-def grabPage(url: str):
-    """Return html-code of a given url as soup"""
-    uClient = urlopen(url)
-    page_html = uClient.read()
-    uClient.close()
-    return soup(page_html, "html.parser")
+# Maximum number of pages that are fetched at the same time (1 = crawl sequentially)
+CRAWL_MAX_WORKERS = 8
+
+# Maximum number of simultaneous requests to the same host
+CRAWL_MAX_PER_HOST = 4
+
+# Minimum delay in seconds between two requests to the same host
+CRAWL_HOST_DELAY = 0.25
+
+# For how many pages the extracted event cards are kept in memory, so pages that have not changed since the last crawl are not parsed again
+PAGE_CACHE_SIZE = 64
+
+# Timezone of the scrapped websites
+LOCAL_TZ = pytz.timezone('Asia/Tokyo')
+
+# How many distinct date and time strings are memoized (many events share the same date, e.g. "Mid Jun ~ Late Jul")
+DATE_CACHE_SIZE = 1024
+
+# Date formats used on Tokyo Cheapo and Japan Cheapo, e.g. "Jun 5", "Mid Jun", "Late Jul 2022", "Jun 5, 2022".
+# Everything else is parsed by dateutil.
+TC_DATE_PATTERN = re.compile(r'^(?:(Early|Mid|Late|End) +)?([A-Za-z]+)(?: +(\d{1,2}))?(?:,? +(\d{4}))?$')
+
+# Time formats used on Tokyo Cheapo and Japan Cheapo, e.g. "10:00", "10:30 pm", "7pm". Everything else is parsed by dateutil.
+TC_TIME_PATTERN = re.compile(r'^(\d{1,2})(?::(\d{2}))? *(?:([AaPp])\.?[Mm]\.?)?$')
+
+# Month names as understood by dateutil
+MONTHS = {name.lower(): i for i in range(1, 13) for name in (calendar.month_abbr[i], calendar.month_name[i])}
+MONTHS['sept'] = 9
+
+# Prefectures crawled on Japan Cheapo, grouped by region (= visibility of the events)
+JC_REGIONS = {
+    'Chubu': ['Niigata','Ishikawa','Fukui','Yamanashi','Nagano','Gifu','Shizuoka','Aichi'],
+    'Chugoku': ['Shimane','Okayama','Hiroshima','Yamaguchi'],
+    'Hokkaido': ['Hokkaido'],
+    'Kansai': ['Mie','Shiga','Kyoto','Osaka','Hyogo','Nara','Wakayama'], # Himeji, Kobe are also options, but are also included in Hyogo
+    'Kanto': ['Tochigi'], # Tokyo, Ibaraki, Gunma... are left out because they are published on Tokyo Cheapo
+    'Kyushu': ['Fukuoka','Saga','Nagasaki','Kumamoto','Oita','Miyazaki'],
+    'Okinawa': ['Okinawa'],
+    'Shikoku': ['Tokushima','Kagawa'],
+    'Tohoku': ['Aomori','Iwate','Miyagi','Akita','Yamagata','Fukushima'],
+}
+
+
+class HostLimiter():
+    """
+    Politeness limiter for crawling several pages at once.
+    Bounds the number of simultaneous requests per host, and spaces requests to the same host by a minimum delay.
+    Can be shared between threads:
+
+    with limiter.limit(url):
+        # fetch url
+    """
+    def __init__(self, max_per_host=CRAWL_MAX_PER_HOST, delay=CRAWL_HOST_DELAY):
+        self.max_per_host = max_per_host
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.next_slot = {}
+    @contextlib.contextmanager
+    def limit(self, url: str):
+        """Blocks until a request to the host of `url` is allowed"""
+        host = urlparse(url).netloc
+        with self.lock:
+            semaphore = self.semaphores.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            # Reserve the next free time slot of this host, then wait for it
+            with self.lock:
+                now = time.monotonic()
+                slot = max(now, self.next_slot.get(host, now))
+                self.next_slot[host] = slot + self.delay
+            if slot > now:
+                time.sleep(slot - now)
+            yield
+
+
+# Extracted event cards of crawled pages, keyed by (url, digest of the page)
+pageCache = utils.LRUCache(maxsize=PAGE_CACHE_SIZE)
+
+def grabCards(url: str) -> list[dict]:
+    """Return the raw fields of all event cards of a given url
+
+    Pages are fetched through the HTTP cache. If a page has not changed since it was last crawled, its previously extracted cards are reused.
+    """
+    page_html, digest = httpCache.fetch(url)
+    cards = pageCache.get((url, digest))
+    if cards is None:
+        cards = extractCards(page_html)
+        pageCache.put((url, digest), cards)
+    return cards
+
+def grabPages(urls: list[str], max_workers: int = CRAWL_MAX_WORKERS, limiter: HostLimiter = None, callback=None, grab=grabCards) -> list:
+    """Return `grab(url)` of all given urls (by default their event cards), in the same order as `urls`.
+
+    Pages are fetched concurrently by up to `max_workers` threads, while `limiter` keeps the crawl polite per host.
+    The optional `callback(url)` is called from the calling thread every time a page has been fetched.
+    Pass another `grab(url)` function to change what is returned per page.
+    """
+    if max_workers <= 1:  # Crawl sequentially
+        pages = []
+        for url in urls:
+            pages.append(grab(url))
+            if callback:
+                callback(url)
+        return pages
+    if limiter is None:
+        limiter = HostLimiter()
+    def grabPolitely(url):
+        with limiter.limit(url):
+            return grab(url)
+    pages = [None] * len(urls)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(grabPolitely, url): i for i, url in enumerate(urls)}
+        for future in as_completed(futures):
+            i = futures[future]
+            pages[i] = future.result()
+            if callback:
+                callback(urls[i])
+    return pages
+
+def parseTCDate(date: str, year: int) -> tuple[datetime.date, str]:
+    """Returns date and fuzzy keyword (e.g. 'Mid', or '' if there is none) of a single date of Tokyo Cheapo and Japan Cheapo Events.
+
+    Missing years default to `year`, missing days to the 1st.
+    The formats used by the websites are parsed directly; everything else falls back to dateutil.
+    """
+    match = TC_DATE_PATTERN.match(date)
+    if match and match.group(2).lower() in MONTHS:
+        fuzzy, month, day, year_ = match.groups()
+        try:
+            return datetime.date(int(year_) if year_ else year, MONTHS[month.lower()], int(day) if day else 1), fuzzy or ''
+        except ValueError:
+            pass  # Let dateutil decide what to do with it
+    date, fuzzy = parse_date(date, default=datetime.datetime(year, 1, 1, 0, 0, tzinfo=LOCAL_TZ), fuzzy_with_tokens=True)
+    fuzzy = [a.strip() for a in fuzzy]
+    return date.date(), fuzzy[0] if fuzzy else ''
 
 def getTCDate(date):
     """Returns date_start, date_end, date_fuzzy of Tokyo Cheapo and Japan Cheapo Events"""
-    # try:
-    #     parse_date(date, default=datetime.datetime(1978, 1, 1, 0, 0), fuzzy_with_tokens=True)
-    # except Exception:
-    #     return '', '', 'Unknown'
+    return getTCDateOfYear(date, datetime.datetime.now(tz=LOCAL_TZ).year)
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def getTCDateOfYear(date, year):
+    """Returns date_start, date_end, date_fuzzy of Tokyo Cheapo and Japan Cheapo Events. Dates without a year are set in `year`.
 
+    Results are memoized by (date, year).
+    """
     # Split date into two parts: start_date and end_date
     date = date.split(" ~ ")
 
     # Hotfix
     if len(date) > 1:
         try:
-            date_start, fuzzy = parse_date(date[0], default=datetime.datetime(datetime.datetime.now().year, 1, 1, 0, 0, tzinfo=pytz.timezone('Asia/Tokyo')), fuzzy_with_tokens=True)
+            parseTCDate(date[0], year)
         except Exception:
             date[0] = date[0] + ' ' + date[1].split()[1]
 
@@ -41,170 +181,168 @@ def getTCDate(date):
     # Get starting date
     ###########################
     # BUG: For dates like LATE JAN ~ LATE FEB 2022, the timerange being interpreted is 2021-2022. But it should be both in the year 2022!
-    date_start, fuzzy = parse_date(date[0], default=datetime.datetime(datetime.datetime.now().year, 1, 1, 0, 0, tzinfo=pytz.timezone('Asia/Tokyo')), fuzzy_with_tokens=True)
-    date_start = date_start.date()
+    date_start, fuzzy = parseTCDate(date[0], year)
 
     # Process fuzzy keywords, if there exists any
-    fuzzy = [a.strip() for a in fuzzy]
-    if fuzzy[0]:
-        if fuzzy[0].strip() == 'Early':
-            pass
-        if fuzzy[0].strip() == 'Mid':
-            date_start = parse_date(f"{date_start.year}-{date_start.month}-{'10'}").date()
-        if fuzzy[0].strip() == 'End' or fuzzy[0].strip() == 'Late':
-            date_start = parse_date(f"{date_start.year}-{date_start.month}-{'22'}").date()
-    
+    if fuzzy == 'Mid':
+        date_start = date_start.replace(day=10)
+    if fuzzy == 'End' or fuzzy == 'Late':
+        date_start = date_start.replace(day=22)
+
     ###########################
     # Get end date
     ###########################
     if len(date) > 1:  # Only if end date has been provided
-        date_end, fuzzy = parse_date(date[1], default=datetime.datetime(datetime.datetime.now().year, 1, 1, 0, 0, tzinfo=pytz.timezone('Asia/Tokyo')), fuzzy_with_tokens=True)
-        date_end = date_end.date()
-        fuzzy = [a.strip() for a in fuzzy]
+        date_end, fuzzy = parseTCDate(date[1], year)
     else:  # end date has not been provided -> set expectations from start_date
         date_end = date_start
-    
+
     # Process fuzzy keywords, if there exists any
-    if fuzzy[0]:
-        if fuzzy[0].strip() == 'Early':
-            date_end = parse_date(f"{date_end.year}-{date_end.month}-{'10'}").date()
-        if fuzzy[0].strip() == 'Mid':
-            date_end = parse_date(f"{date_end.year}-{date_end.month}-{'21'}").date()
-        if fuzzy[0].strip() == 'End' or fuzzy[0].strip() == 'Late':
-            date_end = parse_date(f"{date_end.year}-{date_end.month}-{calendar.monthrange(date_end.year, date_end.month)[1]}").date()
+    if fuzzy == 'Early':
+        date_end = date_end.replace(day=10)
+    if fuzzy == 'Mid':
+        date_end = date_end.replace(day=21)
+    if fuzzy == 'End' or fuzzy == 'Late':
+        date_end = date_end.replace(day=calendar.monthrange(date_end.year, date_end.month)[1])
 
     ###########################
     # Create proper fuzzy date string
     ###########################
-    if fuzzy[0] not in ['Early', 'Mid', 'End', 'Late']:
-        fuzzy[0] = ''
-    date_fuzzy = " ~ ".join(date) if fuzzy[0] else ''
+    if fuzzy not in ['Early', 'Mid', 'End', 'Late']:
+        fuzzy = ''
+    date_fuzzy = " ~ ".join(date) if fuzzy else ''
 
     return date_start, date_end, date_fuzzy
-    
 
+
+def parseTCTime(time: str) -> datetime.time:
+    """Returns a single time of Tokyo Cheapo and Japan Cheapo Events.
+
+    The formats used by the websites are parsed directly; everything else falls back to dateutil.
+    """
+    match = TC_TIME_PATTERN.match(time.strip())
+    if match and (match.group(2) or match.group(3)):  # A bare number would be a day for dateutil
+        hour, minute, meridiem = match.groups()
+        hour, minute = int(hour), int(minute or 0)
+        if meridiem and 1 <= hour <= 12:
+            hour = hour % 12 + (12 if meridiem in 'Pp' else 0)
+        elif meridiem:
+            hour = -1  # Invalid, e.g. "13pm"
+        if 0 <= hour <= 23 and minute <= 59:
+            return datetime.time(hour, minute, tzinfo=LOCAL_TZ)
+    return parse_date(time, default=datetime.datetime(datetime.datetime.now().year, 1, 1, 0, 0, tzinfo=LOCAL_TZ)).timetz()
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
 def getTCTime(time):
-    """Returns time_start and time_end of Tokyo Cheapo and Japan Cheapo Events"""
+    """Returns time_start and time_end of Tokyo Cheapo and Japan Cheapo Events. Results are memoized."""
     time = time.split(" – ")
     if not time[0]:
         return '', ''
-    time_start = parse_date(time[0], default=datetime.datetime(datetime.datetime.now().year, 1, 1, 0, 0, tzinfo=pytz.timezone('Asia/Tokyo'))).timetz()
+    time_start = parseTCTime(time[0])
     time_end = ''
     if len(time) > 1:
-        time_end = parse_date(time[1], default=datetime.datetime(datetime.datetime.now().year, 1, 1, 0, 0, tzinfo=pytz.timezone('Asia/Tokyo'))).timetz()
+        time_end = parseTCTime(time[1])
     return time_start, time_end
 
 
-def getEventsTC():
-    """Return events from Tokyo Cheapo"""
-    # Fetch soup from TokyoCheapo
+def cardToEvent(card: dict, id_prefix: str, visibility: str, source: str) -> Event:
+    """Returns event-object from the raw fields of a Tokyo Cheapo or Japan Cheapo event card"""
+    date_start, date_end, date_fuzzy = getTCDate(card['date'])
+    time_start, time_end = getTCTime(', '.join(card['time']))
+    return Event(
+        id=id_prefix+card['post_id'],
+        name=card['name'],
+        description=card['description'],
+        url=card['url'],
+        img=card['img'],
+        date_start=date_start,
+        date_end=date_end,
+        date_fuzzy=date_fuzzy,
+        time_start=time_start,
+        time_end=time_end,
+        location=', '.join(card['location']),
+        cost=', '.join(card['cost']),
+        status=', '.join(card['status']),
+        visibility=visibility,
+        source=source)
+
+def updateCoverage(coverage: dict, source: str, events: list[Event]):
+    """Narrows the date range a source is completely scrapped for (`coverage[source]`, its last start date) down to the events of one listing page.
+
+    The listings are ordered by date, but only their first page is crawled: events starting after the last event of a page may be on the next one.
+    An empty page lists all of its events, so it does not narrow the range.
+    """
+    if coverage is None or not events:
+        return
+    last = max(event.date_start for event in events)
+    coverage[source] = min(coverage.get(source, last), last)
+
+def getEventsTC(coverage: dict = None):
+    """Return events from Tokyo Cheapo
+
+    If a `coverage` dict is given, it is updated with the date range the events are complete for (see :func:`updateCoverage`).
+    """
+    # Fetch event cards from TokyoCheapo
     url = 'https://tokyocheapo.com/events/'
-    page = grabPage(url)
-    event_soup = page.findAll("article",{"class":"article card card--event"})
-    # Identify events in soup
-    events = []
-    for event_ in event_soup:
-        # Process date & Time
-        date=event_.findAll("div", class_="card--event__date-box")[0].div.text.strip().replace("\n"," ")
-        time=', '.join([t.parent.span.text.strip() for t in event_.findAll("div", title="Start/end time")])
-        date_start, date_end, date_fuzzy = getTCDate(date)
-        time_start, time_end = getTCTime(time)
-
-        # Create event-object
-        event = Event(
-            id='TC'+event_.findAll(attrs={"data-post-id" : True})[0]['data-post-id'].strip(),
-            name=event_.findAll("h3", class_="card__title")[0].text.strip(),
-            description=event_.findAll("p", class_="card__excerpt")[0].text.strip(),
-            url=event_.findAll("h3", class_="card__title")[0].a['href'],
-            img=event_.findAll("a",  class_="card__image")[0].img,
-            date_start=date_start,
-            date_end=date_end,
-            date_fuzzy=date_fuzzy,
-            time_start=time_start,
-            time_end=time_end,
-            location=', '.join([loc.text for loc in event_.findAll("a", class_="location")]),
-            cost=', '.join([cost.parent.text.strip() for cost in event_.findAll("div", title="Entry")]),
-            status=', '.join([stat.text.strip().lower() for stat in event_.findAll("div", class_="event-status")]),
-            visibility='Kanto',
-            source='Web:TokyoCheapo')
-        if event.img is not None: # Hotfix
-            event.img = event.img['data-src']
-        events.append(event)
+    cards = grabCards(url)
+    # Identify events in cards
+    events = [cardToEvent(card, 'TC', 'Kanto', 'Web:TokyoCheapo') for card in cards]
+    updateCoverage(coverage, 'Web:TokyoCheapo', events)
     # merge duplicate events: Merge date, check by ID
     #events = mergeDuplicateEvents(events,verbose=True)
     return events
 
-def getEventsJC():
-    """Return events from Japan Cheapo"""
-    regions = {
-        'Chubu': ['Niigata','Ishikawa','Fukui','Yamanashi','Nagano','Gifu','Shizuoka','Aichi'],
-        'Chugoku': ['Shimane','Okayama','Hiroshima','Yamaguchi'],
-        'Hokkaido': ['Hokkaido'],
-        'Kansai': ['Mie','Shiga','Kyoto','Osaka','Hyogo','Nara','Wakayama'], # Himeji, Kobe are also options, but are also included in Hyogo
-        'Kanto': ['Tochigi'], # Tokyo, Ibaraki, Gunma... are left out because they are published on Tokyo Cheapo
-        'Kyushu': ['Fukuoka','Saga','Nagasaki','Kumamoto','Oita','Miyazaki'],
-        'Okinawa': ['Okinawa'],
-        'Shikoku': ['Tokushima','Kagawa'],
-        'Tohoku': ['Aomori','Iwate','Miyagi','Akita','Yamagata','Fukushima'],
-        }
+def getEventsJC(max_workers: int = CRAWL_MAX_WORKERS, progress=None, coverage: dict = None):
+    """Return events from Japan Cheapo
+
+    All prefecture pages are crawled concurrently by up to `max_workers` threads.
+    The optional `progress(done, total)` is called every time a page has been crawled.
+    If a `coverage` dict is given, it is updated with the date range the events are complete for (see :func:`updateCoverage`).
+    """
+    prefectures = [(region, prefecture) for region in JC_REGIONS for prefecture in JC_REGIONS[region]]
+    urls = ['https://japancheapo.com/events/location/' + prefecture.lower() for _, prefecture in prefectures]
     # setup toolbar
-    WIDTH_PROGRESSBAR = len(regions)
-    sys.stdout.write("Progress: [%s]" % (" " * len(regions)))
+    WIDTH_PROGRESSBAR = len(urls)
+    sys.stdout.write("Progress: [%s]" % (" " * WIDTH_PROGRESSBAR))
     sys.stdout.flush()
-    sys.stdout.write("\b" * (len(regions)+1)) # return to start of line, after '['
-    # Crawl events
-    events = []
-    for i, region in enumerate(regions):
-        for prefecture in regions[region]:
-            # Fetch soup from JapanCheapo
-            url = 'https://japancheapo.com/events/location/' + prefecture.lower()
-            page = grabPage(url)
-            event_soup = page.findAll("article",{"class":"article card card--event"})
-            # Identify events in soup
-            prefecture_events = []
-            for event_ in event_soup:
-                # Process date & Time
-                date=event_.findAll("div", class_="card--event__date-box")[0].div.text.strip().replace("\n"," ")
-                time=', '.join([t.parent.span.text.strip() for t in event_.findAll("div", title="Start/end time")])
-                date_start, date_end, date_fuzzy = getTCDate(date)
-                time_start, time_end = getTCTime(time)
-
-                # Create event-object
-                event = Event(
-                    id='JC'+event_.findAll(attrs={"data-post-id" : True})[0]['data-post-id'].strip(),
-                    name=event_.findAll("h3", class_="card__title")[0].text.strip(),
-                    description=event_.findAll("p", class_="card__excerpt")[0].text.strip(),
-                    url=event_.findAll("h3", class_="card__title")[0].a['href'],
-                    img=event_.findAll("a",  class_="card__image")[0].img,
-                    date_start=date_start,
-                    date_end=date_end,
-                    date_fuzzy=date_fuzzy,
-                    time_start=time_start,
-                    time_end=time_end,
-                    location=', '.join([loc.text for loc in event_.findAll("a", class_="location")]),
-                    cost=', '.join([cost.parent.text.strip() for cost in event_.findAll("div", title="Entry")]),
-                    status=', '.join([stat.text.strip().lower() for stat in event_.findAll("div", class_="event-status")]),
-                    visibility=region,
-                    source='Web:JapanCheapo')
-                if event.img is not None: # Hotfix
-                    event.img = event.img['data-src']
-                prefecture_events.append(event)
-            # merge duplicate events: Merge date, check by ID
-            #prefecture_events = mergeDuplicateEvents(prefecture_events)
-            events.extend(prefecture_events)
-        # Update progressbar
+    sys.stdout.write("\b" * (WIDTH_PROGRESSBAR+1)) # return to start of line, after '['
+    crawled = 0
+    def updateProgressbar(url):
+        nonlocal crawled
+        crawled += 1
         sys.stdout.write("-")
         sys.stdout.flush()
+        if progress:
+            progress(crawled, len(urls))
+    # Crawl events
+    pages = grabPages(urls, max_workers=max_workers, callback=updateProgressbar)
+    sys.stdout.write("]\n") # this ends the progress bar
+    events = []
+    for (region, prefecture), cards in zip(prefectures, pages):
+        # Identify events in cards
+        prefecture_events = [cardToEvent(card, 'JC', region, 'Web:JapanCheapo') for card in cards]
+        updateCoverage(coverage, 'Web:JapanCheapo', prefecture_events)
+        # merge duplicate events: Merge date, check by ID
+        #prefecture_events = mergeDuplicateEvents(prefecture_events)
+        events.extend(prefecture_events)
     # merge duplicate events: Merge date, check by ID
     #events = mergeDuplicateEvents(events,verbose=True)
-    sys.stdout.write("]\n") # this ends the progress bar
     return events
 
-def getEvents() -> list[Event]:
-    """Scraps all event sources. Returns list of scrapped events."""
+def getEvents(max_workers: int = CRAWL_MAX_WORKERS, progress=None, coverage: dict = None) -> list[Event]:
+    """Scraps all event sources. Returns list of scrapped events.
+
+    `max_workers` limits how many pages are crawled at the same time.
+    The optional `progress(done, total)` is called every time a page has been crawled.
+    If a `coverage` dict is given, the last start date up to which the events of each source are complete is stored in it: source -> date.
+    Since this function blocks until all pages are crawled, call it from a worker thread when running inside an event loop.
+    """
+    total = 1 + sum(len(prefectures) for prefectures in JC_REGIONS.values())
     events  = []
-    events += getEventsTC()
-    events += getEventsJC()
+    events += getEventsTC(coverage=coverage)
+    if progress:
+        progress(1, total)
+    events += getEventsJC(max_workers=max_workers, progress=(lambda done, _: progress(1+done, total)) if progress else None, coverage=coverage)
 
     # Print events
     # print("Found the following events:")
@@ -0,0 +1,137 @@
+"""In-memory store of upcoming events
+
+Posting and reminding ask for the events of some topics in a date duration, every time for the same small set of upcoming events.
+The store keeps the events that have not ended yet in memory, sorted by start date per topic (visibility),
+so these questions are answered without a database query. The database stays the system of record:
+the store is loaded from it, and refreshed with the events a scrap has changed.
+
+store = EventStore()
+store.load(eventDB.getEvents(from_date=today, mode='overlap'), since=today)
+if store.covers(from_date):
+    events = store.getEvents(['Kanto', 'Kansai'], from_date, until_date, mode='starting')
+"""
+
+import bisect
+import datetime
+import heapq
+
+from .event import Event, eventKey
+from .database import EVENT_QUERY_MODES
+
+
+def getDateEnd(event:Event) -> datetime.date:
+    """Returns the last day of an event. Events without end date last one day; ends before the start are ignored (like `EVENT_DATERANGE`)."""
+    if not event.date_end or event.date_end < event.date_start:
+        return event.date_start
+    return event.date_end
+
+def getSortKey(event:Event) -> tuple:
+    """Returns the position of an event in query results: by start date, then ID"""
+    return event.date_start, event.id
+
+
+class TopicIndex():
+    """
+    Events of one topic, sorted by start date.
+    Events overlapping a date duration are found by bisecting the start dates, looking back as far as the longest event lasts.
+    """
+    def __init__(self):
+        self.keys = []  # (date_start, id), sorted
+        self.events = []  # events in the order of `keys`
+        self.max_days = 0  # duration of the longest event (stays at its maximum when events are removed)
+    def __len__(self):
+        return len(self.events)
+    def add(self, event:Event):
+        """Adds an event, or replaces the event with the same key."""
+        key = getSortKey(event)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            self.events[i] = event
+        else:
+            self.keys.insert(i, key)
+            self.events.insert(i, event)
+        self.max_days = max(self.max_days, (getDateEnd(event) - event.date_start).days)
+    def remove(self, event:Event):
+        """Removes an event (if it exists)."""
+        key = getSortKey(event)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+            del self.events[i]
+    def find(self, from_date:datetime.date, until_date:datetime.date=None, mode:str='within') -> list[Event]:
+        """Returns the events in the date duration, sorted by start date (see :meth:`DBEvent.getEvents` for `mode`).
+
+        Unlike the database, 'within' never returns events that start after `until_date` (only possible for events that end before they start).
+        """
+        first = from_date - datetime.timedelta(days=self.max_days) if mode == 'overlap' else from_date
+        lo = bisect.bisect_left(self.keys, (first,))
+        hi = len(self.keys) if until_date is None else bisect.bisect_left(self.keys, (until_date + datetime.timedelta(days=1),), lo)
+        events = self.events[lo:hi]
+        if mode == 'overlap':
+            return [event for event in events if getDateEnd(event) >= from_date]
+        if mode == 'within' and until_date is not None:
+            return [event for event in events if event.date_end and event.date_end <= until_date]
+        return events
+
+
+class EventStore():
+    """
+    Upcoming events indexed by topic and date.
+    The store holds every event that has not ended before `since`, so it can answer queries of durations from `since` on.
+    """
+    def __init__(self):
+        self.since = None  # first day the store is complete for, ``None`` if not loaded
+        self.updated_at = None  # latest `updated_at` of the events: changes up to then are in the store
+        self.events = {}  # eventKey -> event
+        self.topics = {}  # visibility -> TopicIndex
+    def __len__(self):
+        return len(self.events)
+    def load(self, events:list[Event], since:datetime.date):
+        """Replaces the content of the store with the given events: all events that have not ended before `since`."""
+        self.events = {}
+        self.topics = {}
+        self.since = since
+        self.updated_at = None
+        self.update(events)
+    def clear(self):
+        """Empties the store, queries are no longer covered until it is loaded again."""
+        self.load([], None)
+    def update(self, events:list[Event]):
+        """Adds new events and replaces changed ones. Events that ended before `since` are left out."""
+        for event in events:
+            if event.updated_at is not None and (self.updated_at is None or event.updated_at > self.updated_at):
+                self.updated_at = event.updated_at
+            key = eventKey(event)
+            old = self.events.pop(key, None)
+            if old is not None:
+                self.topics[old.visibility].remove(old)
+            if self.since is None or getDateEnd(event) < self.since:
+                continue
+            self.events[key] = event
+            self.topics.setdefault(event.visibility, TopicIndex()).add(event)
+    def covers(self, from_date:datetime.date) -> bool:
+        """Returns whether the store holds all events of durations starting at `from_date`."""
+        return self.since is not None and from_date is not None and from_date >= self.since
+    def getEvents(self, visibility:list[str], from_date:datetime.date, until_date:datetime.date=None, mode:str='within') -> list[Event]:
+        """Returns the events of the given topics in the date duration, sorted by start date and ID (see :meth:`DBEvent.getEvents` for `mode`).
+        Like :meth:`DBEvent.getEvents`, events of every topic are returned if no topics are given."""
+        if mode not in EVENT_QUERY_MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {EVENT_QUERY_MODES}")
+        if not self.covers(from_date):
+            raise ValueError(f"Events from {from_date} on are not in the store (loaded since {self.since})")
+        found = [self.topics[topic].find(from_date, until_date, mode) for topic in (set(visibility) if visibility else self.topics) if topic in self.topics]
+        if len(found) == 1:
+            return found[0]
+        return list(heapq.merge(*found, key=getSortKey))  # Every event has one topic, so there are no duplicates
+    def getEventsByChannel(self, channel_visibility:dict[int,list[str]], from_date:datetime.date, until_date:datetime.date=None, mode:str='within') -> dict[int, list[Event]]:
+        """Returns the events of every given channel (channel_id -> subscribed topics) in the date duration: channel_id -> events.
+        An event subscribed by several channels is the same :class:`Event` object in all lists. Channels without topics get no events."""
+        return {channel_id: self.getEvents(visibility, from_date, until_date, mode) if visibility else [] for channel_id, visibility in channel_visibility.items()}
+    def getEventsByTopics(self, channel_visibility:dict[int,list[str]], from_date:datetime.date, until_date:datetime.date=None, mode:str='within') -> dict[tuple, tuple[list[int], list[Event]]]:
+        """Returns the events of every distinct set of subscribed topics of the given channels (channel_id -> subscribed topics).
+        Channels that subscribed to the same topics get the same events, so the events of each set are only looked up once.
+        Returns a dictionary topics -> (channel_ids, events), the topics being a sorted tuple."""
+        groups = {}
+        for channel_id, visibility in sorted(channel_visibility.items()):
+            groups.setdefault(tuple(sorted(set(visibility or []))), []).append(channel_id)
+        return {topics: (channel_ids, self.getEvents(topics, from_date, until_date, mode) if topics else []) for topics, channel_ids in groups.items()}
@@ -0,0 +1,154 @@
+"""HTTP cache
+
+Persistent on-disk cache for crawled web pages.
+Cached pages are revalidated with conditional requests (ETag / Last-Modified), so pages that have not changed are not downloaded again.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+from . import utils
+
+
+# Directory where cached pages are stored
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', os.path.join('.cache', 'http'))
+
+# Maximum size in bytes of all cached pages together. Least recently used pages are evicted first.
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+
+
+class HTTPCache():
+    """
+    Class helper to fetch web pages through a persistent cache.
+    Every url is stored as two files in the cache directory:
+    - `<key>.json`: metadata (url, ETag, Last-Modified, digest of the body)
+    - `<key>.html`: the body of the page
+
+    body, digest = cache.fetch(url)
+    """
+    def __init__(self, directory=HTTP_CACHE_DIR, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    def key(self, url: str) -> str:
+        """Returns the file name (without extension) under which `url` is cached"""
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+    def load(self, url: str) -> tuple[dict, bytes]:
+        """Returns metadata and body of the cached page, or `(None, None)` if `url` is not cached"""
+        path = os.path.join(self.directory, self.key(url))
+        try:
+            with open(path + '.json', 'r') as f:
+                meta = json.load(f)
+            with open(path + '.html', 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if meta.get('url') != url:
+            return None, None
+        return meta, body
+    def store(self, url: str, body: bytes, headers) -> dict:
+        """Stores page in cache, then evicts old pages if the cache grew too large. Returns the metadata of the page."""
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'digest': hashlib.sha1(body).hexdigest(),
+        }
+        if len(body) > self.max_bytes:  # Page would never fit into the cache
+            return meta
+        path = os.path.join(self.directory, self.key(url))
+        try:
+            with self.lock:
+                os.makedirs(self.directory, exist_ok=True)
+                # Write to temporary files first, so a crash never leaves a half written page behind
+                with open(path + '.html.tmp', 'wb') as f:
+                    f.write(body)
+                with open(path + '.json.tmp', 'w') as f:
+                    json.dump(meta, f)
+                os.replace(path + '.html.tmp', path + '.html')
+                os.replace(path + '.json.tmp', path + '.json')
+                self.evict()
+        except OSError as e:
+            utils.print_warning(f"Could not cache page {url}: {e}")
+        return meta
+    def touch(self, url: str):
+        """Marks cached page as recently used"""
+        try:
+            os.utime(os.path.join(self.directory, self.key(url)) + '.html')
+        except OSError:
+            pass
+    def evict(self):
+        """Deletes least recently used pages until the cache is smaller than `max_bytes`"""
+        pages = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.html'):
+                stat = os.stat(os.path.join(self.directory, filename))
+                pages.append((stat.st_mtime, stat.st_size, filename[:-len('.html')]))
+        size = sum(page[1] for page in pages)
+        for _, page_size, key in sorted(pages):
+            if size <= self.max_bytes:
+                break
+            for ext in ('.html', '.json'):
+                try:
+                    os.remove(os.path.join(self.directory, key + ext))
+                except OSError:
+                    pass
+            size -= page_size
+    def clear(self):
+        """Deletes all cached pages"""
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                return
+            for filename in os.listdir(self.directory):
+                if filename.endswith(('.html', '.json')):
+                    os.remove(os.path.join(self.directory, filename))
+    def fetch(self, url: str) -> tuple[bytes, str]:
+        """Returns body of the page and its digest.
+
+        If the page is cached, it is only downloaded again if it has changed on the server (conditional request).
+        The digest identifies the content of the body, so parsed pages can be reused as long as the digest stays the same.
+        """
+        meta, body = self.load(url)
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            uClient = urlopen(Request(url, headers=headers))
+        except HTTPError as e:
+            if e.code == 304 and meta:  # Not modified -> serve from cache
+                with self.lock:  # Pages are fetched from several threads
+                    self.hits += 1
+                self.touch(url)
+                return body, meta['digest']
+            raise
+        page_html = uClient.read()
+        response_headers = uClient.headers
+        uClient.close()
+        with self.lock:
+            self.misses += 1
+        meta = self.store(url, page_html, response_headers)
+        return page_html, meta['digest']
+
+
+# Default cache
+httpCache = HTTPCache()
+
+
+if __name__ == '__main__':
+    import sys
+    args = sys.argv[1:]
+    for arg in args:
+        if arg == 'clear':
+            httpCache.clear()
+            print(f"Cleared HTTP cache in '{httpCache.directory}'")
+        else:
+            print(f"argument '{arg}' unknown. SKIP")
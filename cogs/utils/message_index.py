@@ -0,0 +1,171 @@
+"""Index of recent bot messages per channel
+
+Searching a channel for posted events or today's reminder means paging through its history (one API request per 100 messages).
+Instead, the history of a channel is read once, and the bot's messages are indexed in memory:
+events by (event-ID, date-field) of their embeds, reminders by their header line (which contains the date of the reminder).
+Listeners of the cog keep the index current with new, edited and deleted messages, so lookups need no API request at all:
+
+index = MessageIndex()
+channel_index = await index.load(channel, accept=lambda message: message.author == bot.user)
+message_id, embed_index, webhook_id = channel_index.getEvent(event.id, f':date: ***{event.getDateRange()}***')
+reminder = channel_index.getReminder(header)
+"""
+
+import asyncio
+
+from collections import OrderedDict
+
+
+# How many messages of a channel's history are indexed when the channel is loaded
+MESSAGE_INDEX_DEPTH = 100
+
+# Maximum number of bot messages that are kept per channel; the oldest are dropped first
+MESSAGE_INDEX_SIZE = 500
+
+# Start of every reminder message
+REMINDER_PREFIX = '***\\*\\*\\*Reminder'
+
+
+def getEventKeys(message) -> list[tuple[tuple[str,str],int]]:
+    """Returns the events embedded in a message: ((event-ID in the footer, date-field), position of the embed)"""
+    keys = []
+    for index, embed in enumerate(message.embeds):
+        if not embed.footer.text:
+            continue
+        # Only event-embeds have a date-field
+        datefield = next((field for field in embed.fields if field.value.startswith(':date:')), None)
+        if datefield is None:
+            continue
+        keys.append(((embed.footer.text.split()[-1], datefield.value), index))
+    return keys
+
+def getReminderKey(message) -> str:
+    """Returns the header line of a reminder message, ``None`` if the message is not a reminder."""
+    if not message.content.startswith(REMINDER_PREFIX):
+        return None
+    return message.content.split('\n', 1)[0]
+
+
+class ChannelIndex():
+    """
+    Indexed bot messages of one channel. When several messages hold the same event or reminder, the newest one is found.
+    All bot messages newer than `since` are indexed, so a bot message newer than that which is not indexed has been deleted.
+    """
+    def __init__(self, maxsize:int=MESSAGE_INDEX_SIZE, since:int=0):
+        self.maxsize = maxsize
+        self.since = since  # message ID after which the index is complete (older messages were not read or have been dropped)
+        self.messages = OrderedDict()  # message_id -> message (``None`` if its content is outdated), oldest first
+        self.keys = {}  # message_id -> (event keys, reminder key) of the message
+        self.events = {}  # (event_id, date-field) -> (message_id, embed index, webhook_id)
+        self.reminders = {}  # header line -> message_id
+    def __len__(self):
+        return len(self.messages)
+    def add(self, message):
+        """Indexes a new or edited message."""
+        self.remove(message.id)
+        event_keys, reminder_key = getEventKeys(message), getReminderKey(message)
+        self.messages[message.id] = message
+        self.keys[message.id] = (event_keys, reminder_key)
+        for key, index in event_keys:
+            if key not in self.events or self.events[key][0] < message.id:  # Message IDs grow over time
+                self.events[key] = (message.id, index, message.webhook_id)
+        if reminder_key is not None and (reminder_key not in self.reminders or self.reminders[reminder_key] < message.id):
+            self.reminders[reminder_key] = message.id
+        while len(self.messages) > self.maxsize:
+            message_id = next(iter(self.messages))
+            self.remove(message_id)
+            self.since = max(self.since, message_id)
+    def remove(self, message_id:int):
+        """Removes a (deleted) message from the index."""
+        if self.messages.pop(message_id, False) is False:
+            return
+        event_keys, reminder_key = self.keys.pop(message_id)
+        for key, _ in event_keys:
+            if self.events.get(key, (None,))[0] == message_id:
+                del self.events[key]
+        if reminder_key is not None and self.reminders.get(reminder_key) == message_id:
+            del self.reminders[reminder_key]
+    def invalidate(self, message_id:int):
+        """Marks the content of a message as outdated (e.g. edited elsewhere), so it is fetched again when needed."""
+        if message_id in self.messages:
+            self.messages[message_id] = None
+    def isDeleted(self, message_id:int) -> bool:
+        """Returns whether a bot message has been deleted: it is newer than `since`, but not indexed."""
+        return message_id > self.since and message_id not in self.messages
+    def getMessage(self, message_id:int):
+        """Returns the indexed message, ``None`` if it is unknown or its content is outdated."""
+        return self.messages.get(message_id)
+    def getEvent(self, event_id:str, datefield:str) -> tuple[int,int,int]:
+        """Returns (message_id, embed index, webhook_id) of the newest message of an event, ``None`` if there is none."""
+        return self.events.get((event_id, datefield))
+    def getReminder(self, header:str) -> int:
+        """Returns the ID of the newest reminder with the given header line, ``None`` if there is none."""
+        return self.reminders.get(header)
+
+
+class MessageIndex():
+    """
+    :class:`ChannelIndex` of every channel that has been loaded.
+    Changes of channels that are not loaded are ignored.
+    """
+    def __init__(self, depth:int=MESSAGE_INDEX_DEPTH, maxsize:int=MESSAGE_INDEX_SIZE):
+        self.depth = depth
+        self.maxsize = maxsize
+        self.channels = {}  # channel_id -> ChannelIndex
+        self.loading = {}  # channel_id -> task reading the history
+        self.pending = {}  # channel_id -> changes that happened while reading the history: (method, argument)
+    def __contains__(self, channel_id:int):
+        return channel_id in self.channels
+    def get(self, channel_id:int) -> ChannelIndex:
+        """Returns the index of a loaded channel, ``None`` if the channel is not loaded."""
+        return self.channels.get(channel_id)
+    async def load(self, channel, accept) -> ChannelIndex:
+        """Returns the index of a channel. The history of the channel is read once, concurrent calls wait for the same read.
+
+        Parameters
+        ------------
+        channel: :class:`discord.TextChannel`
+            The channel to be indexed.
+        accept: Callable[[:class:`discord.Message`], :class:`bool`]
+            Tells whether a message of the history is indexed (e.g. only messages of the bot).
+        """
+        if channel.id in self.channels:
+            return self.channels[channel.id]
+        if channel.id not in self.loading:
+            self.loading[channel.id] = asyncio.create_task(self.read(channel, accept))
+        return await asyncio.shield(self.loading[channel.id])
+    async def read(self, channel, accept) -> ChannelIndex:
+        """Reads the history of a channel into a new index."""
+        self.pending[channel.id] = []
+        try:
+            history = [message async for message in channel.history(limit=self.depth)]
+            # If the history is longer than what was read, messages older than the oldest read message are unknown
+            since = history[-1].id - 1 if history and len(history) >= self.depth else 0
+            channel_index = ChannelIndex(self.maxsize, since)
+            for message in reversed([message for message in history if accept(message)]):  # History is newest first
+                channel_index.add(message)
+            for method, argument in self.pending[channel.id]:
+                getattr(channel_index, method)(argument)
+            self.channels[channel.id] = channel_index
+            return channel_index
+        finally:
+            del self.pending[channel.id]
+            del self.loading[channel.id]
+    def update(self, channel_id:int, method:str, argument):
+        """Applies a change to the index of a channel, if the channel is loaded (or being loaded)."""
+        if channel_id in self.pending:
+            self.pending[channel_id].append((method, argument))
+        elif channel_id in self.channels:
+            getattr(self.channels[channel_id], method)(argument)
+    def add(self, message):
+        """Indexes a new or edited message."""
+        self.update(message.channel.id, 'add', message)
+    def remove(self, channel_id:int, message_id:int):
+        """Removes a deleted message."""
+        self.update(channel_id, 'remove', message_id)
+    def invalidate(self, channel_id:int, message_id:int):
+        """Marks the content of a message as outdated."""
+        self.update(channel_id, 'invalidate', message_id)
+    def drop(self, channel_id:int):
+        """Forgets the index of a channel."""
+        self.channels.pop(channel_id, None)
@@ -0,0 +1,105 @@
+"""Schedule of per-channel jobs
+
+Every channel has its own times (in CRON format) when new events are posted and reminders are sent.
+The times are read by apscheduler's `CronTrigger.from_crontab`, which counts weekdays from 0 = Monday to 6 = Sunday
+(unlike UNIX cron, where 0 is Sunday); weekday names (mon-sun) mean the same in both.
+Instead of one cron job that works on all channels at once, the next fire time of every (channel, job) is kept in a heap,
+so the bot only wakes up when the earliest job is due, and only works on the channels that are due:
+
+schedule = FireHeap(timezone=LOCAL_TZ)
+schedule.set((channel_id, 'remind'), '0 9 * * *')
+await asyncio.sleep(schedule.getDelay(now))
+for channel_id, kind in schedule.popDue(now):
+    ...
+"""
+
+import heapq
+import datetime
+import itertools
+
+from apscheduler.triggers.cron import CronTrigger
+
+
+class FireHeap():
+    """
+    Heap of the next fire times of jobs. A job is identified by a hashable key and fires at the times of its crontab.
+
+    Due jobs are taken with :meth:`popDue`, which also pushes their following fire time.
+    Changed or removed jobs are not searched in the heap; their old entries are skipped once they come up.
+    """
+    def __init__(self, timezone):
+        self.timezone = timezone
+        self.heap = []  # (fire time, sequence, key, version)
+        self.jobs = {}  # key -> (crontab, trigger, version)
+        self.triggers = {}  # crontab -> trigger, shared by jobs with the same times (only crontabs of current jobs)
+        self.uses = {}  # crontab -> number of jobs with these times
+        self.counter = itertools.count()
+    def __len__(self):
+        return len(self.jobs)
+    def __contains__(self, key):
+        return key in self.jobs
+    def getTrigger(self, crontab:str) -> CronTrigger:
+        """Returns the trigger of `crontab`, e.g. to check a crontab before it is set. Raises :class:`ValueError` if the crontab is invalid.
+
+        Only triggers of current jobs are cached, so checking arbitrary crontabs does not fill the cache.
+        """
+        if crontab in self.triggers:
+            return self.triggers[crontab]
+        return CronTrigger.from_crontab(crontab, timezone=self.timezone)
+    def set(self, key, crontab:str, now:datetime.datetime=None):
+        """Adds the job `key` firing at the times of `crontab`, or changes the times of an existing job."""
+        if key in self.jobs and self.jobs[key][0] == crontab:
+            return
+        trigger = self.getTrigger(crontab)
+        self.remove(key)
+        self.triggers[crontab] = trigger
+        self.uses[crontab] = self.uses.get(crontab, 0) + 1
+        version = next(self.counter)
+        self.jobs[key] = (crontab, trigger, version)
+        self.push(key, trigger, version, now or datetime.datetime.now(tz=self.timezone))
+    def remove(self, key):
+        """Removes the job `key` (if it exists)."""
+        job = self.jobs.pop(key, None)
+        if job is None:
+            return
+        crontab = job[0]
+        self.uses[crontab] -= 1
+        if not self.uses[crontab]:  # No job has these times anymore
+            del self.uses[crontab]
+            del self.triggers[crontab]
+    def push(self, key, trigger:CronTrigger, version:int, now:datetime.datetime):
+        """Pushes the next fire time of a job, at or after `now`."""
+        fire_time = trigger.get_next_fire_time(None, now)
+        if fire_time is not None:
+            heapq.heappush(self.heap, (fire_time, next(self.counter), key, version))
+    def discardStale(self):
+        """Drops entries of changed or removed jobs from the top of the heap."""
+        while self.heap:
+            _, _, key, version = self.heap[0]
+            job = self.jobs.get(key)
+            if job is not None and job[2] == version:
+                return
+            heapq.heappop(self.heap)
+    def getNextTime(self, match=None) -> datetime.datetime:
+        """Returns the earliest fire time of all jobs (or of the jobs whose key satisfies `match`), ``None`` if there are no such jobs."""
+        self.discardStale()
+        if match is None:
+            return self.heap[0][0] if self.heap else None
+        return min((fire_time for fire_time, _, key, version in self.heap
+                    if match(key) and key in self.jobs and self.jobs[key][2] == version), default=None)
+    def getDelay(self, now:datetime.datetime, maximum:float=None) -> float:
+        """Returns the seconds until the earliest job is due (at most `maximum`), ``maximum`` if there are no jobs."""
+        next_time = self.getNextTime()
+        if next_time is None:
+            return maximum
+        delay = max(0.0, (next_time - now).total_seconds())
+        return delay if maximum is None else min(delay, maximum)
+    def popDue(self, now:datetime.datetime) -> list:
+        """Returns the keys of all jobs due at `now`, and pushes their following fire times."""
+        due = []
+        while self.getNextTime() is not None and self.heap[0][0] <= now:
+            _, _, key, version = heapq.heappop(self.heap)
+            due.append(key)
+            # Missed fire times (e.g. while the bot was busy) are skipped, the job fires once
+            self.push(key, self.jobs[key][1], version, now + datetime.timedelta(microseconds=1))
+        return due
@@ -7,8 +7,10 @@ import asyncio
 import calendar
 import datetime
 import pytz
+import threading
 # import builtins
 
+from collections import OrderedDict
 from functools import wraps
 
 
@@ -65,6 +67,42 @@ class bcolors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
+class LRUCache():
+    """
+    Dictionary of bounded size. When it is full, the least recently used item is evicted.
+    Can be shared between threads.
+    """
+    def __init__(self, maxsize:int=128):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+    def __len__(self):
+        return len(self.data)
+    def __contains__(self, key):
+        return key in self.data
+    def get(self, key, default=None):
+        """Returns the item of `key` (and marks it as recently used), or `default` if it is not cached."""
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+    def put(self, key, value):
+        """Caches `value` under `key`. Evicts the least recently used item if the cache is full."""
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+    def pop(self, key, default=None):
+        """Removes the item of `key` and returns it, or `default` if it is not cached."""
+        with self.lock:
+            return self.data.pop(key, default)
+    def clear(self):
+        """Removes all items."""
+        with self.lock:
+            self.data.clear()
+
 def print_color(text:str, color:str):
     """
     Print function for colors.
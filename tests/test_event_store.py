@@ -0,0 +1,136 @@
+"""Tests of the in-memory event store
+
+The store answers the same questions as `DBEvent.getEvents`, so its results are compared with the SQL semantics of the query modes
+(see `dateConditions` and `EVENT_DATERANGE` in the database module):
+- 'within':   date_start >= from AND date_end <= until
+- 'starting': date_start >= from AND date_start <= until
+- 'overlap':  daterange(date_start, GREATEST(date_start, COALESCE(date_end, date_start)), '[]') && daterange(from, until, '[]')
+
+Run with: python -m pytest -q tests
+"""
+
+import os
+import datetime
+import itertools
+import unittest
+
+os.environ.setdefault('DB_PW', '')  # The database module is imported for its query modes, no connection is made
+
+from cogs.utils.event import Event
+from cogs.utils.event_store import EventStore, TopicIndex
+
+
+DAY = datetime.date(2026, 10, 18)
+
+def day(offset:int) -> datetime.date:
+    return DAY + datetime.timedelta(days=offset)
+
+def sqlMatches(event:Event, from_date:datetime.date, until_date:datetime.date, mode:str) -> bool:
+    """Returns whether the SQL conditions of `mode` match the event. Comparisons with NULL are not true, like in SQL."""
+    if mode == 'overlap':
+        end = max(event.date_start, event.date_end or event.date_start)
+        return end >= from_date and (until_date is None or event.date_start <= until_date)
+    if event.date_start < from_date:
+        return False
+    if until_date is None:
+        return True
+    if mode == 'starting':
+        return event.date_start <= until_date
+    return event.date_end is not None and event.date_end <= until_date
+
+
+class TopicIndexTest(unittest.TestCase):
+    def setUp(self):
+        # Every combination of start and end around the queried durations: one-day events, long events,
+        # events without end date (NULL), and events that end before they start
+        self.events = []
+        for i, (start, end) in enumerate(itertools.product(range(-12, 12), [None] + list(range(-12, 12)))):
+            self.events.append(Event(id=f'E{i}', name=f'Event {i}', date_start=day(start), date_end=day(end) if end is not None else None, visibility='Kanto'))
+        self.index = TopicIndex()
+        for event in self.events:
+            self.index.add(event)
+
+    def assertSQLResults(self, from_date, until_date, mode):
+        expected = sorted((event for event in self.events if sqlMatches(event, from_date, until_date, mode)), key=lambda event: (event.date_start, event.id))
+        if mode == 'within' and until_date is not None:
+            # Documented deviation: 'within' never returns events that start after `until_date` (they end before they start)
+            expected = [event for event in expected if event.date_start <= until_date]
+        found = self.index.find(from_date, until_date, mode)
+        self.assertEqual([event.id for event in found], [event.id for event in expected], f"{mode} {from_date} - {until_date}")
+
+    def test_modes_match_sql(self):
+        for mode in ('within', 'starting', 'overlap'):
+            for start, length in itertools.product(range(-3, 4), [0, 1, 5, None]):
+                with self.subTest(mode=mode, start=start, length=length):
+                    self.assertSQLResults(day(start), day(start + length) if length is not None else None, mode)
+
+    def test_within_skips_missing_end(self):
+        index = TopicIndex()
+        index.add(Event(id='A', date_start=day(0), date_end=None))
+        index.add(Event(id='B', date_start=day(0), date_end=day(0)))
+        self.assertEqual([event.id for event in index.find(day(0), day(1), 'within')], ['B'])
+        self.assertEqual([event.id for event in index.find(day(0), None, 'within')], ['A', 'B'])
+
+    def test_overlap_looks_back_as_far_as_the_longest_event(self):
+        index = TopicIndex()
+        index.add(Event(id='long', date_start=day(-30), date_end=day(5)))
+        index.add(Event(id='short', date_start=day(-2), date_end=day(-1)))
+        index.add(Event(id='open', date_start=day(-1), date_end=None))  # Lasts one day
+        index.add(Event(id='reversed', date_start=day(-1), date_end=day(-20)))  # End before start is ignored
+        self.assertEqual([event.id for event in index.find(day(0), day(3), 'overlap')], ['long'])
+        self.assertEqual([event.id for event in index.find(day(-1), day(3), 'overlap')], ['long', 'short', 'open', 'reversed'])
+
+    def test_replace_and_remove(self):
+        index = TopicIndex()
+        index.add(Event(id='A', name='old', date_start=day(0), date_end=day(0)))
+        index.add(Event(id='A', name='new', date_start=day(0), date_end=day(0)))
+        self.assertEqual([event.name for event in index.find(day(0))], ['new'])
+        index.remove(Event(id='A', date_start=day(0)))
+        index.remove(Event(id='A', date_start=day(0)))  # Removing twice is fine
+        self.assertEqual(len(index), 0)
+
+
+class EventStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = EventStore()
+        self.store.load([
+            Event(id='K1', date_start=day(1), date_end=day(1), visibility='Kanto'),
+            Event(id='S1', date_start=day(0), date_end=day(2), visibility='Kansai'),
+            Event(id='K0', date_start=day(0), date_end=day(0), visibility='Kanto'),
+            Event(id='old', date_start=day(-5), date_end=day(-1), visibility='Kanto'),  # Ended before `since`: left out
+        ], since=day(0))
+
+    def test_merges_topics_by_start_date(self):
+        self.assertEqual([event.id for event in self.store.getEvents(['Kanto', 'Kansai', 'Tohoku'], day(0), day(5), 'overlap')], ['K0', 'S1', 'K1'])
+        self.assertEqual(len(self.store), 3)
+
+    def test_no_topics(self):
+        # Like DBEvent.getEvents, no topics means every topic; channels without topics get nothing (like the joined queries)
+        self.assertEqual([event.id for event in self.store.getEvents(None, day(0), day(5), 'overlap')], ['K0', 'S1', 'K1'])
+        self.assertEqual(self.store.getEventsByChannel({1: None, 2: []}, day(0), day(5), 'overlap'), {1: [], 2: []})
+        self.assertEqual(self.store.getEventsByTopics({1: None}, day(0), day(5), 'overlap'), {(): ([1], [])})
+
+    def test_covers(self):
+        self.assertTrue(self.store.covers(day(0)))
+        self.assertFalse(self.store.covers(day(-1)))
+        with self.assertRaises(ValueError):
+            self.store.getEvents(['Kanto'], day(-1))
+        with self.assertRaises(ValueError):
+            self.store.getEvents(['Kanto'], day(0), mode='unknown')
+        self.store.clear()
+        self.assertFalse(self.store.covers(day(0)))
+
+    def test_update_moves_changed_events(self):
+        self.store.update([Event(id='K1', date_start=day(1), date_end=day(1), visibility='Kansai')])
+        self.assertEqual([event.id for event in self.store.getEvents(['Kanto'], day(0))], ['K0'])
+        self.assertEqual([event.id for event in self.store.getEvents(['Kansai'], day(0))], ['S1', 'K1'])
+
+    def test_groups_channels_by_topics(self):
+        groups = self.store.getEventsByTopics({1: ['Kanto'], 2: ['Kansai', 'Kanto'], 3: ['Kanto', 'Kansai']}, day(0), day(0), 'starting')
+        self.assertEqual(sorted(groups), [('Kansai', 'Kanto'), ('Kanto',)])
+        channel_ids, events = groups[('Kansai', 'Kanto')]
+        self.assertEqual((channel_ids, [event.id for event in events]), ([2, 3], ['K0', 'S1']))
+
+
+if __name__ == '__main__':
+    unittest.main()
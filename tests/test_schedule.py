@@ -0,0 +1,73 @@
+"""Tests of the per-channel schedule heap
+
+Run with: python -m pytest -q tests
+"""
+
+import datetime
+import unittest
+
+import pytz
+
+from cogs.utils.schedule import FireHeap
+
+
+TZ = pytz.timezone('Asia/Tokyo')
+
+def at(day:int, hour:int, minute:int=0) -> datetime.datetime:
+    return TZ.localize(datetime.datetime(2026, 10, day, hour, minute))
+
+
+class FireHeapTest(unittest.TestCase):
+    def setUp(self):
+        self.heap = FireHeap(timezone=TZ)
+        self.now = at(18, 8)  # Sunday, October 18th 2026
+
+    def test_pops_due_jobs_in_order(self):
+        self.heap.set((1, 'remind'), '0 9 * * *', self.now)
+        self.heap.set((2, 'remind'), '30 8 * * *', self.now)
+        self.heap.set((1, 'post'), '0 20 * * *', self.now)
+        self.assertEqual(self.heap.getNextTime(), at(18, 8, 30))
+        self.assertEqual(self.heap.getDelay(self.now), 30 * 60)
+        self.assertEqual(self.heap.popDue(at(18, 8, 59)), [(2, 'remind')])
+        self.assertEqual(self.heap.popDue(at(18, 9)), [(1, 'remind')])
+        self.assertEqual(self.heap.getNextTime(), at(18, 20))
+        self.assertEqual(self.heap.getNextTime(lambda key: key[1] == 'remind'), at(19, 8, 30))
+
+    def test_missed_fire_times_fire_once(self):
+        self.heap.set(1, '0 * * * *', self.now)
+        self.assertEqual(self.heap.popDue(at(18, 15, 30)), [1])
+        self.assertEqual(self.heap.getNextTime(), at(18, 16))
+
+    def test_changed_and_removed_jobs_skip_old_entries(self):
+        self.heap.set(1, '0 9 * * *', self.now)
+        self.heap.set(1, '0 10 * * *', self.now)
+        self.heap.set(2, '0 9 * * *', self.now)
+        self.heap.remove(2)
+        self.heap.remove(2)  # Removing twice is fine
+        self.assertEqual(self.heap.getNextTime(), at(18, 10))
+        self.assertEqual(self.heap.popDue(at(18, 10)), [1])
+        self.assertEqual(len(self.heap), 1)
+        self.assertEqual(self.heap.getDelay(self.now, maximum=60), 60)
+
+    def test_weekdays_count_from_monday(self):
+        # apscheduler numbering: 0 = Monday, 6 = Sunday; names mean the same as in UNIX cron
+        self.heap.set('number', '0 20 * * 0', self.now)
+        self.heap.set('name', '0 20 * * sun', self.now)
+        self.assertEqual(self.heap.getNextTime(lambda key: key == 'number'), at(19, 20))
+        self.assertEqual(self.heap.getNextTime(lambda key: key == 'name'), at(18, 20))
+
+    def test_caches_only_triggers_of_jobs(self):
+        self.heap.getTrigger('0 12 * * *')
+        self.assertEqual(self.heap.triggers, {})
+        self.heap.set(1, '0 9 * * *', self.now)
+        self.heap.set(2, '0 9 * * *', self.now)
+        self.assertIs(self.heap.jobs[1][1], self.heap.jobs[2][1])  # Shared by jobs with the same times
+        self.heap.set(1, '0 10 * * *', self.now)
+        self.heap.remove(2)
+        self.assertEqual(list(self.heap.triggers), ['0 10 * * *'])
+        with self.assertRaises(ValueError):
+            self.heap.getTrigger('0 25 * * *')
+
+
+if __name__ == '__main__':
+    unittest.main()